@@ -0,0 +1,196 @@
+import json
+import random
+import asyncio
+import logging
+import dropbox
+from concurrent.futures import ThreadPoolExecutor
+from google.auth.transport.requests import Request
+from google.auth.exceptions import RefreshError
+from src.integrity import TransferHasher, IntegrityError, INTEGRITY_RETRIES
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+DROPBOX_DOWNLOAD_URL = 'https://content.dropboxapi.com/2/files/download'
+DRIVE_UPLOAD_URL = 'https://www.googleapis.com/upload/drive/v3/files'
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+# Files above this size are left to the synchronous clients, which stream them through disk.
+DEFAULT_MAX_FILE_SIZE = 32 * 1024 * 1024
+
+class TransferError(Exception):
+    """An HTTP request of the asyncio engine failed with a status that is not retried."""
+    def __init__(self, status, body):
+        super().__init__(f"HTTP {status}: {body}")
+        self.status = status
+
+class AsyncTransferEngine:
+    """
+    Transfers many small files concurrently from one event loop. Each file is downloaded
+    into memory from the Dropbox content endpoint and uploaded to Google Drive with a
+    single multipart request, so thousands of transfers can be in flight without a thread each.
+
+    The engine only moves bytes: conflicts are resolved and state is recorded by the caller,
+    whose callback runs off the event loop so recording a result never holds up the transfers.
+    With `verify_integrity`, the bytes held in memory are checked against the listing's content
+    hash before they are uploaded and against the MD5 Drive reports after, as the synchronous path does.
+    """
+    dropbox_download_url = DROPBOX_DOWNLOAD_URL
+    drive_upload_url = DRIVE_UPLOAD_URL
+
+    def __init__(self, dropbox_token, google_credentials, team_folder_id=None, concurrency=500, max_retries=5, max_file_size=DEFAULT_MAX_FILE_SIZE, verify_integrity=False):
+        if aiohttp is None:
+            raise ImportError("The asyncio transfer engine requires aiohttp. Install it with 'pip install aiohttp'.")
+        self.dropbox_token = dropbox_token
+        self.google_credentials = google_credentials
+        self.team_folder_id = team_folder_id
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.max_file_size = max_file_size
+        self.verify_integrity = verify_integrity
+
+    def run(self, jobs, on_done, read_local=None):
+        """Transfers a batch of jobs, blocking until all of them have finished."""
+        asyncio.run(self.transfer_all(jobs, on_done, read_local))
+
+    async def transfer_all(self, jobs, on_done, read_local=None):
+        """
+        Transfers `(file, plan)` jobs, where `plan` is the (parent folder ID, upload name,
+        ID of the file to replace) tuple of `Migration._prepare_file`. `on_done(file, file_id, error, checksums)`
+        is called as each transfer finishes, one call at a time on a thread of its own, so it may
+        write the state to disk; `checksums` is the verified content hash and MD5, or None without
+        `verify_integrity`. Authentication errors stop the batch.
+        `read_local(file)`, if given, returns the content of a file already on disk, or None to download it.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        self._token_lock = asyncio.Lock()
+        self._read_local = read_local
+        self._callbacks = ThreadPoolExecutor(max_workers=1, thread_name_prefix='transfer-results')
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        try:
+            async with aiohttp.ClientSession(connector=connector) as session:
+                tasks = [asyncio.ensure_future(self._transfer(session, semaphore, file, plan, on_done)) for file, plan in jobs]
+                try:
+                    await asyncio.gather(*tasks)
+                finally:
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self._callbacks.shutdown(wait=True)
+
+    async def _transfer(self, session, semaphore, file, plan, on_done):
+        async with semaphore:
+            try:
+                file_id, checksums = await self._transfer_verified(session, file, plan)
+            except (dropbox.exceptions.AuthError, RefreshError):
+                raise
+            except Exception as e:
+                file_id, checksums, error = None, None, e
+            else:
+                logging.info(f"Successfully transferred {file.path_display} with ID: {file_id}")
+                error = None
+        await asyncio.get_running_loop().run_in_executor(self._callbacks, on_done, file, file_id, error, checksums)
+
+    async def _transfer_verified(self, session, file, plan):
+        """
+        Downloads and uploads a file. With `verify_integrity`, a transfer whose checksums do not
+        match is made again, replacing the content it uploaded, up to INTEGRITY_RETRIES times.
+        Returns the file ID and the checksums, or None for them without `verify_integrity`.
+        """
+        parent_folder_id, upload_name, replace_file_id = plan
+        loop = asyncio.get_running_loop()
+        for attempt in range(INTEGRITY_RETRIES):
+            content = None
+            if self._read_local is not None:
+                content = await loop.run_in_executor(None, self._read_local, file)
+            if content is None:
+                content = await self._download(session, file.path_display)
+            if not self.verify_integrity:
+                return await self._upload(session, content, upload_name, parent_folder_id, replace_file_id), None
+            hasher = TransferHasher()
+            # Hashing a large file would hold up the event loop; hashlib releases the GIL while it works.
+            await loop.run_in_executor(None, hasher.update, content)
+            try:
+                hasher.check_download(file)
+                file_id, drive_md5 = await self._upload(session, content, upload_name, parent_folder_id, replace_file_id, with_md5=True)
+                hasher.check_upload(file, file_id, drive_md5)
+                return file_id, {'content_hash': hasher.content_hash(), 'md5': drive_md5}
+            except IntegrityError as e:
+                if attempt == INTEGRITY_RETRIES - 1:
+                    raise e
+                logging.warning(f"{e} Transferring it again.")
+                if e.file_id:
+                    replace_file_id = e.file_id
+
+    async def _download(self, session, dropbox_path):
+        headers = {
+            'Authorization': f"Bearer {self.dropbox_token}",
+            'Dropbox-API-Arg': json.dumps({'path': dropbox_path}),
+        }
+        if self.team_folder_id:
+            headers['Dropbox-API-Path-Root'] = json.dumps({'.tag': 'namespace_id', 'namespace_id': self.team_folder_id})
+        status, body = await self._request(session, 'POST', self.dropbox_download_url, lambda: headers)
+        if status == 401:
+            raise dropbox.exceptions.AuthError(None, body.decode(errors='replace'))
+        if status != 200:
+            raise TransferError(status, body.decode(errors='replace'))
+        return body
+
+    async def _upload(self, session, content, name, parent_id=None, replace_file_id=None, with_md5=False):
+        """Uploads content to Drive and returns the file's ID, and with `with_md5` the MD5 checksum Drive computed for it."""
+        fields = 'id,md5Checksum' if with_md5 else 'id'
+        if replace_file_id:
+            url = f"{self.drive_upload_url}/{replace_file_id}?uploadType=media&fields={fields}"
+            method = 'PATCH'
+            make_body = lambda: content
+        else:
+            url = f"{self.drive_upload_url}?uploadType=multipart&fields={fields}"
+            method = 'POST'
+            metadata = {'name': name}
+            if parent_id:
+                metadata['parents'] = [parent_id]
+
+            def make_body():
+                writer = aiohttp.MultipartWriter('related')
+                writer.append_json(metadata)
+                writer.append(content, {'Content-Type': 'application/octet-stream'})
+                return writer
+
+        for refreshed in (False, True):
+            token = await self._google_token(force_refresh=refreshed)
+            status, body = await self._request(session, method, url, lambda: {'Authorization': f"Bearer {token}"}, make_body)
+            if status != 401:
+                break
+        if status != 200:
+            raise TransferError(status, body.decode(errors='replace'))
+        result = json.loads(body)
+        return (result['id'], result.get('md5Checksum')) if with_md5 else result['id']
+
+    async def _google_token(self, force_refresh=False):
+        """Returns a valid Google access token, refreshing the credentials off the event loop."""
+        async with self._token_lock:
+            if force_refresh or not self.google_credentials.valid:
+                await asyncio.get_running_loop().run_in_executor(None, self.google_credentials.refresh, Request())
+            return self.google_credentials.token
+
+    async def _request(self, session, method, url, make_headers, make_body=None):
+        """Sends a request, retrying rate limits, server errors and connection errors with exponential backoff."""
+        delay = 1
+        for attempt in range(self.max_retries):
+            try:
+                async with session.request(method, url, headers=make_headers(), data=make_body() if make_body else None) as response:
+                    body = await response.read()
+                    if response.status not in RETRYABLE_STATUSES or attempt == self.max_retries - 1:
+                        return response.status, body
+                    retry_after = response.headers.get('Retry-After')
+                    wait = float(retry_after) if retry_after and retry_after.isdigit() else delay
+                    logging.warning(f"Request to {url} returned {response.status}. Retrying in {wait:.2f} seconds...")
+            except aiohttp.ClientError as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                wait = delay
+                logging.warning(f"Request to {url} failed with {e}. Retrying in {wait:.2f} seconds...")
+            await asyncio.sleep(wait)
+            delay = delay * 2 + random.uniform(0, 1)
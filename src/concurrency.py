@@ -0,0 +1,97 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+class AIMDLimiter:
+    """
+    Limits the concurrent requests to one service, adapting the limit with additive increase
+    and multiplicative decrease (AIMD), like TCP congestion control.
+
+    Every request that took the last free slot and succeeds within `latency_tolerance` times the
+    average latency so far raises the limit by about one per limit's worth of requests; while the
+    limit is not what holds requests back, it stays where it is. A request failing with an error
+    `is_throttle` recognizes, such as a 429, cuts the limit by `decrease`. The many requests
+    that were in flight when the service started throttling only cut it once per `cooldown`
+    seconds. Every change of the whole-number limit is logged.
+    """
+    def __init__(self, name, maximum, initial=None, minimum=1, decrease=0.5, is_throttle=None, latency_tolerance=2.0, cooldown=1.0):
+        self.name = name
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(initial if initial is not None else max(minimum, maximum // 4))
+        self.decrease = decrease
+        self.is_throttle = is_throttle or (lambda e: False)
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._average_latency = None
+        self._last_cut = 0
+        self._condition = threading.Condition()
+        self._local = threading.local()
+
+    @contextmanager
+    def slot(self):
+        """
+        Holds one of the limiter's slots while a request runs, waiting for one to free up first,
+        and feeds the outcome back into the limit. A thread that already holds a slot, in a request
+        made from within another one, does not take a second one.
+        """
+        if getattr(self._local, 'held', False):
+            yield
+            return
+        window_full = self._acquire()
+        self._local.held = True
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            if self.is_throttle(e):
+                self.on_throttle()
+            raise
+        else:
+            self.on_success(time.monotonic() - start, window_full)
+        finally:
+            self._local.held = False
+            self._release()
+
+    def _acquire(self):
+        """Takes a slot and returns whether it was the last free one."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            return self.in_flight >= int(self.limit)
+
+    def _release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self, latency, window_full=True):
+        """
+        Raises the limit additively if the request was about as fast as usual and, as
+        `window_full` tells, every slot was taken when it started.
+        """
+        with self._condition:
+            healthy = self._average_latency is None or latency <= self._average_latency * self.latency_tolerance
+            self._average_latency = latency if self._average_latency is None else 0.9 * self._average_latency + 0.1 * latency
+            if healthy and window_full and self.limit < self.maximum:
+                self._set_limit(min(self.maximum, self.limit + 1 / self.limit))
+
+    def on_throttle(self):
+        """Cuts the limit multiplicatively, at most once per cooldown."""
+        with self._condition:
+            now = time.monotonic()
+            if now - self._last_cut < self.cooldown:
+                return
+            self._last_cut = now
+            self._set_limit(max(self.minimum, self.limit * self.decrease))
+
+    def _set_limit(self, limit):
+        previous = int(self.limit)
+        self.limit = limit
+        if int(limit) > previous:
+            logging.info(f"{self.name} concurrency limit raised to {int(limit)}")
+            self._condition.notify_all()
+        elif int(limit) < previous:
+            logging.warning(f"{self.name} is throttling requests. Concurrency limit cut to {int(limit)}")
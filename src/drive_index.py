@@ -0,0 +1,110 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_FOLDERS = 1000
+
+class DriveChildrenIndex:
+    """
+    Keeps the children of Google Drive folders in memory, so checking whether a name is taken
+    does not cost a search request per file. A folder's children are listed once, the first
+    time a name in it is looked up, and kept up to date as files are created in it or trashed.
+    Only the `max_folders` most recently used folders are kept.
+
+    Lookups return the same list of `{'id': ..., 'name': ...}` dictionaries as
+    `GoogleDriveClient.find_file`. Names reserved for renamed files that are still being
+    uploaded are kept apart from the children, and a folder is not evicted while it has any.
+    """
+    def __init__(self, drive_client, max_folders=DEFAULT_MAX_FOLDERS):
+        self.drive_client = drive_client
+        self.max_folders = max_folders
+        # Parent folder ID -> {name -> children with that name}, least recently used first.
+        self._folders = OrderedDict()
+        # Parent folder ID -> {original name -> the suffix to try next when renaming it}.
+        self._next_suffixes = {}
+        # Parent folder ID -> names reserved for files not uploaded yet.
+        self._reserved = {}
+        self._lock = threading.RLock()
+
+    def find(self, name, parent_id=None):
+        """Returns the children of a folder with the given name."""
+        with self._lock:
+            return list(self._children(parent_id).get(name, []))
+
+    def names(self, parent_id=None):
+        """Returns the set of names taken in a folder."""
+        with self._lock:
+            return set(self._children(parent_id))
+
+    def add(self, parent_id, child):
+        """
+        Records a file or folder created in a folder, if that folder is indexed, and ends the
+        reservation made for its name, if any.
+        """
+        with self._lock:
+            self.release(parent_id, child['name'])
+            children = self._folders.get(parent_id)
+            if children is not None:
+                same_name = [c for c in children.get(child['name'], []) if c['id'] != child['id']]
+                children[child['name']] = same_name + [child]
+
+    def reserve_unique_name(self, original_name, parent_id=None):
+        """
+        Returns the first `name (n).ext` not taken in a folder and reserves it, so no other file
+        is given the same name before this one is uploaded. Searches for the same original name
+        continue from the last suffix handed out, and need no requests once the folder is listed.
+        """
+        name, ext = os.path.splitext(original_name)
+        with self._lock:
+            children = self._children(parent_id)
+            next_suffixes = self._next_suffixes.setdefault(parent_id, {})
+            reserved = self._reserved.setdefault(parent_id, set())
+            counter = next_suffixes.get(original_name, 1)
+            new_name = f"{name} ({counter}){ext}"
+            while new_name in children or new_name in reserved:
+                counter += 1
+                new_name = f"{name} ({counter}){ext}"
+            reserved.add(new_name)
+            next_suffixes[original_name] = counter + 1
+            return new_name
+
+    def release(self, parent_id, name):
+        """Ends the reservation of a name, once its file was uploaded or failed to be."""
+        with self._lock:
+            reserved = self._reserved.get(parent_id)
+            if reserved is not None:
+                reserved.discard(name)
+                if not reserved:
+                    del self._reserved[parent_id]
+
+    def remove(self, parent_id, child_id):
+        """Forgets a file or folder that was trashed, if its folder is indexed."""
+        with self._lock:
+            children = self._folders.get(parent_id)
+            if children is None:
+                return
+            for name, same_name in list(children.items()):
+                remaining = [child for child in same_name if child['id'] != child_id]
+                if remaining:
+                    children[name] = remaining
+                else:
+                    del children[name]
+
+    def _children(self, parent_id):
+        children = self._folders.get(parent_id)
+        if children is not None:
+            self._folders.move_to_end(parent_id)
+            return children
+        children = {}
+        for child in self.drive_client.list_children(parent_id):
+            children.setdefault(child['name'], []).append(child)
+        self._folders[parent_id] = children
+        if len(self._folders) > self.max_folders:
+            # Folders with reservations are kept, as listing them again would not show the files being uploaded.
+            evictable = [folder for folder in self._folders if folder not in self._reserved and folder != parent_id]
+            for evicted in evictable[:len(self._folders) - self.max_folders]:
+                del self._folders[evicted]
+                self._next_suffixes.pop(evicted, None)
+                logging.debug(f"Evicted the children of folder {evicted} from the Drive index")
+        return children
@@ -1,12 +1,46 @@
+import json
 import dropbox
 import logging
+import requests
+import queue
+import threading
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
 from src.retry import retry_on_exception
 from dropbox.common import PathRoot
+from dropbox.stone_serializers import json_decode
+
+CONTENT_DOWNLOAD_URL = 'https://content.dropboxapi.com/2/files/download'
+# Size of the pieces of a ranged download, and the suffix of the file recording which are done.
+RANGE_SIZE = 32 * 1024 * 1024
+RANGES_SUFFIX = '.ranges'
+DOWNLOAD_BLOCK_SIZE = 1024 * 1024
+
+class RangeIgnoredError(Exception):
+    """Dropbox answered a request for the rest of a file with something other than that part of it."""
+
+def is_throttling_error(e):
+    """Whether Dropbox asked to slow down: a rate limit or a 503."""
+    if isinstance(e, dropbox.exceptions.RateLimitError):
+        return True
+    return isinstance(e, dropbox.exceptions.InternalServerError) and e.status_code == 503
+
+def is_cursor_reset_error(e):
+    """Whether Dropbox refused to continue a listing because its cursor expired or was reset."""
+    return (isinstance(e, dropbox.exceptions.ApiError)
+            and isinstance(e.error, dropbox.files.ListFolderContinueError)
+            and e.error.is_reset())
 
 class DropboxClient:
     def __init__(self, access_token):
+        self.access_token = access_token
         self.dbx = dropbox.Dropbox(access_token)
         self.dbx_team = dropbox.DropboxTeam(access_token)
+        self._rate_limited_until = 0
+        self._rate_limit_lock = threading.Lock()
+        # An AIMDLimiter shared by the threads using this client, if concurrency is adaptive.
+        self.limiter = None
 
     @retry_on_exception((dropbox.exceptions.RateLimitError, dropbox.exceptions.ApiError))
     def list_team_folders(self):
@@ -49,17 +83,322 @@ class DropboxClient:
             # Reraise the exception to be caught by the decorator
             raise err
 
+    @retry_on_exception((dropbox.exceptions.RateLimitError, dropbox.exceptions.ApiError), should_retry=lambda e: not is_cursor_reset_error(e))
+    def _list_folder_page(self, dbx_instance, path, recursive=False, cursor=None):
+        """
+        Fetches a single page of a folder listing, either the first one or the one after `cursor`.
+        """
+        self._wait_for_rate_limit()
+        try:
+            if cursor:
+                return dbx_instance.files_list_folder_continue(cursor)
+            return dbx_instance.files_list_folder(path, recursive=recursive)
+        except dropbox.exceptions.RateLimitError as err:
+            self._note_rate_limit(err)
+            raise err
+        except dropbox.exceptions.ApiError as err:
+            logging.error(f"Failed to list folder: {err}")
+            raise err
+
+    def _note_rate_limit(self, err):
+        """
+        Makes every thread sharing this client hold off for the backoff Dropbox asked for.
+        """
+        with self._rate_limit_lock:
+            self._rate_limited_until = max(self._rate_limited_until, time.monotonic() + (err.backoff or 1))
+
+    def _wait_for_rate_limit(self):
+        delay = self._rate_limited_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def iter_list_folder_pages(self, path='', recursive=False, team_folder_id=None, cursor=None):
+        """
+        Yields the listing of a Dropbox path one page at a time, as soon as each page arrives.
+        Every page is a `ListFolderResult` with `entries`, `cursor` and `has_more`.
+        When `cursor` is given the listing continues from there instead of starting over.
+        """
+        dbx_instance = self._get_dbx_instance(team_folder_id)
+        result = self._list_folder_page(dbx_instance, path, recursive=recursive, cursor=cursor)
+        yield result
+        while result.has_more:
+            result = self._list_folder_page(dbx_instance, path, cursor=result.cursor)
+            yield result
+
+    @retry_on_exception((dropbox.exceptions.RateLimitError, dropbox.exceptions.ApiError))
+    def get_latest_cursor(self, path='', team_folder_id=None):
+        """
+        Returns a cursor for the current state of a recursive listing of a Dropbox path,
+        from which `iter_list_folder_pages` later returns only what changed.
+        """
+        dbx_instance = self._get_dbx_instance(team_folder_id)
+        try:
+            return dbx_instance.files_list_folder_get_latest_cursor(path, recursive=True).cursor
+        except dropbox.exceptions.ApiError as err:
+            logging.error(f"Failed to get listing cursor: {err}")
+            raise err
+
+    def iter_list_folder_pages_parallel(self, path='', team_folder_id=None, max_workers=4):
+        """
+        Yields the recursive listing of a Dropbox path as lists of entries, listing
+        independent subtrees concurrently. The top level is listed first without
+        recursion, then every top-level folder is listed recursively on a thread pool
+        and its pages are yielded as they arrive.
+        """
+        top_level = []
+        for result in self.iter_list_folder_pages(path, recursive=False, team_folder_id=team_folder_id):
+            top_level.extend(result.entries)
+            yield result.entries
+
+        subtrees = [entry.path_display for entry in top_level if isinstance(entry, dropbox.files.FolderMetadata)]
+        if not subtrees:
+            return
+
+        pages = queue.Queue(maxsize=max_workers * 2)
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def list_subtree(subtree_path):
+            try:
+                for result in self.iter_list_folder_pages(subtree_path, recursive=True, team_folder_id=team_folder_id):
+                    if stop.is_set():
+                        return
+                    put(result.entries)
+            except Exception as e:
+                put(e)
+            finally:
+                put(done)
+
+        logging.info(f"Listing {len(subtrees)} subtrees of '{path or '/'}' with {max_workers} workers")
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            for subtree_path in subtrees:
+                executor.submit(list_subtree, subtree_path)
+            remaining = len(subtrees)
+            while remaining:
+                page = pages.get()
+                if page is done:
+                    remaining -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield page
+        finally:
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+
     @retry_on_exception((dropbox.exceptions.RateLimitError, dropbox.exceptions.ApiError))
-    def download_file(self, dropbox_path, local_path, team_folder_id=None):
+    def download_file(self, dropbox_path, local_path, team_folder_id=None, hasher=None):
         """
         Downloads a file from Dropbox.
+        With `hasher`, every block written is also passed to its `update` method; the hasher is
+        reset first, so a retried download is hashed from its start.
         """
         dbx_instance = self._get_dbx_instance(team_folder_id)
         try:
-            dbx_instance.files_download_to_file(local_path, dropbox_path)
+            if hasher is None:
+                dbx_instance.files_download_to_file(local_path, dropbox_path)
+            else:
+                hasher.reset()
+                _, response = dbx_instance.files_download(dropbox_path)
+                try:
+                    with open(local_path, 'wb') as f:
+                        for block in response.iter_content(DOWNLOAD_BLOCK_SIZE):
+                            hasher.update(block)
+                            f.write(block)
+                finally:
+                    response.close()
             logging.info(f"Successfully downloaded {dropbox_path} to {local_path}")
             return True
         except dropbox.exceptions.ApiError as err:
             logging.error(f"Failed to download file: {err}")
             # Reraise the exception to be caught by the decorator
             raise err
+
+    @retry_on_exception((dropbox.exceptions.RateLimitError, dropbox.exceptions.InternalServerError))
+    def download_zip(self, dropbox_path, local_path, team_folder_id=None):
+        """
+        Downloads a folder from Dropbox as a zip archive. API errors, such as a folder too large
+        to zip, are not retried.
+        """
+        dbx_instance = self._get_dbx_instance(team_folder_id)
+        try:
+            dbx_instance.files_download_zip_to_file(local_path, dropbox_path)
+            logging.info(f"Successfully downloaded {dropbox_path} as a zip archive to {local_path}")
+            return True
+        except dropbox.exceptions.ApiError as err:
+            logging.error(f"Failed to download folder as a zip archive: {err}")
+            raise err
+
+    @retry_on_exception((dropbox.exceptions.RateLimitError, dropbox.exceptions.ApiError))
+    def open_download(self, dropbox_path, team_folder_id=None, offset=0):
+        """
+        Starts downloading a file from Dropbox without saving it, from byte `offset` on.
+        Returns the file's metadata and the HTTP response, whose body is read as it arrives;
+        the caller must close it.
+        """
+        if offset:
+            return self._open_range(dropbox_path, offset, team_folder_id)
+        dbx_instance = self._get_dbx_instance(team_folder_id)
+        try:
+            metadata, response = dbx_instance.files_download(dropbox_path)
+            logging.info(f"Started streaming download of {dropbox_path}")
+            return metadata, response
+        except dropbox.exceptions.ApiError as err:
+            logging.error(f"Failed to download file: {err}")
+            # Reraise the exception to be caught by the decorator
+            raise err
+
+    def _open_range(self, dropbox_path, offset, team_folder_id=None, end=None):
+        """
+        Requests the bytes of a file from `offset` up to and including `end`, or to the end of the file.
+        The SDK cannot send a Range header, so the content endpoint is called directly and its
+        errors are mapped to the SDK's exceptions. Raises RangeIgnoredError if a request from a
+        later offset is not answered with a partial response.
+        """
+        self._wait_for_rate_limit()
+        headers = {
+            'Authorization': f"Bearer {self.access_token}",
+            'Dropbox-API-Arg': json.dumps({'path': dropbox_path}),
+            'Range': f"bytes={offset}-{'' if end is None else end}",
+        }
+        if team_folder_id:
+            headers['Dropbox-API-Path-Root'] = json.dumps({'.tag': 'namespace_id', 'namespace_id': team_folder_id})
+        response = requests.post(CONTENT_DOWNLOAD_URL, headers=headers, stream=True, timeout=100)
+        request_id = response.headers.get('X-Dropbox-Request-Id')
+        if offset and response.status_code == 200:
+            # The whole file came back; writing it at `offset` would corrupt the copy.
+            response.close()
+            raise RangeIgnoredError(f"Dropbox returned all of {dropbox_path} when asked for it from byte {offset}.")
+        if response.status_code in (200, 206):
+            metadata = json_decode(dropbox.files.download.result_type, response.headers['Dropbox-API-Result'], strict=False)
+            logging.info(f"Started streaming download of {dropbox_path} from byte {offset}")
+            return metadata, response
+        body = response.text
+        response.close()
+        if response.status_code == 401:
+            raise dropbox.exceptions.AuthError(request_id, body)
+        if response.status_code == 429:
+            err = dropbox.exceptions.RateLimitError(request_id, backoff=float(response.headers.get('Retry-After', 1)))
+            self._note_rate_limit(err)
+            raise err
+        if response.status_code == 409:
+            logging.error(f"Failed to download file: {body}")
+            raise dropbox.exceptions.ApiError(request_id, body, None, None)
+        raise dropbox.exceptions.InternalServerError(request_id, response.status_code, body)
+
+    @retry_on_exception((dropbox.exceptions.RateLimitError, dropbox.exceptions.ApiError))
+    def download_bytes(self, dropbox_path, team_folder_id=None):
+        """
+        Downloads a file from Dropbox into memory and returns its content.
+        """
+        dbx_instance = self._get_dbx_instance(team_folder_id)
+        try:
+            _, response = dbx_instance.files_download(dropbox_path)
+            try:
+                content = response.content
+            finally:
+                response.close()
+            logging.info(f"Successfully downloaded {dropbox_path} into memory")
+            return content
+        except dropbox.exceptions.ApiError as err:
+            logging.error(f"Failed to download file: {err}")
+            # Reraise the exception to be caught by the decorator
+            raise err
+
+    def download_file_ranged(self, dropbox_path, local_path, team_folder_id=None, max_workers=4, range_size=RANGE_SIZE):
+        """
+        Downloads a large file as byte ranges fetched concurrently into a preallocated local file.
+
+        Finished ranges are recorded in a `.ranges` file next to it, so a download that is
+        interrupted only fetches the missing ranges the next time, as long as the file is
+        still at the same revision. All ranges are read from that one revision.
+        """
+        metadata = self._get_metadata(self._get_dbx_instance(team_folder_id), dropbox_path)
+        ranges_path = local_path + RANGES_SUFFIX
+        header = {'size': metadata.size, 'rev': metadata.rev, 'range_size': range_size}
+        done = self._load_finished_ranges(local_path, ranges_path, header)
+        if done is None:
+            with open(local_path, 'wb') as f:
+                f.truncate(metadata.size)
+            with open(ranges_path, 'w') as f:
+                f.write(json.dumps(header) + '\n')
+            done = set()
+        else:
+            logging.info(f"Resuming download of {dropbox_path}: {len(done)} ranges already downloaded")
+
+        pending = [start for start in range(0, metadata.size, range_size) if start not in done]
+        lock = threading.Lock()
+        with open(ranges_path, 'a') as ranges_file, ThreadPoolExecutor(max_workers=max_workers) as executor:
+            def fetch(start):
+                end = min(start + range_size, metadata.size) - 1
+                self._download_range(f"rev:{metadata.rev}", local_path, start, end, team_folder_id)
+                with lock:
+                    ranges_file.write(f"{start}\n")
+                    ranges_file.flush()
+
+            futures = [executor.submit(fetch, start) for start in pending]
+            finished, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in finished:
+                if future.exception() is not None:
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    logging.error(f"Failed to download {dropbox_path}: {future.exception()}")
+                    raise future.exception()
+        os.remove(ranges_path)
+        logging.info(f"Successfully downloaded {dropbox_path} to {local_path} in {len(pending)} ranges")
+        return True
+
+    @retry_on_exception((dropbox.exceptions.RateLimitError, dropbox.exceptions.ApiError))
+    def _get_metadata(self, dbx_instance, dropbox_path):
+        """
+        Fetches the metadata of a file or folder.
+        """
+        self._wait_for_rate_limit()
+        try:
+            return dbx_instance.files_get_metadata(dropbox_path)
+        except dropbox.exceptions.RateLimitError as err:
+            self._note_rate_limit(err)
+            raise err
+        except dropbox.exceptions.ApiError as err:
+            logging.error(f"Failed to get metadata: {err}")
+            raise err
+
+    def _load_finished_ranges(self, local_path, ranges_path, header):
+        """Returns the starts of the ranges an earlier download finished, or None if it cannot be resumed."""
+        if not os.path.exists(ranges_path) or not os.path.exists(local_path) or os.path.getsize(local_path) != header['size']:
+            return None
+        with open(ranges_path, 'r') as f:
+            lines = f.read().split('\n')
+        try:
+            if json.loads(lines[0]) != header:
+                return None
+            # The last line may have been cut off by the interruption.
+            return {int(line) for line in lines[1:-1]}
+        except ValueError:
+            return None
+
+    @retry_on_exception((dropbox.exceptions.RateLimitError, dropbox.exceptions.InternalServerError, requests.exceptions.RequestException, IOError))
+    def _download_range(self, dropbox_path, local_path, start, end, team_folder_id=None):
+        """Downloads one byte range of a file into its place in `local_path`."""
+        _, response = self._open_range(dropbox_path, start, team_folder_id, end=end)
+        try:
+            with open(local_path, 'r+b') as f:
+                f.seek(start)
+                received = 0
+                for block in response.iter_content(1024 * 1024):
+                    f.write(block)
+                    received += len(block)
+                if received != end - start + 1:
+                    raise IOError(f"Expected {end - start + 1} bytes from offset {start}, got {received}")
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            response.close()
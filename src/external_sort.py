@@ -0,0 +1,105 @@
+import os
+import json
+import heapq
+import logging
+import tempfile
+from src.listing import ListingEntry
+
+# Rough in-memory size of a ListingEntry apart from its path and name strings.
+ENTRY_OVERHEAD = 200
+# Runs merged at once; more runs are first merged into larger runs.
+MAX_MERGE_RUNS = 64
+
+def depth_key(entry):
+    """Orders entries so parents come before their children: by depth, then by path."""
+    return (entry.path_display.count('/'), entry.path_display)
+
+class ExternalSorter:
+    """
+    Sorts listing entries that may not fit in memory. Entries are buffered until their
+    estimated size reaches `memory_budget` bytes, then sorted and spilled to a run file
+    on disk. Iterating the sorter merges the runs, holding one entry per run in memory.
+    """
+    def __init__(self, memory_budget, key=depth_key, directory=None):
+        self.memory_budget = memory_budget
+        self.key = key
+        self.directory = directory
+        self.tmpdir = None
+        self.buffer = []
+        self.buffer_size = 0
+        self.runs = []
+        self.count = 0
+
+    def add(self, entry):
+        self.buffer.append(entry)
+        self.buffer_size += len(entry.path_display) + len(entry.name) + ENTRY_OVERHEAD
+        self.count += 1
+        if self.buffer_size >= self.memory_budget:
+            self._spill()
+
+    def extend(self, entries):
+        for entry in entries:
+            self.add(entry)
+
+    def __len__(self):
+        return self.count
+
+    def _new_run_path(self):
+        if self.tmpdir is None:
+            self.tmpdir = tempfile.TemporaryDirectory(prefix='listing_sort_', dir=self.directory)
+        return os.path.join(self.tmpdir.name, f"run_{len(self.runs)}_{id(self)}_{self.count}.jsonl")
+
+    def _write_run(self, entries):
+        path = self._new_run_path()
+        with open(path, 'w') as f:
+            for entry in entries:
+                f.write(json.dumps(entry.to_row()) + '\n')
+        return path
+
+    def _spill(self):
+        """Sorts the buffered entries and writes them to a new run file."""
+        if not self.buffer:
+            return
+        self.buffer.sort(key=self.key)
+        self.runs.append(self._write_run(self.buffer))
+        logging.debug(f"Spilled {len(self.buffer)} listing entries to run {len(self.runs)}")
+        self.buffer = []
+        self.buffer_size = 0
+
+    def _read_run(self, path):
+        with open(path, 'r') as f:
+            for line in f:
+                yield ListingEntry.from_row(json.loads(line))
+
+    def _reduce_runs(self):
+        """Merges runs into larger ones until a single merge opens at most MAX_MERGE_RUNS files."""
+        while len(self.runs) > MAX_MERGE_RUNS:
+            batch, self.runs = self.runs[:MAX_MERGE_RUNS], self.runs[MAX_MERGE_RUNS:]
+            merged = self._write_run(heapq.merge(*(self._read_run(path) for path in batch), key=self.key))
+            for path in batch:
+                os.remove(path)
+            self.runs.append(merged)
+
+    def __iter__(self):
+        """Yields all added entries in sorted order."""
+        if not self.runs:
+            self.buffer.sort(key=self.key)
+            yield from self.buffer
+            return
+        self._spill()
+        self._reduce_runs()
+        yield from heapq.merge(*(self._read_run(path) for path in self.runs), key=self.key)
+
+    def close(self):
+        """Removes the run files."""
+        self.buffer = []
+        self.runs = []
+        if self.tmpdir is not None:
+            self.tmpdir.cleanup()
+            self.tmpdir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
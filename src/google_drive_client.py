@@ -1,17 +1,42 @@
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
 from googleapiclient.errors import HttpError
+import io
+import contextlib
+import json
+import time
 import logging
 from src.retry import retry_on_exception
 
+# The most requests the Drive batch endpoint accepts in one batch.
+BATCH_SIZE = 100
+# The most files the Drive API returns per page of a listing.
+LIST_PAGE_SIZE = 1000
+
 def is_retryable_error(e):
     if isinstance(e, HttpError):
         return e.resp.status in [429, 500, 502, 503, 504]
     return False
 
+def _fields(with_md5):
+    return 'id, md5Checksum' if with_md5 else 'id'
+
+def _result(file, with_md5):
+    return (file.get('id'), file.get('md5Checksum')) if with_md5 else file.get('id')
+
+def is_throttling_error(e):
+    """Whether Google Drive asked to slow down: a 429 or a 503."""
+    return isinstance(e, HttpError) and e.resp.status in [429, 503]
+
 class GoogleDriveClient:
     def __init__(self, credentials):
         self.service = build('drive', 'v3', credentials=credentials)
+        # An AIMDLimiter shared with the clients of other threads, if concurrency is adaptive.
+        self.limiter = None
+
+    def _slot(self):
+        """Holds a slot of the limiter, if any, around a request the retry decorator does not wrap."""
+        return self.limiter.slot() if self.limiter is not None else contextlib.nullcontext()
 
     @retry_on_exception(HttpError, should_retry=is_retryable_error)
     def create_folder(self, name, parent_id=None):
@@ -33,11 +58,8 @@ class GoogleDriveClient:
             logging.error(f"An error occurred while creating folder '{name}': {e}")
             raise e
 
-    @retry_on_exception(HttpError, should_retry=is_retryable_error)
-    def find_file(self, name, parent_id=None):
-        """
-        Finds a file or folder by name in a specific parent folder.
-        """
+    def _name_query(self, name, parent_id=None):
+        """Builds the query for a file or folder by name in a specific parent folder."""
         # Escape backslashes and double quotes in the file name
         name = name.replace('', '').replace('"', '"')
         query = f'name = "{name}"'
@@ -45,18 +67,25 @@ class GoogleDriveClient:
             query += f" and '{parent_id}' in parents"
         else:
             query += " and 'root' in parents"
-        
+        return query
+
+    @retry_on_exception(HttpError, should_retry=is_retryable_error)
+    def find_file(self, name, parent_id=None):
+        """
+        Finds a file or folder by name in a specific parent folder.
+        """
         try:
-            response = self.service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
+            response = self.service.files().list(q=self._name_query(name, parent_id), spaces='drive', fields='files(id, name)').execute()
             return response.get('files', [])
         except HttpError as e:
             logging.error(f"An error occurred while searching for file '{name}': {e}")
             raise e
 
     @retry_on_exception(HttpError, should_retry=is_retryable_error)
-    def upload_file(self, local_path, file_name, folder_id=None):
+    def upload_file(self, local_path, file_name, folder_id=None, with_md5=False):
         """
         Uploads a file to Google Drive.
+        With `with_md5`, returns the file's ID and the MD5 checksum Drive computed for it.
         """
         file_metadata = {'name': file_name}
         if folder_id:
@@ -68,14 +97,244 @@ class GoogleDriveClient:
             file = self.service.files().create(
                 body=file_metadata,
                 media_body=media,
-                fields='id'
+                fields=_fields(with_md5)
             ).execute()
             logging.info(f"Successfully uploaded {file_name} with ID: {file.get('id')}")
-            return file.get('id')
+            return _result(file, with_md5)
         except HttpError as e:
             logging.error(f"An error occurred while uploading file '{file_name}': {e}")
             raise e
 
+    @retry_on_exception(HttpError, should_retry=is_retryable_error)
+    def upload_bytes(self, content, file_name, folder_id=None, replace_file_id=None, with_md5=False):
+        """
+        Uploads a small file held in memory with a single multipart request,
+        replacing the content of `replace_file_id` if given.
+        With `with_md5`, returns the file's ID and the MD5 checksum Drive computed for it.
+        """
+        media = MediaIoBaseUpload(io.BytesIO(content), mimetype='application/octet-stream', resumable=False)
+
+        try:
+            if replace_file_id:
+                file = self.service.files().update(fileId=replace_file_id, media_body=media, fields=_fields(with_md5)).execute()
+            else:
+                file_metadata = {'name': file_name}
+                if folder_id:
+                    file_metadata['parents'] = [folder_id]
+                file = self.service.files().create(body=file_metadata, media_body=media, fields=_fields(with_md5)).execute()
+            logging.info(f"Successfully uploaded {file_name} with ID: {file.get('id')}")
+            return _result(file, with_md5)
+        except HttpError as e:
+            logging.error(f"An error occurred while uploading file '{file_name}': {e}")
+            raise e
+
+    @retry_on_exception(HttpError, should_retry=is_retryable_error)
+    def update_file(self, file_id, local_path, with_md5=False):
+        """
+        Replaces the content of an existing file in Google Drive, keeping its ID.
+        With `with_md5`, returns the file's ID and the MD5 checksum Drive computed for it.
+        """
+        media = MediaFileUpload(local_path, resumable=True)
+
+        try:
+            file = self.service.files().update(
+                fileId=file_id,
+                media_body=media,
+                fields=_fields(with_md5)
+            ).execute()
+            logging.info(f"Successfully updated file with ID: {file.get('id')}")
+            return _result(file, with_md5)
+        except HttpError as e:
+            logging.error(f"An error occurred while updating file '{file_id}': {e}")
+            raise e
+
+    def upload_media(self, media, file_name, folder_id=None, replace_file_id=None, max_chunk_retries=5, session_uri=None, offset=0, on_progress=None, with_md5=False):
+        """
+        Uploads a resumable media object chunk by chunk, replacing the content of `replace_file_id`
+        if given. A chunk that still fails after the client's own retries is sent again on the same
+        upload session, so the upload is never restarted from the beginning.
+
+        `session_uri` and `offset` continue an upload session started earlier, and `on_progress`
+        is called with the session URI and the confirmed offset after every chunk.
+        With `with_md5`, returns the file's ID and the MD5 checksum Drive computed for it.
+        """
+        if replace_file_id:
+            request = self.service.files().update(fileId=replace_file_id, media_body=media, fields=_fields(with_md5))
+        else:
+            file_metadata = {'name': file_name}
+            if folder_id:
+                file_metadata['parents'] = [folder_id]
+            request = self.service.files().create(body=file_metadata, media_body=media, fields=_fields(with_md5))
+        if session_uri:
+            request.resumable_uri = session_uri
+            request.resumable_progress = offset
+            logging.info(f"Resuming upload of '{file_name}' at byte {offset}")
+
+        response = None
+        failures = 0
+        delay = 1
+        while response is None:
+            try:
+                with self._slot():
+                    _, response = request.next_chunk(num_retries=5)
+                failures = 0
+                delay = 1
+            except HttpError as e:
+                failures += 1
+                if not is_retryable_error(e) or failures > max_chunk_retries:
+                    logging.error(f"An error occurred while uploading file '{file_name}': {e}")
+                    raise e
+                logging.warning(f"Upload chunk of '{file_name}' failed with {e}. Retrying in {delay} seconds...")
+                time.sleep(delay)
+                delay *= 2
+                continue
+            if response is None and on_progress is not None:
+                on_progress(request.resumable_uri, request.resumable_progress)
+        logging.info(f"Successfully uploaded {file_name} with ID: {response.get('id')}")
+        return _result(response, with_md5)
+
+    @retry_on_exception(HttpError, should_retry=is_retryable_error)
+    def query_upload_session(self, session_uri, size):
+        """
+        Asks Drive how much of a resumable upload it has received. Returns the offset to continue
+        from and, if the upload already completed, the ID of the file; the offset is None if the
+        session no longer exists.
+        """
+        resp, content = self.service._http.request(session_uri, method='PUT', body=b'', headers={'Content-Length': '0', 'Content-Range': f"bytes */{size}"})
+        if resp.status in (200, 201):
+            return size, json.loads(content).get('id')
+        if resp.status == 308:
+            received = resp.get('range')
+            return (int(received.split('-')[1]) + 1 if received else 0), None
+        if resp.status in (404, 410):
+            logging.info(f"Upload session {session_uri} has expired.")
+            return None, None
+        raise HttpError(resp, content, uri=session_uri)
+
+    @retry_on_exception(HttpError, should_retry=is_retryable_error)
+    def copy_file(self, file_id, file_name, folder_id=None):
+        """
+        Copies a file in Google Drive on the server side, into `folder_id` under `file_name`.
+        """
+        file_metadata = {'name': file_name}
+        if folder_id:
+            file_metadata['parents'] = [folder_id]
+        try:
+            file = self.service.files().copy(fileId=file_id, body=file_metadata, fields='id').execute()
+            logging.info(f"Copied file with ID {file_id} to {file_name} with ID: {file.get('id')}")
+            return file.get('id')
+        except HttpError as e:
+            logging.error(f"An error occurred while copying file '{file_id}': {e}")
+            raise e
+
+    @retry_on_exception(HttpError, should_retry=is_retryable_error)
+    def trash_file(self, file_id):
+        """
+        Moves a file or folder in Google Drive to the trash.
+        """
+        try:
+            self.service.files().update(fileId=file_id, body={'trashed': True}, fields='id').execute()
+            logging.info(f"Moved file with ID {file_id} to the trash")
+        except HttpError as e:
+            logging.error(f"An error occurred while trashing file '{file_id}': {e}")
+            raise e
+
+    def list_children(self, parent_id=None):
+        """
+        Lists the files and folders in a folder that are not trashed, following every page.
+        """
+        query = f"'{parent_id or 'root'}' in parents and trashed = false"
+        page_token = None
+        while True:
+            response = self._list_children_page(query, page_token)
+            yield from response.get('files', [])
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return
+
+    @retry_on_exception(HttpError, should_retry=is_retryable_error)
+    def _list_children_page(self, query, page_token=None):
+        try:
+            return self.service.files().list(q=query, spaces='drive', pageSize=LIST_PAGE_SIZE, pageToken=page_token,
+                                             fields='nextPageToken, files(id, name, size, md5Checksum)').execute()
+        except HttpError as e:
+            logging.error(f"An error occurred while listing folder contents: {e}")
+            raise e
+
+    def find_files_batch(self, lookups):
+        """
+        Finds files or folders by name for many (name, parent ID) pairs with batched requests.
+        Returns, for each pair, the list of matches or the exception its lookup failed with.
+        """
+        results = self._execute_batch(
+            lambda lookup: self.service.files().list(q=self._name_query(*lookup), spaces='drive', fields='files(id, name)'), lookups)
+        return [result if isinstance(result, Exception) else result.get('files', []) for result in results]
+
+    def create_folders_batch(self, folders):
+        """
+        Creates many folders, given as (name, parent ID) pairs, with batched requests.
+        Returns, for each folder, its ID or the exception its creation failed with.
+        """
+        def make_request(folder):
+            name, parent_id = folder
+            file_metadata = {'name': name, 'mimeType': 'application/vnd.google-apps.folder'}
+            if parent_id:
+                file_metadata['parents'] = [parent_id]
+            return self.service.files().create(body=file_metadata, fields='id')
+
+        results = self._execute_batch(make_request, folders)
+        for (name, _), result in zip(folders, results):
+            if not isinstance(result, Exception):
+                logging.info(f"Created folder '{name}' with ID: {result.get('id')}")
+        return [result if isinstance(result, Exception) else result.get('id') for result in results]
+
+    def _execute_batch(self, make_request, items, max_retries=5):
+        """
+        Sends one request per item through the batch endpoint, BATCH_SIZE requests per batch.
+        Sub-requests that fail with a retryable error, and all requests of a batch whose whole
+        request failed that way, are gathered and sent again together in new batches after a
+        backoff. Returns the response, or the exception, of each item in order.
+        """
+        results = [None] * len(items)
+        pending = list(range(len(items)))
+        delay = 1
+        for attempt in range(max_retries):
+            last_attempt = attempt == max_retries - 1
+            failed = set()
+
+            def callback(request_id, response, exception):
+                index = int(request_id)
+                if exception is None:
+                    results[index] = response
+                elif is_retryable_error(exception) and not last_attempt:
+                    if self.limiter is not None and is_throttling_error(exception):
+                        self.limiter.on_throttle()
+                    failed.add(index)
+                else:
+                    logging.error(f"A batched request failed: {exception}")
+                    results[index] = exception
+
+            for start in range(0, len(pending), BATCH_SIZE):
+                chunk = pending[start:start + BATCH_SIZE]
+                batch = self.service.new_batch_http_request(callback=callback)
+                for index in chunk:
+                    batch.add(make_request(items[index]), request_id=str(index))
+                try:
+                    with self._slot():
+                        batch.execute()
+                except HttpError as e:
+                    if not is_retryable_error(e) or last_attempt:
+                        raise e
+                    failed.update(index for index in chunk if results[index] is None)
+
+            if not failed:
+                break
+            logging.warning(f"{len(failed)} batched requests failed. Retrying them in {delay:.2f} seconds...")
+            time.sleep(delay)
+            delay *= 2
+            pending = sorted(failed)
+        return results
+
     def find_or_create_folder_path(self, path):
         """
         Finds or creates a nested folder structure and returns the ID of the last folder.
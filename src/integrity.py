@@ -0,0 +1,78 @@
+import hashlib
+
+# Dropbox hashes files in blocks of this size; see https://www.dropbox.com/developers/reference/content-hash
+CONTENT_HASH_BLOCK_SIZE = 4 * 1024 * 1024
+# Attempts at transferring a file whose checksums do not match.
+INTEGRITY_RETRIES = 3
+
+class IntegrityError(Exception):
+    """
+    The bytes of a transfer do not match the checksum of their source. `file_id` is the
+    Google Drive file that was uploaded anyway, if any, so a retry can replace its content.
+    """
+    def __init__(self, message, file_id=None):
+        super().__init__(message)
+        self.file_id = file_id
+
+class ContentHasher:
+    """Computes a Dropbox content hash incrementally: the SHA-256 of the SHA-256 of every 4 MB block."""
+    def __init__(self):
+        self._overall = hashlib.sha256()
+        self._block = hashlib.sha256()
+        self._block_size = 0
+
+    def update(self, data):
+        data = memoryview(data)
+        while data:
+            take = min(len(data), CONTENT_HASH_BLOCK_SIZE - self._block_size)
+            self._block.update(data[:take])
+            self._block_size += take
+            data = data[take:]
+            if self._block_size == CONTENT_HASH_BLOCK_SIZE:
+                self._overall.update(self._block.digest())
+                self._block = hashlib.sha256()
+                self._block_size = 0
+
+    def hexdigest(self):
+        overall = self._overall.copy()
+        if self._block_size:
+            overall.update(self._block.digest())
+        return overall.hexdigest()
+
+class TransferHasher:
+    """
+    Hashes the bytes of a transfer as they pass through, with the Dropbox content hash to check
+    the download and the MD5 Google Drive reports to check the upload.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._content_hash = ContentHasher()
+        self._md5 = hashlib.md5()
+
+    def update(self, data):
+        self._content_hash.update(data)
+        self._md5.update(data)
+
+    def wrap(self, blocks):
+        """Hashes an iterator of byte blocks as it is consumed."""
+        for block in blocks:
+            self.update(block)
+            yield block
+
+    def content_hash(self):
+        return self._content_hash.hexdigest()
+
+    def md5(self):
+        return self._md5.hexdigest()
+
+    def check_download(self, file, file_id=None):
+        """Raises IntegrityError if the downloaded bytes do not match the listing's content hash."""
+        if file.content_hash and self.content_hash() != file.content_hash:
+            raise IntegrityError(f"Downloaded content of {file.path_display} does not match its Dropbox content hash.", file_id)
+
+    def check_upload(self, file, file_id, drive_md5):
+        """Raises IntegrityError if Drive stored different bytes than were uploaded."""
+        if drive_md5 != self.md5():
+            raise IntegrityError(f"Google Drive reports MD5 {drive_md5} for {file.path_display}, expected {self.md5()}.", file_id)
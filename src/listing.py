@@ -0,0 +1,92 @@
+import time
+import logging
+import dropbox
+from tqdm import tqdm
+
+FILE = 'file'
+FOLDER = 'folder'
+DELETED = 'deleted'
+
+class ListingEntry:
+    """
+    A compact record of a Dropbox listing entry, holding only the fields the migration uses.
+    Full `dropbox.files.Metadata` objects are converted as soon as a listing page arrives.
+    """
+    __slots__ = ('kind', 'path_display', 'name', 'size', 'content_hash', 'server_modified')
+
+    def __init__(self, kind, path_display, name, size=0, content_hash=None, server_modified=None):
+        self.kind = kind
+        self.path_display = path_display
+        self.name = name
+        self.size = size
+        self.content_hash = content_hash
+        self.server_modified = server_modified
+
+    @classmethod
+    def from_metadata(cls, metadata):
+        """Converts a Dropbox metadata object into a listing entry."""
+        if isinstance(metadata, dropbox.files.FileMetadata):
+            server_modified = getattr(metadata, 'server_modified', None)
+            return cls(FILE, metadata.path_display, metadata.name, metadata.size, metadata.content_hash,
+                       server_modified.timestamp() if server_modified else None)
+        if isinstance(metadata, dropbox.files.FolderMetadata):
+            return cls(FOLDER, metadata.path_display, metadata.name)
+        return cls(DELETED, metadata.path_display, metadata.name)
+
+    def to_row(self):
+        """Returns the entry as a list suitable for JSON serialization."""
+        return [self.kind, self.path_display, self.name, self.size, self.content_hash, self.server_modified]
+
+    @classmethod
+    def from_row(cls, row):
+        """Rebuilds an entry from the output of `to_row`."""
+        return cls(*row)
+
+    @property
+    def is_file(self):
+        return self.kind == FILE
+
+    @property
+    def is_folder(self):
+        return self.kind == FOLDER
+
+    @property
+    def is_deleted(self):
+        return self.kind == DELETED
+
+    def __repr__(self):
+        return f"ListingEntry({self.kind!r}, {self.path_display!r})"
+
+def to_entries(metadata_list):
+    """Converts a page of Dropbox metadata objects into listing entries."""
+    return [ListingEntry.from_metadata(metadata) for metadata in metadata_list]
+
+class ListingProgress:
+    """
+    Reports how a listing is progressing: entries and pages done and the listing rate.
+    """
+    def __init__(self, description="Listing", interval=5.0):
+        self.description = description
+        self.interval = interval
+        self.entries = 0
+        self.pages = 0
+        self.started = time.monotonic()
+        self.last_report = self.started
+
+    def update(self, entry_count, resumed=False):
+        self.entries += entry_count
+        if not resumed:
+            self.pages += 1
+        now = time.monotonic()
+        logging.debug(f"{self.description}: page {self.pages} with {entry_count} entries")
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    def report(self, done=False):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        message = f"{self.description}: {self.entries} entries in {self.pages} pages ({self.entries / elapsed:.0f} entries/s)"
+        if done:
+            message += f", finished in {elapsed:.1f}s"
+        tqdm.write(message)
+        logging.info(message)
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from src.listing import ListingEntry
+
+DEFAULT_CACHE_DIR = 'listing_cache'
+
+class ListingSnapshot:
+    """
+    A complete recursive listing of a Dropbox source together with the cursor it was taken at.
+    """
+    def __init__(self, entries, cursor, timestamp):
+        self.entries = entries
+        self.cursor = cursor
+        self.timestamp = timestamp
+
+    @property
+    def age(self):
+        return time.time() - self.timestamp
+
+    def apply_changes(self, changes):
+        """Applies entries returned by a cursor continuation: additions, modifications and deletions."""
+        by_path = {entry.path_display.lower(): entry for entry in self.entries}
+        for change in changes:
+            key = change.path_display.lower()
+            if change.is_deleted:
+                removed = by_path.pop(key, None)
+                if removed is not None and removed.is_folder:
+                    prefix = key + '/'
+                    for path in [path for path in by_path if path.startswith(prefix)]:
+                        del by_path[path]
+            else:
+                by_path[key] = change
+        self.entries = list(by_path.values())
+
+class SnapshotWriter:
+    """
+    Writes a listing snapshot incrementally as pages arrive. The snapshot only replaces
+    the previous one when `commit` is called, so an interrupted listing leaves it untouched.
+    """
+    def __init__(self, base_path, header):
+        self.entries_path = base_path + '.jsonl'
+        self.header_path = base_path + '.json'
+        self.header = header
+        self.file = open(self.entries_path + '.tmp', 'w')
+
+    def add(self, entries):
+        self.file.write(''.join(json.dumps(entry.to_row()) + '\n' for entry in entries))
+
+    def commit(self, cursor=None):
+        """Publishes the snapshot, optionally with the cursor the listing ended at."""
+        if cursor is not None:
+            self.header['cursor'] = cursor
+        self.file.close()
+        # Entries are replaced before the header: an older cursor next to newer entries only
+        # replays some changes on the next refresh, the other way round would lose them.
+        os.replace(self.entries_path + '.tmp', self.entries_path)
+        with open(self.header_path + '.tmp', 'w') as f:
+            json.dump(self.header, f)
+        os.replace(self.header_path + '.tmp', self.header_path)
+        logging.info(f"Saved listing snapshot to {self.entries_path}")
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.entries_path + '.tmp'):
+            os.remove(self.entries_path + '.tmp')
+
+class ListingCheckpoint:
+    """
+    Records the progress of a recursive listing as pages arrive: the entries gathered so far
+    and the cursor to continue from, so an interrupted listing resumes instead of restarting.
+    """
+    def __init__(self, base_path):
+        self.entries_path = base_path + '.partial.jsonl'
+        self.header_path = base_path + '.partial.json'
+        self.cursor = None
+        self.pages = 0
+        self.file = None
+
+    def load(self):
+        """Returns the entries of an interrupted listing, or an empty list if there is none."""
+        if not os.path.exists(self.header_path) or not os.path.exists(self.entries_path):
+            return []
+        with open(self.header_path, 'r') as f:
+            header = json.load(f)
+        self.cursor = header['cursor']
+        self.pages = header['pages']
+        # A page may have been appended without its cursor being saved; it is fetched again
+        # on resume, so keep only the latest copy of every path.
+        by_path = {}
+        complete = 0
+        with open(self.entries_path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError(line)
+                    entry = ListingEntry.from_row(json.loads(line))
+                except ValueError:
+                    logging.warning(f"Ignoring incomplete listing checkpoint entry in {self.entries_path}")
+                    break
+                by_path[entry.path_display.lower()] = entry
+                complete += len(line)
+        if os.path.getsize(self.entries_path) > complete:
+            # Drop a torn last line so the next page is not appended onto it.
+            os.truncate(self.entries_path, complete)
+        return list(by_path.values())
+
+    def append(self, entries, cursor):
+        """Saves a page of entries and the cursor that follows it."""
+        if self.file is None:
+            self.file = open(self.entries_path, 'a')
+        self.file.write(''.join(json.dumps(entry.to_row()) + '\n' for entry in entries))
+        self.file.flush()
+        self.cursor = cursor
+        self.pages += 1
+        with open(self.header_path + '.tmp', 'w') as f:
+            json.dump({'cursor': cursor, 'pages': self.pages}, f)
+        os.replace(self.header_path + '.tmp', self.header_path)
+
+    def finish(self):
+        """Removes the checkpoint once the listing has completed."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        for path in (self.header_path, self.entries_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+class ListingCache:
+    """
+    Persists listing snapshots on disk, one file per (team folder ID, source path).
+    """
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        self.directory = directory
+
+    def _path(self, team_folder_id, src_path):
+        key = f"{team_folder_id or ''}:{src_path or ''}"
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def load(self, team_folder_id, src_path):
+        """Returns the saved snapshot for a source, or None if there is none."""
+        base_path = self._path(team_folder_id, src_path)
+        if not os.path.exists(base_path + '.json') or not os.path.exists(base_path + '.jsonl'):
+            return None
+        with open(base_path + '.json', 'r') as f:
+            header = json.load(f)
+        with open(base_path + '.jsonl', 'r') as f:
+            entries = [ListingEntry.from_row(json.loads(line)) for line in f]
+        return ListingSnapshot(entries, header['cursor'], header['timestamp'])
+
+    def writer(self, team_folder_id, src_path, cursor, timestamp=None):
+        """Starts writing a new snapshot for a source."""
+        os.makedirs(self.directory, exist_ok=True)
+        header = {'team_folder_id': team_folder_id, 'src_path': src_path, 'cursor': cursor, 'timestamp': timestamp or time.time()}
+        return SnapshotWriter(self._path(team_folder_id, src_path), header)
+
+    def checkpoint(self, team_folder_id, src_path):
+        """Returns the listing checkpoint for a source."""
+        os.makedirs(self.directory, exist_ok=True)
+        return ListingCheckpoint(self._path(team_folder_id, src_path))
+
+    def save(self, team_folder_id, src_path, snapshot):
+        """Replaces the saved snapshot for a source."""
+        writer = self.writer(team_folder_id, src_path, snapshot.cursor, timestamp=snapshot.timestamp)
+        writer.add(snapshot.entries)
+        writer.commit()
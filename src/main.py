@@ -8,6 +8,8 @@ from google.auth.exceptions import RefreshError
 from src.dropbox_auth import get_access_token as get_dropbox_token, save_credentials as save_dropbox_credentials, load_credentials as load_dropbox_credentials, CREDENTIALS_FILE as DROPBOX_CREDENTIALS_FILE
 from src.google_drive_auth import get_credentials as get_google_credentials, TOKEN_PATH as GOOGLE_TOKEN_PATH
 from src.migration import Migration
+from src.listing_cache import DEFAULT_CACHE_DIR as LISTING_CACHE_DIR
+from src.scheduler import POLICIES as TRANSFER_POLICIES
 from src.logger_config import setup_logger
 
 def get_config(dropbox_team_account: bool = False):
@@ -39,6 +41,34 @@ def main(argv=None):
     parser.add_argument('--limit', type=int, default=None, help='Limit the number of lines printed in a test run.')
     parser.add_argument('--team', type=str, default=None, help='The ID of the Dropbox team to use.')
     parser.add_argument('--list-teams', action='store_true', help='List available Dropbox team folders and their IDs.')
+    parser.add_argument('--state-backend', choices=['json', 'sqlite', 'journal'], default='json', help='How the migration state is stored. sqlite writes one row per event; journal appends events to a log that is group-committed and compacted in the background.')
+    parser.add_argument('--stream', action='store_true', help='Start migrating while the Dropbox listing is still paging instead of listing everything first.')
+    parser.add_argument('--list-workers', type=int, default=1, help='Number of Dropbox subtrees to list concurrently. Values above 1 list the top level first and then each top-level folder in parallel.')
+    parser.add_argument('--delta', action='store_true', help='Only migrate what changed in Dropbox since the last complete migration of the same source.')
+    parser.add_argument('--delta-trash', action='store_true', help='With --delta, move files and folders deleted in Dropbox to the Google Drive trash.')
+    parser.add_argument('--listing-cache', action='store_true', help=f"Keep a snapshot of the Dropbox listing in '{LISTING_CACHE_DIR}' and reuse it, refreshed through its cursor, in later --ls, --dry_run and migration runs.")
+    parser.add_argument('--listing-max-age', type=int, default=86400, help='With --listing-cache, the age in seconds after which a snapshot is relisted from scratch.')
+    parser.add_argument('--refresh-listing', action='store_true', help='With --listing-cache, ignore the saved snapshot and relist everything.')
+    parser.add_argument('--checkpoint-listing', action='store_true', help=f"Checkpoint the Dropbox listing in '{LISTING_CACHE_DIR}' as pages arrive, so an interrupted listing resumes from its last page.")
+    parser.add_argument('--memory-budget', type=int, default=None, help='Keep the listing within about this many MB of memory by spilling sorted runs of it to disk. Meant for sources with tens of millions of entries.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of files to download and upload concurrently.')
+    parser.add_argument('--async-transfers', type=int, default=None, metavar='N', help='Transfer files with the asyncio engine, keeping up to N small files in flight at once. Requires aiohttp.')
+    parser.add_argument('--stream-transfers', action='store_true', help='Pipe each Dropbox download straight into the Google Drive upload through a bounded memory buffer instead of a temporary file.')
+    parser.add_argument('--small-file-threshold', type=int, default=1024 * 1024, metavar='BYTES', help='Files smaller than this are downloaded into memory and uploaded with a single request instead of through a temporary file and a resumable upload. 0 turns this off.')
+    parser.add_argument('--resume-uploads-above', type=int, default=100, metavar='MB', help='Save the Google Drive upload session of files of at least this many MB after every chunk, so an interrupted run continues the upload where it stopped. 0 turns this off.')
+    parser.add_argument('--ranged-download-above', type=int, default=None, metavar='MB', help='Download files of at least this many MB as byte ranges fetched concurrently; an interrupted download only fetches the missing ranges.')
+    parser.add_argument('--download-ranges', type=int, default=4, help='With --ranged-download-above, the number of byte ranges of a file downloaded at the same time.')
+    parser.add_argument('--transfer-order', choices=TRANSFER_POLICIES, default='listing', help='Order in which files are transferred: listing order, size-balanced (alternate large and small files), recent-first (most recently modified first) or small-files-lane (small files get workers of their own).')
+    parser.add_argument('--batch-requests', action='store_true', help='Look up and create folders with batched Google Drive requests, one depth level at a time, instead of one request each.')
+    parser.add_argument('--spool-dir', default=None, help='Download files into this directory, keyed by content hash. A file whose upload fails is kept there and uploaded from disk on the next attempt.')
+    parser.add_argument('--spool-budget', type=int, default=None, help='With --spool-dir, the most MB of downloaded files kept in the spool at a time. Downloads wait until they fit.')
+    parser.add_argument('--verify', action='store_true', help='Hash every file while it is transferred and check it against its Dropbox content hash and the MD5 Google Drive reports. Mismatching transfers are made again, and the checksums are recorded in the state.')
+    parser.add_argument('--dedup', action='store_true', help='Transfer each distinct file content once. Further files with the same Dropbox content hash are created as server-side copies in Google Drive.')
+    parser.add_argument('--adaptive-concurrency', type=int, default=None, help='Adapt the number of concurrent requests to Dropbox and to Google Drive, each up to this many: raised while requests succeed, cut when the service throttles. Use with --workers.')
+    parser.add_argument('--drive-index', type=int, default=None, metavar='FOLDERS', help='List the contents of each Google Drive destination folder once and check for existing files in memory, instead of one search per file. Keeps up to this many folders cached.')
+    parser.add_argument('--zip-folders', action='store_true', help='Download folders of many small files as one zip archive each instead of file by file.')
+    parser.add_argument('--zip-min-files', type=int, default=100, help='With --zip-folders, the fewest files a folder must hold to be downloaded as a zip archive.')
+    parser.add_argument('--zip-max-file-size', type=int, default=65536, help='With --zip-folders, the largest file, in bytes, a folder downloaded as a zip archive may hold.')
     args = parser.parse_args(argv)
 
     setup_logger()
@@ -71,15 +101,16 @@ def main(argv=None):
 
     # --- Start Migration ---
     while True:
+        migration = None
         try:
-            migration = Migration(dropbox_token, google_creds, src_path=args.src, dest_path=args.dest, team_folder_id=args.team)
+            migration = Migration(dropbox_token, google_creds, src_path=args.src, dest_path=args.dest, team_folder_id=args.team, state_backend=args.state_backend, streaming=args.stream, list_workers=args.list_workers, listing_cache_dir=LISTING_CACHE_DIR if args.listing_cache else None, listing_max_age=args.listing_max_age, refresh_listing=args.refresh_listing, listing_checkpoint_dir=LISTING_CACHE_DIR if args.checkpoint_listing else None, memory_budget=args.memory_budget * 1024 * 1024 if args.memory_budget else None, transfer_workers=args.workers, async_concurrency=args.async_transfers, stream_transfers=args.stream_transfers, small_file_threshold=args.small_file_threshold or None, resumable_session_threshold=args.resume_uploads_above * 1024 * 1024 if args.resume_uploads_above else None, ranged_download_threshold=args.ranged_download_above * 1024 * 1024 if args.ranged_download_above else None, download_ranges=args.download_ranges, transfer_policy=args.transfer_order, batch_requests=args.batch_requests, spool_dir=args.spool_dir, spool_budget=args.spool_budget * 1024 * 1024 if args.spool_budget else None, zip_min_files=args.zip_min_files if args.zip_folders else None, zip_max_file_size=args.zip_max_file_size, verify_integrity=args.verify, dedup=args.dedup, adaptive_concurrency=args.adaptive_concurrency, drive_index_folders=args.drive_index)
             if args.list_teams:
                 migration.list_team_folders()
                 break
             if args.ls:
                 migration.list_source_directory()
                 break
-            migration.start(dry_run=args.dry_run, interactive=args.interactive, limit=args.limit)
+            migration.start(dry_run=args.dry_run, interactive=args.interactive, limit=args.limit, delta=args.delta, trash_deleted=args.delta_trash)
             break # Exit the loop if migration completes successfully
         except dropbox.exceptions.AuthError as e:
             if 'expired_access_token' in str(e):
@@ -115,6 +146,9 @@ def main(argv=None):
         except Exception as e:
             logging.error(f"An unexpected error occurred during migration: {e}")
             break
+        finally:
+            if migration is not None:
+                migration.close()
 
 if __name__ == '__main__':
     main()
@@ -1,15 +1,38 @@
 import os
-import json
-import dropbox
 import logging
 import re
+import itertools
+import queue
+import threading
+import tempfile
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import dropbox
 from tqdm import tqdm
-from src.dropbox_client import DropboxClient
-from src.google_drive_client import GoogleDriveClient
+from src.dropbox_client import DropboxClient, RANGES_SUFFIX, RangeIgnoredError, is_throttling_error as is_dropbox_throttling
+from src.google_drive_client import GoogleDriveClient, is_throttling_error as is_drive_throttling
+from src.concurrency import AIMDLimiter
+from src.drive_index import DriveChildrenIndex
+from src.state_store import create_state_store, apply_event, build_index
+from src.listing import to_entries, ListingProgress
+from src.listing_cache import ListingCache
+from src.external_sort import ExternalSorter
+from src.async_transfer import AsyncTransferEngine
+from googleapiclient.http import MediaFileUpload
+from googleapiclient.errors import HttpError
+from src.spool import Spool
+from src.integrity import TransferHasher, ContentHasher, IntegrityError, CONTENT_HASH_BLOCK_SIZE, INTEGRITY_RETRIES
+from src.zip_folders import group_zip_folders, iter_zip_members, DEFAULT_MAX_FILE_SIZE as DEFAULT_ZIP_MAX_FILE_SIZE
+from src.scheduler import TransferScheduler, LISTING, SMALL_FILES_LANE
+from src.stream_transfer import StreamingMediaUpload, DOWNLOAD_READ_SIZE
+
+# Folders of one depth level that are looked up and created before the state is saved.
+FOLDER_BATCH_CHUNK = 1000
 
 class Migration:
-    def __init__(self, dropbox_token, google_credentials, src_path=None, dest_path=None, state_file='migration_state.json', team_folder_id=None):
+    def __init__(self, dropbox_token, google_credentials, src_path=None, dest_path=None, state_file='migration_state.json', team_folder_id=None, state_backend='json', streaming=False, stream_buffer_pages=8, list_workers=1, listing_cache_dir=None, listing_max_age=None, refresh_listing=False, listing_checkpoint_dir=None, memory_budget=None, transfer_workers=1, async_concurrency=None, stream_transfers=False, small_file_threshold=None, resumable_session_threshold=None, ranged_download_threshold=None, download_ranges=4, transfer_policy=LISTING, batch_requests=False, spool_dir=None, spool_budget=None, zip_min_files=None, zip_max_file_size=DEFAULT_ZIP_MAX_FILE_SIZE, verify_integrity=False, dedup=False, adaptive_concurrency=None, drive_index_folders=None):
         self.dropbox_client = DropboxClient(dropbox_token)
+        self.google_credentials = google_credentials
         self.google_drive_client = GoogleDriveClient(google_credentials)
         if src_path and not src_path.startswith('/'):
             self.src_path = '/' + src_path
@@ -17,31 +40,113 @@ class Migration:
             self.src_path = src_path
         self.dest_path = dest_path
         self.state_file = state_file
+        self.state_store = create_state_store(state_backend, state_file)
         self.state = self._load_state()
+        self._build_state_index()
         self.total_files_to_migrate = 0
         self.migrated_in_session = 0
         self.failed_files = []
         self.conflict_resolution_strategy = None
         self.team_folder_id = team_folder_id
+        self.streaming = streaming
+        self.stream_buffer_pages = stream_buffer_pages
+        self.list_workers = list_workers
+        self.listing_cache = ListingCache(listing_cache_dir) if listing_cache_dir else None
+        self.listing_max_age = listing_max_age
+        self.refresh_listing = refresh_listing
+        self.listing_checkpoints = ListingCache(listing_checkpoint_dir) if listing_checkpoint_dir else None
+        self.memory_budget = memory_budget
+        self.transfer_workers = transfer_workers
+        self.state_lock = threading.Lock()
+        self._thread_local = threading.local()
+        self.stream_transfers = stream_transfers
+        self.small_file_threshold = small_file_threshold
+        self.resumable_session_threshold = resumable_session_threshold
+        self.ranged_download_threshold = ranged_download_threshold
+        self.download_ranges = download_ranges
+        self.scheduler = TransferScheduler(transfer_policy)
+        self.batch_requests = batch_requests
+        self.spool = Spool(spool_dir, spool_budget) if spool_dir else None
+        self.zip_min_files = zip_min_files
+        self.zip_max_file_size = zip_max_file_size
+        self.verify_integrity = verify_integrity
+        self.dedup = dedup
+        self.drive_index = DriveChildrenIndex(self.google_drive_client, drive_index_folders) if drive_index_folders else None
+        # (parent folder ID, name) of files renamed because of a conflict, for when there is no Drive index.
+        self.reserved_names = set()
+        # Dropbox path -> the copy of a file extracted from a zip archive, for `zip_min_files`.
+        self.local_copies = {}
+        self.dropbox_limiter = None
+        self.drive_limiter = None
+        if adaptive_concurrency:
+            self.dropbox_limiter = self.dropbox_client.limiter = AIMDLimiter('Dropbox', adaptive_concurrency, is_throttle=is_dropbox_throttling)
+            self.drive_limiter = self.google_drive_client.limiter = AIMDLimiter('Google Drive', adaptive_concurrency, is_throttle=is_drive_throttling)
+        self.async_engine = None
+        if async_concurrency:
+            self.async_engine = AsyncTransferEngine(dropbox_token, google_credentials, team_folder_id=team_folder_id, concurrency=async_concurrency, verify_integrity=verify_integrity)
 
     def _load_state(self):
-        """Loads the migration state from a file."""
-        if os.path.exists(self.state_file):
-            with open(self.state_file, 'r') as f:
-                return json.load(f)
-        return {'migrated_files': [], 'skipped_files': [], 'failed_files': [], 'migrated_folders': {'/': None}, 'skipped_folders': []}
+        """Loads the migration state from the state store."""
+        return self.state_store.load()
 
     def _save_state(self):
-        """Saves the migration state to a file."""
-        with open(self.state_file, 'w') as f:
-            json.dump(self.state, f, indent=4)
+        """Persists the migration state through the state store."""
+        with self.state_lock:
+            self.state_store.save(self.state)
+
+    def _build_state_index(self):
+        """Builds hash indexes over the state lists so membership checks are O(1)."""
+        # Kept up to date by `apply_event`; the names below are views of it.
+        self.state_index = build_index(self.state)
+        self.migrated_index = self.state_index['migrated_files']
+        self.skipped_index = self.state_index['skipped_files']
+        self.failed_index = self.state_index['failed_files']
+        self.skipped_folder_index = self.state_index['skipped_folders']
+        # Drive file ID -> the content hash it is indexed under, for `dedup`.
+        self.content_file_index = self.state_index['content_file_ids']
+        # Migrated files whose Drive copy is being replaced with changed content, for `--delta`.
+        self.replacing = set()
+
+    def _is_migrated(self, path):
+        return path in self.migrated_index and path not in self.replacing
+
+    def _is_skipped(self, path):
+        return path in self.skipped_index
+
+    def _is_folder_done(self, path):
+        return path in self.state['migrated_folders'] or path in self.skipped_folder_index
+
+    def _pending_files(self, items, include_skipped=False):
+        """Returns the files in a listing that still have to be migrated."""
+        return [
+            item for item in items
+            if item.is_file
+            and not self._is_migrated(item.path_display)
+            and (include_skipped or item.path_display not in self.skipped_index)
+        ]
+
+    def _record_state(self, event, path, value=None):
+        """Applies a single state change in memory and hands it to the state store."""
+        with self.state_lock:
+            apply_event(self.state, event, path, value, self.state_index)
+            if event == 'migrated_file':
+                self.replacing.discard(path)
+            self.state_store.record(event, path, value)
+
+    def close(self):
+        """Flushes and closes the state store."""
+        self.state_store.close()
 
     def _sanitize_filename(self, filename):
         """Removes characters that are problematic for file systems."""
         return re.sub(r'[\\/*?:\'"<>|]', "_", filename)
 
-    def start(self, dry_run=False, interactive=False, limit=None):
+    def start(self, dry_run=False, interactive=False, limit=None, delta=False, trash_deleted=False):
         """Starts the migration process."""
+        if delta:
+            self._start_delta(limit=limit, trash_deleted=trash_deleted, dry_run=dry_run)
+            return
+
         if dry_run:
             print("Generating migration plan (dry run)...")
             logging.info("Generating migration plan (dry run)...")
@@ -51,6 +156,12 @@ class Migration:
         if interactive:
             print("Starting interactive migration...")
             logging.info("Starting interactive migration...")
+        elif self.streaming:
+            self._start_streaming(limit=limit)
+            return
+        elif self.memory_budget is not None:
+            self._start_bounded(limit=limit)
+            return
         else:
             print("Starting migration...")
             logging.info("Starting migration...")
@@ -58,9 +169,10 @@ class Migration:
         dest_folder_id = None
         if self.dest_path:
             dest_folder_id = self.google_drive_client.find_or_create_folder_path(self.dest_path)
-            self.state['migrated_folders'][self.dest_path] = dest_folder_id
+            self._record_state('folder', self.dest_path, dest_folder_id)
 
-        dropbox_items = self.dropbox_client.list_files_and_folders(path=self.src_path or '', team_folder_id=self.team_folder_id)
+        cursor = self.dropbox_client.get_latest_cursor(path=self.src_path or '', team_folder_id=self.team_folder_id)
+        dropbox_items = self._list_source_items()
 
         if not dropbox_items:
             print("No items to migrate.")
@@ -71,12 +183,7 @@ class Migration:
             # User chose to quit
             return
 
-        files_to_migrate = [
-            item for item in dropbox_items 
-            if isinstance(item, dropbox.files.FileMetadata) 
-            and item.path_display not in self.state['migrated_files']
-            and item.path_display not in self.state['skipped_files']
-        ]
+        files_to_migrate = self._pending_files(dropbox_items)
         self.total_files_to_migrate = len(files_to_migrate)
 
         if not files_to_migrate:
@@ -107,12 +214,422 @@ class Migration:
             return
 
         with tqdm(total=total_size, unit='B', unit_scale=True, desc="Migrating files") as pbar:
-            self.migrated_in_session = self._migrate_files(files_to_migrate, pbar, dest_folder_id=dest_folder_id, limit=limit)
+            self.migrated_in_session = self._migrate_files(files_to_migrate, pbar, dest_folder_id=dest_folder_id, limit=limit, listing=dropbox_items)
+
+        self._save_cursor(cursor, complete=limit is None or self.migrated_in_session < limit)
+        print("Migration complete.")
+        logging.info("Migration complete.")
+        self.log_migration_summary()
+
+    def _source_key(self):
+        """Identifies the migrated Dropbox source in the state."""
+        return f"{self.team_folder_id or ''}:{self.src_path or ''}"
+
+    def _save_cursor(self, cursor, complete):
+        """
+        Saves the listing cursor taken before a full pass, so later runs can use --delta.
+        The cursor is only saved when the pass left nothing behind, otherwise a delta
+        from it would never revisit the files that were not migrated.
+        """
+        if not complete or self.failed_files:
+            logging.info("Not saving the listing cursor because this pass did not migrate every file.")
+            return
+        self._record_state('cursor', self._source_key(), cursor)
+        self._save_state()
+
+    def _start_delta(self, limit=None, trash_deleted=False, dry_run=False):
+        """
+        Migrates only what changed in Dropbox since the cursor saved by the last complete pass:
+        new and modified files are uploaded, modified files replace their Drive copy, and
+        deleted entries are optionally moved to the Drive trash.
+        With `dry_run`, the changes are only printed.
+        """
+        cursor = self.state.get('list_cursors', {}).get(self._source_key())
+        if not cursor:
+            print("No saved listing cursor for this source. Run a full migration first.")
+            logging.warning("No saved listing cursor for this source. Run a full migration first.")
+            return
+
+        print("Fetching changes since the last migration...")
+        logging.info("Fetching changes since the last migration...")
+        changes = []
+        for result in self.dropbox_client.iter_list_folder_pages(team_folder_id=self.team_folder_id, cursor=cursor):
+            changes.extend(to_entries(result.entries))
+            cursor = result.cursor
+
+        folders = [entry for entry in changes if entry.is_folder]
+        files = [entry for entry in changes if entry.is_file]
+        deleted = [entry for entry in changes if entry.is_deleted]
+        modified = [file for file in files if self._is_migrated(file.path_display)]
+        added = [file for file in files if not self._is_migrated(file.path_display) and not self._is_skipped(file.path_display)]
+
+        summary = (
+            f"--- Delta Migration Summary ---\n"
+            f"New files: {len(added)}\n"
+            f"Modified files: {len(modified)}\n"
+            f"Deleted entries: {len(deleted)}" + ("" if trash_deleted else " (left in Google Drive)")
+        )
+        print(summary)
+        logging.info(summary)
+
+        if dry_run:
+            self._print_delta_plan(added, modified, deleted, trash_deleted, limit)
+            return
+
+        self._migrate_folders(folders)
+        if trash_deleted:
+            for entry in deleted:
+                self._trash_deleted_entry(entry)
+
+        # Modified files stay recorded as migrated until their new content has replaced the old.
+        self.replacing.update(file.path_display for file in modified)
+        self.total_files_to_migrate = len(added) + len(modified)
+        total_size = sum(f.size for f in added + modified)
+        with tqdm(total=total_size, unit='B', unit_scale=True, desc="Migrating changes") as pbar:
+            self.migrated_in_session = self._migrate_files(modified, pbar, limit=limit)
+            remaining = None if limit is None else limit - self.migrated_in_session
+            self.migrated_in_session += self._migrate_files(added, pbar, limit=remaining)
+
+        self._save_cursor(cursor, complete=limit is None or self.migrated_in_session < limit)
+        print("Delta migration complete.")
+        logging.info("Delta migration complete.")
+        self.log_migration_summary()
+
+    def _print_delta_plan(self, added, modified, deleted, trash_deleted, limit=None):
+        """Prints what a delta migration would do, without doing it."""
+        files = [('modified', file) for file in modified] + [('new', file) for file in added]
+        if limit is not None:
+            files = files[:limit]
+        lines = [f"{change}: dropbox:{file.path_display} -> gdrive:{self._get_destination_path(file)}" for change, file in files]
+        lines += [f"deleted: dropbox:{entry.path_display}" + (" (moved to the Google Drive trash)" if trash_deleted else "") for entry in deleted]
+        for line in lines:
+            print(line)
+            logging.info(line)
+
+    def _trash_deleted_entry(self, entry):
+        """Moves the Drive copy of a file or folder deleted in Dropbox to the trash."""
+        path = entry.path_display
+        try:
+            if path in self.state['migrated_folders']:
+                folder_id = self.state['migrated_folders'][path]
+                self.google_drive_client.trash_file(folder_id)
+                for key in [key for key, value in self.state['migrated_folders'].items() if value == folder_id or key.startswith(path + '/')]:
+                    self._record_state('removed_folder', key)
+                for file_path in [p for p in self.migrated_index if p.startswith(path + '/')]:
+                    self._record_state('removed_file', file_path)
+            elif self._is_migrated(path):
+                file_id = self.state.get('file_ids', {}).get(path)
+                if file_id:
+                    self.google_drive_client.trash_file(file_id)
+                    if self.drive_index is not None:
+                        self.drive_index.remove(self._get_parent_folder_id(path), file_id)
+                else:
+                    # Migrated before file IDs were recorded: a file found by name may not be its copy.
+                    logging.warning(f"No Google Drive file ID is recorded for {path}. Leaving its copy in Google Drive.")
+                self._record_state('removed_file', path)
+            else:
+                return
+            self._save_state()
+            logging.info(f"Moved deleted entry {path} to the Google Drive trash.")
+        except Exception as e:
+            logging.error(f"Failed to trash deleted entry {path}: {e}")
+
+    def _start_streaming(self, limit=None):
+        """
+        Migrates entries while the recursive listing is still paging. A background
+        thread fetches listing pages into a bounded queue and the folders and files
+        of each page are migrated as soon as the page is taken off the queue.
+        """
+        summary = (
+            f"--- Streaming Migration ---\n"
+            f"Files are migrated while the Dropbox listing is still running, so totals are shown as they are discovered."
+        )
+        if self.team_folder_id:
+            summary += f"\nTeam Folder ID: {self.team_folder_id}"
+        if self.src_path:
+            summary += f"\nSource path: {self.src_path}"
+        if self.dest_path:
+            summary += f"\nDestination path: {self.dest_path}"
+        print(summary)
+        logging.info(summary)
 
+        choice = input("Do you want to proceed with the migration? (y/n): ").lower()
+        if choice != 'y':
+            print("Migration cancelled.")
+            logging.info("Migration cancelled by user.")
+            return
+
+        print("Starting streaming migration...")
+        logging.info("Starting streaming migration...")
+
+        dest_folder_id = None
+        if self.dest_path:
+            dest_folder_id = self.google_drive_client.find_or_create_folder_path(self.dest_path)
+            self._record_state('folder', self.dest_path, dest_folder_id)
+            self._save_state()
+
+        cursor = self.dropbox_client.get_latest_cursor(path=self.src_path or '', team_folder_id=self.team_folder_id)
+        pages = queue.Queue(maxsize=self.stream_buffer_pages)
+        stop = threading.Event()
+        lister = threading.Thread(target=self._produce_listing_pages, args=(pages, stop), daemon=True)
+        lister.start()
+
+        # Files whose parent folder has not been listed yet, keyed by the parent's state key.
+        waiting_files = {}
+        self.migrated_in_session = 0
+        complete = False
+        try:
+            with tqdm(total=0, unit='B', unit_scale=True, desc="Migrating files") as pbar:
+                while limit is None or self.migrated_in_session < limit:
+                    page = pages.get()
+                    if page is None:
+                        break
+                    if isinstance(page, Exception):
+                        raise page
+
+                    self._migrate_folders(page, dest_folder_id=dest_folder_id)
+
+                    ready_files = []
+                    for folder in page:
+                        if folder.is_folder:
+                            ready_files.extend(waiting_files.pop(self._get_migrated_folder_path(folder.path_display), []))
+                    for file in self._pending_files(page):
+                        migrated_parent_path = self._get_migrated_parent_path(file.path_display)
+                        if migrated_parent_path in self.state['migrated_folders']:
+                            ready_files.append(file)
+                        else:
+                            waiting_files.setdefault(migrated_parent_path, []).append(file)
+
+                    self._stream_files(ready_files, pbar, dest_folder_id, limit)
+
+                # Whatever is still waiting never had its parent listed; migrate it like the batch mode would.
+                for files in waiting_files.values():
+                    if limit is not None and self.migrated_in_session >= limit:
+                        break
+                    self._stream_files(files, pbar, dest_folder_id, limit)
+                complete = page is None
+        finally:
+            stop.set()
+            while lister.is_alive():
+                try:
+                    pages.get_nowait()
+                except queue.Empty:
+                    lister.join(0.1)
+
+        self._save_cursor(cursor, complete=complete)
         print("Migration complete.")
         logging.info("Migration complete.")
         self.log_migration_summary()
 
+    def _start_bounded(self, limit=None):
+        """
+        Migrates with bounded memory. The listing is streamed into two external sorters,
+        one for folders and one for pending files, which spill sorted runs to disk once
+        their share of `memory_budget` is used. Folders are then created and files
+        transferred while merge-iterating the runs in depth and path order.
+        """
+        dest_folder_id = None
+        if self.dest_path:
+            dest_folder_id = self.google_drive_client.find_or_create_folder_path(self.dest_path)
+            self._record_state('folder', self.dest_path, dest_folder_id)
+
+        cursor = self.dropbox_client.get_latest_cursor(path=self.src_path or '', team_folder_id=self.team_folder_id)
+        with ExternalSorter(self.memory_budget // 2) as folders, ExternalSorter(self.memory_budget // 2) as files:
+            listed = 0
+            total_size = 0
+            for entries in self._iter_listing_pages():
+                listed += len(entries)
+                folders.extend(entry for entry in entries if entry.is_folder)
+                pending = self._pending_files(entries)
+                files.extend(pending)
+                total_size += sum(f.size for f in pending)
+
+            if not listed:
+                print("No items to migrate.")
+                logging.info("No items to migrate.")
+                return
+
+            if self.batch_requests:
+                self._create_folders_batched(folder for folder in folders if not self._is_folder_done(folder.path_display))
+            else:
+                for folder in folders:
+                    if not self._is_folder_done(folder.path_display):
+                        self._create_folder(folder)
+
+            self.total_files_to_migrate = len(files)
+            if not files:
+                print("All files have already been migrated.")
+                logging.info("All files have already been migrated.")
+                return
+
+            summary = (
+                f"--- Migration Summary ---\n"
+                f"Total files to migrate: {self.total_files_to_migrate}\n"
+                f"Total size: {total_size / 1e6:.2f} MB"
+            )
+            if self.team_folder_id:
+                summary += f"\nTeam Folder ID: {self.team_folder_id}"
+            if self.src_path:
+                summary += f"\nSource path: {self.src_path}"
+            if self.dest_path:
+                summary += f"\nDestination path: {self.dest_path}"
+            print(summary)
+            logging.info(summary)
+
+            choice = input("Do you want to proceed with the migration? (y/n): ").lower()
+            if choice != 'y':
+                print("Migration cancelled.")
+                logging.info("Migration cancelled by user.")
+                return
+
+            with tqdm(total=total_size, unit='B', unit_scale=True, desc="Migrating files") as pbar:
+                self.migrated_in_session = self._migrate_files(files, pbar, dest_folder_id=dest_folder_id, limit=limit)
+
+        self._save_cursor(cursor, complete=limit is None or self.migrated_in_session < limit)
+        print("Migration complete.")
+        logging.info("Migration complete.")
+        self.log_migration_summary()
+
+    def _produce_listing_pages(self, pages, stop):
+        """Puts listing pages on the queue until the listing ends, fails or is stopped."""
+        try:
+            for entries in self._iter_listing_pages():
+                if stop.is_set():
+                    return
+                pages.put(entries)
+            pages.put(None)
+        except Exception as e:
+            pages.put(e)
+
+    def _iter_listing_pages(self):
+        """
+        Yields the recursive listing of the source path as lists of entries. With a listing
+        cache, a fresh enough snapshot is brought up to date through its cursor and served
+        instead of relisting; otherwise the remote listing is recorded as the new snapshot.
+        """
+        if self.listing_cache is None:
+            yield from self._iter_remote_listing_pages()
+            return
+
+        snapshot = self._load_fresh_snapshot()
+        if snapshot is not None and self._refresh_snapshot(snapshot):
+            logging.info(f"Using listing snapshot with {len(snapshot.entries)} entries from {snapshot.age:.0f} seconds ago.")
+            for i in range(0, len(snapshot.entries), 2000):
+                yield snapshot.entries[i:i + 2000]
+            return
+
+        cursor = self.dropbox_client.get_latest_cursor(path=self.src_path or '', team_folder_id=self.team_folder_id)
+        writer = self.listing_cache.writer(self.team_folder_id, self.src_path, cursor)
+        try:
+            for entries in self._iter_remote_listing_pages():
+                writer.add(entries)
+                yield entries
+        except BaseException:
+            writer.discard()
+            raise
+        writer.commit()
+
+    def _load_fresh_snapshot(self):
+        """Returns the cached listing snapshot if it may be reused, otherwise None."""
+        if self.refresh_listing:
+            return None
+        snapshot = self.listing_cache.load(self.team_folder_id, self.src_path)
+        if snapshot is None:
+            return None
+        if self.listing_max_age is not None and snapshot.age > self.listing_max_age:
+            logging.info(f"Listing snapshot is {snapshot.age:.0f} seconds old, relisting.")
+            return None
+        return snapshot
+
+    def _refresh_snapshot(self, snapshot):
+        """Applies the changes since the snapshot's cursor and saves it. Returns False if the cursor is no longer valid."""
+        changes = []
+        cursor = snapshot.cursor
+        try:
+            for result in self.dropbox_client.iter_list_folder_pages(team_folder_id=self.team_folder_id, cursor=cursor):
+                changes.extend(to_entries(result.entries))
+                cursor = result.cursor
+        except dropbox.exceptions.ApiError as e:
+            logging.warning(f"Could not refresh listing snapshot, relisting: {e}")
+            return False
+        if changes or cursor != snapshot.cursor:
+            snapshot.apply_changes(changes)
+            snapshot.cursor = cursor
+            self.listing_cache.save(self.team_folder_id, self.src_path, snapshot)
+        logging.info(f"Refreshed listing snapshot with {len(changes)} changes.")
+        return True
+
+    def _iter_remote_listing_pages(self):
+        """Yields the recursive listing of the source path, as fetched from Dropbox, and reports progress."""
+        progress = ListingProgress(f"Listing '{self.src_path or '/'}'")
+        if self.list_workers > 1:
+            for entries in self.dropbox_client.iter_list_folder_pages_parallel(path=self.src_path or '', team_folder_id=self.team_folder_id, max_workers=self.list_workers):
+                entries = to_entries(entries)
+                progress.update(len(entries))
+                yield entries
+        elif self.listing_checkpoints is not None:
+            yield from self._iter_checkpointed_listing_pages(progress)
+        else:
+            for result in self.dropbox_client.iter_list_folder_pages(path=self.src_path or '', recursive=True, team_folder_id=self.team_folder_id):
+                entries = to_entries(result.entries)
+                progress.update(len(entries))
+                yield entries
+        progress.report(done=True)
+
+    def _iter_checkpointed_listing_pages(self, progress):
+        """
+        Yields the recursive listing while checkpointing every page, resuming from the
+        checkpoint of an earlier, interrupted listing of the same source.
+        """
+        checkpoint = self.listing_checkpoints.checkpoint(self.team_folder_id, self.src_path)
+        resumed = checkpoint.load()
+        pages = None
+        if checkpoint.cursor:
+            pages = self.dropbox_client.iter_list_folder_pages(path=self.src_path or '', recursive=True, team_folder_id=self.team_folder_id, cursor=checkpoint.cursor)
+            try:
+                # Continue from the cursor before yielding anything, in case Dropbox no longer accepts it.
+                first_page = next(pages)
+            except dropbox.exceptions.ApiError as e:
+                logging.warning(f"Could not resume listing from checkpoint, relisting: {e}")
+                checkpoint.finish()
+                checkpoint = self.listing_checkpoints.checkpoint(self.team_folder_id, self.src_path)
+                pages = None
+            else:
+                logging.info(f"Resuming listing from checkpoint with {len(resumed)} entries after {checkpoint.pages} pages.")
+                progress.pages = checkpoint.pages
+                progress.update(len(resumed), resumed=True)
+                for i in range(0, len(resumed), 2000):
+                    yield resumed[i:i + 2000]
+                pages = itertools.chain([first_page], pages)
+        if pages is None:
+            pages = self.dropbox_client.iter_list_folder_pages(path=self.src_path or '', recursive=True, team_folder_id=self.team_folder_id)
+        for result in pages:
+            entries = to_entries(result.entries)
+            checkpoint.append(entries, result.cursor)
+            progress.update(len(entries))
+            yield entries
+        checkpoint.finish()
+
+    def _list_source_items(self):
+        """Returns the complete listing of the source path as listing entries."""
+        if self.list_workers > 1 or self.listing_cache is not None or self.listing_checkpoints is not None:
+            return [entry for entries in self._iter_listing_pages() for entry in entries]
+        entries = []
+        for result in self.dropbox_client.iter_list_folder_pages(path=self.src_path or '', team_folder_id=self.team_folder_id):
+            # Every page is converted as it arrives, so its SDK objects can be freed right away.
+            entries.extend(to_entries(result.entries))
+        return entries
+
+    def _stream_files(self, files, pbar, dest_folder_id, limit):
+        """Migrates a batch of files discovered by the streaming listing."""
+        if not files:
+            return
+        self.total_files_to_migrate += len(files)
+        pbar.total += sum(f.size for f in files)
+        pbar.refresh()
+        remaining = None if limit is None else limit - self.migrated_in_session
+        self.migrated_in_session += self._migrate_files(files, pbar, dest_folder_id=dest_folder_id, limit=remaining)
+
     def log_migration_summary(self):
         """Logs and prints a summary of the migration session."""
         remaining_files = self.total_files_to_migrate - self.migrated_in_session
@@ -128,11 +645,13 @@ class Migration:
             summary += "\nFailed files:\n" + "\n".join(self.failed_files)
         logging.info(summary)
         print(summary)
+        if self.dropbox_limiter is not None:
+            logging.info(f"Final concurrency limits: Dropbox {int(self.dropbox_limiter.limit)}, Google Drive {int(self.drive_limiter.limit)}")
 
     def _generate_migration_plan(self, limit=None):
         """Generates and prints a plan of files to be migrated."""
-        dropbox_items = self.dropbox_client.list_files_and_folders(path=self.src_path or '', team_folder_id=self.team_folder_id)
-        files_to_migrate = [item for item in dropbox_items if isinstance(item, dropbox.files.FileMetadata) and item.path_display not in self.state['migrated_files']]
+        dropbox_items = self._list_source_items()
+        files_to_migrate = self._pending_files(dropbox_items, include_skipped=True)
 
         summary = (
             f"--- Migration Plan Summary ---\n"
@@ -184,18 +703,28 @@ class Migration:
 
     def _migrate_folders(self, items, interactive=False, dest_folder_id=None):
         """Migrates folders from Dropbox to Google Drive, preserving hierarchy."""
-        folders = [item for item in items if isinstance(item, dropbox.files.FolderMetadata)]
+        folders = [item for item in items if item.is_folder]
         folders.sort(key=lambda f: f.path_display.count('/'))
 
+        files_by_folder = {}
+        if interactive:
+            for item in items:
+                if item.is_file:
+                    files_by_folder.setdefault(os.path.dirname(item.path_display), []).append(item.name)
+
+        if self.batch_requests and not interactive:
+            self._create_folders_batched(folder for folder in folders if not self._is_folder_done(folder.path_display))
+            return
+
         for folder in folders:
-            if folder.path_display in self.state['migrated_folders'] or folder.path_display in self.state['skipped_folders']:
+            if self._is_folder_done(folder.path_display):
                 continue
 
             if interactive:
                 folder_info = f"\nFolder: {folder.path_display}"
                 print(folder_info)
                 logging.info(folder_info)
-                files_in_folder = [item.name for item in items if isinstance(item, dropbox.files.FileMetadata) and os.path.dirname(item.path_display) == folder.path_display]
+                files_in_folder = files_by_folder.get(folder.path_display, [])
                 if files_in_folder:
                     print("Files to be migrated in this folder:")
                     logging.info("Files to be migrated in this folder:")
@@ -208,7 +737,7 @@ class Migration:
                 
                 choice = input("Press Enter to continue, 's' to skip this folder, or 'esc' to quit: ").lower()
                 if choice == 's':
-                    self.state['skipped_folders'].append(folder.path_display)
+                    self._record_state('skipped_folder', folder.path_display)
                     self._save_state()
                     continue
                 elif choice == 'esc':
@@ -217,103 +746,718 @@ class Migration:
                     self._save_state()
                     return False
 
-            parent_dropbox_path = os.path.dirname(folder.path_display)
-            if self.src_path and parent_dropbox_path.startswith(self.src_path):
-                relative_parent_path = os.path.relpath(parent_dropbox_path, self.src_path)
-                if relative_parent_path == '.':
-                    parent_path = self.dest_path or '/'
-                else:
-                    parent_path = os.path.join(self.dest_path or '/', relative_parent_path)
-            else:
-                parent_path = parent_dropbox_path
+            self._create_folder(folder)
 
-            parent_id = self.state['migrated_folders'].get(parent_path)
+    def _create_folder(self, folder):
+        """Finds or creates the Google Drive folder for a Dropbox folder and records it."""
+        parent_id = self._get_folder_parent_id(folder)
+        existing_folders = self._find_existing(folder.name, parent_id)
+        if existing_folders:
+            folder_id = existing_folders[0]['id']
+            logging.info(f"Folder '{folder.name}' already exists. Using existing folder.")
+        else:
+            folder_id = self.google_drive_client.create_folder(folder.name, parent_id=parent_id)
+            if folder_id and self.drive_index is not None:
+                self.drive_index.add(parent_id, {'id': folder_id, 'name': folder.name})
 
-            if parent_id is None:
-                if self.dest_path:
-                    parent_id = self.state['migrated_folders'].get(self.dest_path)
-                elif parent_path == '/':
-                    parent_id = self.state['migrated_folders'].get('/')
+        if folder_id:
+            self._record_folder(folder, folder_id)
+            self._save_state()
 
-            existing_folders = self.google_drive_client.find_file(folder.name, parent_id=parent_id)
-            if existing_folders:
-                folder_id = existing_folders[0]['id']
-                logging.info(f"Folder '{folder.name}' already exists. Using existing folder.")
-            else:
-                folder_id = self.google_drive_client.create_folder(folder.name, parent_id=parent_id)
+    def _create_folders_batched(self, folders):
+        """
+        Finds or creates the Google Drive folders for Dropbox folders sorted by depth, with
+        batched requests: the folders of one depth level are looked up in batches, then the
+        missing ones are created in batches. Failed folders are raised after the others are recorded.
+        """
+        for _, level in itertools.groupby(folders, key=lambda f: f.path_display.count('/')):
+            while True:
+                chunk = list(itertools.islice(level, FOLDER_BATCH_CHUNK))
+                if not chunk:
+                    break
+                parent_ids = [self._get_folder_parent_id(folder) for folder in chunk]
+                found = self.google_drive_client.find_files_batch([(folder.name, parent_id) for folder, parent_id in zip(chunk, parent_ids)])
 
-            if folder_id:
-                if self.src_path:
-                    relative_folder_path = os.path.relpath(folder.path_display, self.src_path)
-                    migrated_path = os.path.join(self.dest_path or '/', relative_folder_path)
-                else:
-                    migrated_path = folder.path_display
+                errors = []
+                missing = []
+                for folder, parent_id, existing_folders in zip(chunk, parent_ids, found):
+                    if isinstance(existing_folders, Exception):
+                        errors.append(existing_folders)
+                    elif existing_folders:
+                        logging.info(f"Folder '{folder.name}' already exists. Using existing folder.")
+                        self._record_folder(folder, existing_folders[0]['id'])
+                    else:
+                        missing.append((folder, parent_id))
 
-                self.state['migrated_folders'][migrated_path] = folder_id
-                self.state['migrated_folders'][folder.path_display] = folder_id
+                created = self.google_drive_client.create_folders_batch([(folder.name, parent_id) for folder, parent_id in missing])
+                for (folder, parent_id), folder_id in zip(missing, created):
+                    if isinstance(folder_id, Exception):
+                        errors.append(folder_id)
+                    elif folder_id:
+                        self._record_folder(folder, folder_id)
+                        if self.drive_index is not None:
+                            self.drive_index.add(parent_id, {'id': folder_id, 'name': folder.name})
                 self._save_state()
+                if errors:
+                    raise errors[0]
+
+    def _get_folder_parent_id(self, folder):
+        """Returns the Google Drive ID of the folder a Dropbox folder is created in."""
+        parent_dropbox_path = os.path.dirname(folder.path_display)
+        if self.src_path and parent_dropbox_path.startswith(self.src_path):
+            relative_parent_path = os.path.relpath(parent_dropbox_path, self.src_path)
+            if relative_parent_path == '.':
+                parent_path = self.dest_path or '/'
+            else:
+                parent_path = os.path.join(self.dest_path or '/', relative_parent_path)
+        else:
+            parent_path = parent_dropbox_path
 
-    def _migrate_files(self, files, pbar, dest_folder_id=None, limit=None):
-        """Migrates files from Dropbox to Google Drive."""
+        parent_id = self.state['migrated_folders'].get(parent_path)
+
+        if parent_id is None:
+            if self.dest_path:
+                parent_id = self.state['migrated_folders'].get(self.dest_path)
+            elif parent_path == '/':
+                parent_id = self.state['migrated_folders'].get('/')
+        return parent_id
+
+    def _record_folder(self, folder, folder_id):
+        migrated_path = self._get_migrated_folder_path(folder.path_display)
+        self._record_state('folder', migrated_path, folder_id)
+        self._record_state('folder', folder.path_display, folder_id)
+
+    def _get_migrated_folder_path(self, dropbox_path):
+        """Returns the state key under which a migrated Dropbox folder is recorded."""
+        if self.src_path:
+            relative_folder_path = os.path.relpath(dropbox_path, self.src_path)
+            return os.path.join(self.dest_path or '/', relative_folder_path)
+        return dropbox_path
+
+    def _get_migrated_parent_path(self, dropbox_path):
+        """Returns the state key of the migrated folder a Dropbox file belongs in."""
+        parent_dropbox_path = os.path.dirname(dropbox_path)
+        if self.src_path:
+            relative_parent_path = os.path.relpath(parent_dropbox_path, self.src_path)
+            if relative_parent_path == '.':
+                return self.dest_path or '/'
+            return os.path.join(self.dest_path or '/', relative_parent_path)
+        return parent_dropbox_path
+
+    def _get_parent_folder_id(self, dropbox_path):
+        """Returns the ID of the Google Drive folder a Dropbox file belongs in."""
+        migrated_parent_path = self._get_migrated_parent_path(dropbox_path)
+        parent_folder_id = self.state['migrated_folders'].get(migrated_parent_path)
+
+        if parent_folder_id is None:
+            if self.dest_path:
+                parent_folder_id = self.state['migrated_folders'].get(self.dest_path)
+            elif migrated_parent_path == '/':
+                parent_folder_id = self.state['migrated_folders'].get('/')
+        return parent_folder_id
+
+    def _migrate_files(self, files, pbar, dest_folder_id=None, limit=None, conflict_action=None, listing=None):
+        """
+        Migrates files from Dropbox to Google Drive.
+        `conflict_action` resolves every conflict without asking, e.g. 'overwrite' for changed files.
+        With `zip_min_files` and the complete `listing` the files come from, folders of many small
+        files are downloaded as zip archives first, and their files are then transferred from the
+        archive the same way as any other file.
+        """
         migrated_count = 0
-        for file in files:
+        if self.zip_min_files is not None and listing is not None:
+            zip_folders, files = group_zip_folders(files, listing, self.zip_min_files, self.zip_max_file_size)
+            for folder_path, folder_files in zip_folders.items():
+                if limit is not None and migrated_count >= limit:
+                    logging.info(f"Reached migration limit of {limit} files.")
+                    return migrated_count
+                remaining = None if limit is None else limit - migrated_count
+                with tempfile.TemporaryDirectory(prefix='dropbox_migration_') as tmpdir:
+                    self._extract_zip_folder(folder_path, folder_files, tmpdir, pbar)
+                    try:
+                        migrated_count += self._transfer_files(folder_files, pbar, limit=remaining, conflict_action=conflict_action)
+                    finally:
+                        for file in folder_files:
+                            self.local_copies.pop(file.path_display, None)
+
+        remaining = None if limit is None else limit - migrated_count
+        return migrated_count + self._transfer_files(files, pbar, limit=remaining, conflict_action=conflict_action)
+
+    def _transfer_files(self, files, pbar, limit=None, conflict_action=None):
+        """Transfers files with the asyncio engine, on `transfer_workers` threads or one at a time."""
+        if self.async_engine is not None:
+            return self._migrate_files_async(self.scheduler.order(files), pbar, limit=limit, conflict_action=conflict_action)
+        if self.transfer_workers > 1:
+            return self._migrate_files_concurrently(files, pbar, limit=limit, conflict_action=conflict_action)
+
+        migrated_count = 0
+        for file in self.scheduler.order(files):
             try:
                 if limit is not None and migrated_count >= limit:
                     logging.info(f"Reached migration limit of {limit} files.")
                     break
 
-                if file.path_display not in self.state['migrated_files']:
+                if not self._is_migrated(file.path_display):
                     pbar.set_description(f"Downloading {file.name} ({file.size / 1e6:.2f} MB)")
-                    parent_dropbox_path = os.path.dirname(file.path_display)
-                    
-                    if self.src_path:
-                        relative_parent_path = os.path.relpath(parent_dropbox_path, self.src_path)
-                        if relative_parent_path == '.':
-                            migrated_parent_path = self.dest_path or '/'
-                        else:
-                            migrated_parent_path = os.path.join(self.dest_path or '/', relative_parent_path)
-                    else:
-                        migrated_parent_path = parent_dropbox_path
-
-                    parent_folder_id = self.state['migrated_folders'].get(migrated_parent_path)
-
-                    if parent_folder_id is None:
-                        if self.dest_path:
-                            parent_folder_id = self.state['migrated_folders'].get(self.dest_path)
-                        elif migrated_parent_path == '/':
-                            parent_folder_id = self.state['migrated_folders'].get('/')
-
-                    existing_files = self.google_drive_client.find_file(file.name, parent_id=parent_folder_id)
-                    
-                    original_name = file.name
-                    if existing_files:
-                        action = self.conflict_resolution_strategy or self._handle_file_conflict(file, parent_folder_id)
-                        if action == 'skip':
-                            if file.path_display not in self.state['skipped_files']:
-                                self.state['skipped_files'].append(file.path_display)
-                                self._save_state()
+                    plan = self._prepare_file(file, conflict_action)
+                    if plan is None:
+                        pbar.update(file.size)
+                        continue
+
+                    local_path = self._local_path(file)
+                    if self._transfer_file(file, plan, local_path, self.google_drive_client, pbar=pbar):
+                        migrated_count += 1
+                        pbar.update(file.size)
+            except Exception as e:
+                self._record_failure(file, e, pbar)
+        return migrated_count
+
+    def _extract_zip_folder(self, folder_path, files, directory, pbar):
+        """
+        Downloads a folder of small files as one zip archive and saves the files still to be
+        migrated into `directory`, where their transfers read them instead of downloading them.
+        Files the archive does not hold, or all of them if it cannot be downloaded, are downloaded on their own.
+        """
+        pending = {file.path_display.lower(): file for file in files if not self._is_migrated(file.path_display)}
+        if not pending:
+            return
+        pbar.set_description(f"Downloading {folder_path} as a zip archive ({len(pending)} files)")
+        archive_path = os.path.join(directory, 'folder.zip')
+        try:
+            self.dropbox_client.download_zip(folder_path, archive_path, team_folder_id=self.team_folder_id)
+            for index, (path, read) in enumerate(iter_zip_members(archive_path, folder_path)):
+                file = pending.pop(path, None)
+                if file is None:
+                    continue
+                local_copy = os.path.join(directory, str(index))
+                with open(local_copy, 'wb') as f:
+                    f.write(read())
+                self.local_copies[file.path_display] = local_copy
+        except Exception as e:
+            logging.warning(f"Could not download {folder_path} as a zip archive: {e}. Downloading its files one by one.")
+        finally:
+            if os.path.exists(archive_path):
+                os.remove(archive_path)
+
+    def _take_local_copy(self, file):
+        """Returns the content of a file extracted from a zip archive, once, or None if there is none."""
+        local_copy = self.local_copies.pop(file.path_display, None)
+        if local_copy is None:
+            return None
+        with open(local_copy, 'rb') as f:
+            return f.read()
+
+    def _migrate_files_concurrently(self, files, pbar, limit=None, conflict_action=None):
+        """
+        Migrates files on a pool of `transfer_workers` threads. Conflicts are resolved on the
+        calling thread, which may prompt the user, before a file is handed to a worker; the
+        workers download it to its own download path, upload it and record the result.
+        At most twice as many files as there are workers are queued at a time. With the
+        small-files-lane policy, small and large files are queued separately, each lane
+        limited to its share of the workers until the other lane runs out of files.
+        """
+        if self.scheduler.policy == SMALL_FILES_LANE:
+            small, large = self.scheduler.lanes(files)
+            small_slots, large_slots = self.scheduler.lane_slots(self.transfer_workers)
+            lanes = [(small, small_slots), (large, large_slots)]
+        else:
+            lanes = [(self.scheduler.order(files), self.transfer_workers * 2)]
+        lanes = [{'files': iter(lane_files), 'slots': slots, 'futures': set()} for lane_files, slots in lanes]
+
+        migrated_count = 0
+        in_flight = {}
+
+        def collect():
+            nonlocal migrated_count
+            migrated_count += self._collect_transfers(in_flight, pbar)
+            for lane in lanes:
+                lane['futures'].intersection_update(in_flight)
+
+        pbar.set_description(f"Migrating files ({self.transfer_workers} workers)")
+        with ThreadPoolExecutor(max_workers=self.transfer_workers, thread_name_prefix='transfer') as executor:
+            while lanes:
+                # Only queue as many files as the limit still allows; failed ones make room again.
+                while in_flight and limit is not None and migrated_count + len(in_flight) >= limit:
+                    collect()
+                if limit is not None and migrated_count >= limit:
+                    logging.info(f"Reached migration limit of {limit} files.")
+                    break
+
+                open_lanes = [lane for lane in lanes if len(lane['futures']) < lane['slots']]
+                if not open_lanes:
+                    collect()
+                    continue
+                lane = open_lanes[0]
+                file = next(lane['files'], None)
+                if file is None:
+                    lanes.remove(lane)
+                    if len(lanes) == 1:
+                        # The last lane left takes over the workers of the drained one.
+                        lanes[0]['slots'] = self.transfer_workers * 2
+                    continue
+
+                if self._is_migrated(file.path_display):
+                    continue
+                try:
+                    plan = self._prepare_file(file, conflict_action)
+                except Exception as e:
+                    self._record_failure(file, e, pbar)
+                    continue
+                if plan is None:
+                    pbar.update(file.size)
+                    continue
+
+                # The same path as a sequential run, so an interrupted ranged download resumes in any mode.
+                future = executor.submit(self._run_transfer, file, plan, self._local_path(file))
+                in_flight[future] = file
+                lane['futures'].add(future)
+
+            while in_flight:
+                collect()
+        return migrated_count
+
+    def _migrate_files_async(self, files, pbar, limit=None, conflict_action=None):
+        """
+        Migrates files with the asyncio transfer engine. Conflicts are resolved here and the
+        files are transferred in batches of ten times the engine's concurrency, each batch on a
+        thread of its own while the conflicts of the next one are resolved, with the state
+        recorded as each transfer finishes. Files too large to hold in memory are transferred
+        one at a time through the synchronous clients.
+        """
+        migrated_count = 0
+        count_lock = threading.Lock()
+        batch = []
+        plans = {}
+        batch_size = self.async_engine.concurrency * 10
+        running = None
+        running_size = 0
+
+        def on_done(file, file_id, error, checksums=None):
+            nonlocal migrated_count
+            plan = plans.pop(file.path_display)
+            if error is not None:
+                self._release_name(file, plan)
+                self._record_failure(file, error, pbar)
+            elif file_id:
+                if checksums is not None:
+                    self._record_state('checksum', file.path_display, checksums)
+                self._record_migrated(file, plan, file_id)
+                with count_lock:
+                    migrated_count += 1
+                pbar.update(file.size)
+            else:
+                self._release_name(file, plan)
+
+        def wait_for_batch():
+            nonlocal running, running_size
+            if running is not None:
+                future, running = running, None
+                running_size = 0
+                future.result()
+
+        def run_batch():
+            nonlocal running, running_size
+            wait_for_batch()
+            jobs = list(batch)
+            batch.clear()
+            plans.update((file.path_display, plan) for file, plan in jobs)
+            pbar.set_description(f"Transferring {len(jobs)} files")
+            running, running_size = runner.submit(self.async_engine.run, jobs, on_done, read_local=self._take_local_copy), len(jobs)
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='async-transfers') as runner:
+            try:
+                for file in files:
+                    # Only batch as many files as the limit still allows; failed ones make room again.
+                    if batch and limit is not None and migrated_count + running_size + len(batch) >= limit:
+                        run_batch()
+                        wait_for_batch()
+                    if limit is not None and migrated_count + running_size >= limit:
+                        wait_for_batch()
+                        if migrated_count >= limit:
+                            logging.info(f"Reached migration limit of {limit} files.")
+                            break
+
+                    if self._is_migrated(file.path_display):
+                        continue
+                    plan = None
+                    try:
+                        plan = self._prepare_file(file, conflict_action)
+                        if plan is None:
                             pbar.update(file.size)
                             continue
-                        elif action == 'rename':
-                            file.name = self._get_unique_name(original_name, parent_folder_id)
-                    
-                    sanitized_name = self._sanitize_filename(original_name)
-                    local_path = f"/tmp/{sanitized_name}"
-                    if self.dropbox_client.download_file(file.path_display, local_path, team_folder_id=self.team_folder_id):
-                        pbar.set_description(f"Uploading {original_name} ({file.size / 1e6:.2f} MB)")
-                        file_id = self.google_drive_client.upload_file(local_path, file.name, folder_id=parent_folder_id)
-                        if file_id:
-                            self.state['migrated_files'].append(file.path_display)
-                            self._save_state()
-                            migrated_count += 1
+                        if self.dedup and self._copy_duplicate(file, plan, self.google_drive_client):
+                            with count_lock:
+                                migrated_count += 1
                             pbar.update(file.size)
-                        os.remove(local_path)
+                            continue
+                        if file.size > self.async_engine.max_file_size:
+                            pbar.set_description(f"Downloading {file.name} ({file.size / 1e6:.2f} MB)")
+                            local_path = self._local_path(file)
+                            if self._transfer_file(file, plan, local_path, self.google_drive_client, pbar=pbar):
+                                with count_lock:
+                                    migrated_count += 1
+                                pbar.update(file.size)
+                            continue
+                    except Exception as e:
+                        if plan is not None:
+                            self._release_name(file, plan)
+                        self._record_failure(file, e, pbar)
+                        continue
+
+                    batch.append((file, plan))
+                    if len(batch) >= batch_size:
+                        run_batch()
+                if batch:
+                    run_batch()
+            finally:
+                wait_for_batch()
+        return migrated_count
+
+    def _collect_transfers(self, in_flight, pbar):
+        """Waits for at least one queued transfer to finish and returns how many of the finished ones succeeded."""
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        migrated_count = 0
+        for future in done:
+            file = in_flight.pop(future)
+            try:
+                if future.result():
+                    migrated_count += 1
+                    pbar.update(file.size)
             except Exception as e:
-                logging.error(f"Failed to migrate {file.path_display}: {e}")
-                self.failed_files.append(file.path_display)
-                pbar.update(file.size)
+                self._record_failure(file, e, pbar)
         return migrated_count
 
+    def _run_transfer(self, file, plan, local_path):
+        """Transfers a file on a worker thread, with that thread's own Google Drive client."""
+        drive_client = getattr(self._thread_local, 'google_drive_client', None)
+        if drive_client is None:
+            # The Drive API client's HTTP connection must not be shared between threads.
+            drive_client = self._thread_local.google_drive_client = GoogleDriveClient(self.google_credentials)
+            drive_client.limiter = self.drive_limiter
+        return self._transfer_file(file, plan, local_path, drive_client)
+
+    def _find_existing(self, name, parent_id):
+        """Returns the Drive files or folders named `name` in a folder, from the Drive index if there is one."""
+        if self.drive_index is not None:
+            return self.drive_index.find(name, parent_id)
+        return self.google_drive_client.find_file(name, parent_id=parent_id)
+
+    def _prepare_file(self, file, conflict_action=None):
+        """
+        Looks for a file with the same name in the destination folder and resolves the conflict.
+        Returns the (parent folder ID, upload name, ID of the file to replace) to transfer
+        the file with, or None if it is skipped.
+        A file being replaced by `--delta` updates the Drive file recorded for it; if none is
+        recorded, it is uploaded next to whatever has its name instead of overwriting it.
+        """
+        parent_folder_id = self._get_parent_folder_id(file.path_display)
+        if file.path_display in self.replacing:
+            file_id = self.state.get('file_ids', {}).get(file.path_display)
+            if file_id:
+                return parent_folder_id, file.name, file_id
+            conflict_action = 'rename'
+        existing_files = self._find_existing(file.name, parent_folder_id)
+
+        upload_name = file.name
+        replace_file_id = None
+        if existing_files:
+            action = conflict_action or self.conflict_resolution_strategy or self._handle_file_conflict(file, parent_folder_id)
+            if action == 'skip':
+                if not self._is_skipped(file.path_display):
+                    self._record_state('skipped_file', file.path_display)
+                    self._save_state()
+                return None
+            elif action == 'rename':
+                upload_name = self._get_unique_name(file.name, parent_folder_id)
+            elif action == 'overwrite':
+                replace_file_id = existing_files[0]['id']
+        return parent_folder_id, upload_name, replace_file_id
+
+    def _transfer_file(self, file, plan, local_path, drive_client, pbar=None):
+        """
+        Downloads a file to `local_path`, uploads it as planned by `_prepare_file` and records it.
+        Files below `small_file_threshold` bytes are kept in memory and uploaded with a single request,
+        and with `stream_transfers` the download is piped into the upload; neither uses `local_path`.
+        Uploads of files from `resumable_session_threshold` bytes on continue a saved upload session.
+        With a spool, the file is downloaded into the spool instead of `local_path`, and the copy is
+        kept for the next attempt if the transfer fails.
+        With `verify_integrity`, a transfer whose checksums do not match is made again, replacing
+        the content of the file it uploaded.
+        With `dedup`, a file whose content was already migrated is copied on the Drive side instead.
+        A renamed file that is not migrated gives back the name reserved for it.
+        Returns True if the file was migrated.
+        """
+        try:
+            migrated = (self.dedup and self._copy_duplicate(file, plan, drive_client)) or self._transfer_verified(file, plan, local_path, drive_client, pbar)
+        except Exception:
+            self._release_name(file, plan)
+            raise
+        if not migrated:
+            self._release_name(file, plan)
+        return migrated
+
+    def _transfer_verified(self, file, plan, local_path, drive_client, pbar=None):
+        """
+        Transfers a file, again as long as its checksums do not match, up to INTEGRITY_RETRIES times.
+        A resumed upload whose missing bytes Dropbox will not send on their own is started over.
+        """
+        for attempt in range(INTEGRITY_RETRIES):
+            try:
+                return self._attempt_transfer(file, plan, local_path, drive_client, pbar)
+            except RangeIgnoredError as e:
+                # Dropping the session makes the next attempt download and upload from the start.
+                logging.warning(f"{e} Transferring {file.path_display} from the beginning.")
+                self._record_state('upload_session', file.path_display, None)
+            except IntegrityError as e:
+                if attempt == INTEGRITY_RETRIES - 1:
+                    raise e
+                logging.warning(f"{e} Transferring it again.")
+                if e.file_id:
+                    plan = plan[:2] + (e.file_id,)
+
+    def _attempt_transfer(self, file, plan, local_path, drive_client, pbar=None):
+        parent_folder_id, upload_name, replace_file_id = plan
+        # Only bytes this attempt downloads from the start are hashed.
+        hasher = TransferHasher() if self.verify_integrity else None
+        # A copy extracted from a zip archive is only used once, so an attempt that fails downloads the file.
+        content = self._take_local_copy(file)
+        in_memory = content is not None or (self.small_file_threshold is not None and file.size < self.small_file_threshold)
+        session_uri, offset, file_id = None, 0, None
+        if not in_memory and self._keeps_upload_session(file):
+            session_uri, offset, file_id = self._resume_upload_session(file, drive_client)
+
+        if file_id:
+            logging.info(f"Upload of {file.path_display} had already completed.")
+            self._record_state('upload_session', file.path_display, None)
+        elif in_memory:
+            if content is None:
+                content = self.dropbox_client.download_bytes(file.path_display, team_folder_id=self.team_folder_id)
+            if hasher is not None:
+                hasher.update(content)
+                hasher.check_download(file)
+            if pbar is not None:
+                pbar.set_description(f"Uploading {file.name} ({file.size / 1e6:.2f} MB)")
+            file_id = self._verified_upload(file, hasher, drive_client.upload_bytes, content, upload_name, folder_id=parent_folder_id, replace_file_id=replace_file_id)
+        elif self.stream_transfers:
+            if pbar is not None:
+                pbar.set_description(f"Streaming {file.name} ({file.size / 1e6:.2f} MB)")
+            file_id = self._stream_file(file, upload_name, parent_folder_id, replace_file_id, drive_client, session_uri, offset,
+                                        hasher=None if offset else hasher)
+        elif self.spool is not None:
+            local_path = self.spool.acquire(file)
+            corrupt = False
+            try:
+                file_id = self._transfer_through_disk(file, plan, local_path, drive_client, session_uri, offset, pbar, hasher)
+            except IntegrityError:
+                corrupt = True
+                raise
+            finally:
+                self.spool.release(file, keep=not file_id and not corrupt)
+        else:
+            file_id = self._transfer_through_disk(file, plan, local_path, drive_client, session_uri, offset, pbar, hasher)
+            if file_id is False:
+                return False
+            os.remove(local_path)
+        if file_id:
+            self._record_migrated(file, plan, file_id)
+        return bool(file_id)
+
+    def _record_migrated(self, file, plan, file_id):
+        """Records a migrated file, indexing the Drive file that now holds its content."""
+        parent_folder_id, upload_name, replace_file_id = plan
+        self._record_state('migrated_file', file.path_display, file_id)
+        self._record_content(file, file_id)
+        if self.drive_index is not None:
+            self.drive_index.add(parent_folder_id, {'id': file_id, 'name': upload_name})
+        self._save_state()
+
+    def _release_name(self, file, plan):
+        """Gives back the name reserved for a renamed file that was not migrated, so it can be handed out again."""
+        parent_folder_id, upload_name, replace_file_id = plan
+        if upload_name == file.name:
+            return
+        if self.drive_index is not None:
+            self.drive_index.release(parent_folder_id, upload_name)
+        else:
+            self.reserved_names.discard((parent_folder_id, upload_name))
+
+    def _copy_duplicate(self, file, plan, drive_client):
+        """
+        Creates a file as a server-side copy of the Drive file already holding the same content.
+        Returns True if the file was copied; files replacing another one are always transferred.
+        """
+        parent_folder_id, upload_name, replace_file_id = plan
+        source_id = self.state.get('content_files', {}).get(file.content_hash) if file.content_hash else None
+        if source_id is None or replace_file_id:
+            return False
+        try:
+            file_id = drive_client.copy_file(source_id, upload_name, folder_id=parent_folder_id)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise e
+            logging.info(f"The Drive file holding the content of {file.path_display} no longer exists. Transferring it.")
+            self._record_state('content_file', file.content_hash, None)
+            return False
+        if not file_id:
+            return False
+        logging.info(f"Copied {file.path_display} from the file with the same content.")
+        self._record_state('migrated_file', file.path_display, file_id)
+        if self.drive_index is not None:
+            self.drive_index.add(parent_folder_id, {'id': file_id, 'name': upload_name})
+        self._save_state()
+        return True
+
+    def _record_content(self, file, file_id):
+        """Indexes the Drive file holding a file's content, so later files with the same content are copied from it."""
+        if not self.dedup or not file.content_hash:
+            return
+        previous_hash = self.content_file_index.get(file_id)
+        if previous_hash and previous_hash != file.content_hash:
+            # The file's content was replaced; it no longer holds what it was indexed under.
+            self._record_state('content_file', previous_hash, None)
+        self._record_state('content_file', file.content_hash, file_id)
+
+    def _transfer_through_disk(self, file, plan, local_path, drive_client, session_uri=None, offset=0, pbar=None, hasher=None):
+        """
+        Downloads a file to `local_path`, unless a finished copy is already there, and uploads it.
+        Returns the uploaded file's ID, or False if the download failed.
+        """
+        parent_folder_id, upload_name, replace_file_id = plan
+        if (session_uri or self.spool is not None) and self._has_complete_copy(file, local_path):
+            logging.info(f"Reusing the downloaded copy of {file.path_display} in {local_path}.")
+            hasher = None
+        elif session_uri and offset:
+            self._download_from_offset(file, local_path, offset)
+            hasher = None
+        else:
+            if self._downloads_in_ranges(file):
+                hasher = None
+            if not self._download_to_file(file, local_path, hasher):
+                return False
+            if hasher is not None:
+                hasher.check_download(file)
+        if pbar is not None:
+            pbar.set_description(f"Uploading {file.name} ({file.size / 1e6:.2f} MB)")
+        if self._keeps_upload_session(file):
+            media = MediaFileUpload(local_path, resumable=True)
+            return self._upload_media(file, media, upload_name, parent_folder_id, replace_file_id, drive_client, session_uri, offset, hasher)
+        elif replace_file_id:
+            return self._verified_upload(file, hasher, drive_client.update_file, replace_file_id, local_path)
+        else:
+            return self._verified_upload(file, hasher, drive_client.upload_file, local_path, upload_name, folder_id=parent_folder_id)
+
+    def _verified_upload(self, file, hasher, upload, *args, **kwargs):
+        """
+        Calls an upload method of GoogleDriveClient. If `hasher` has seen the file's bytes, checks
+        them against the listing's content hash and the MD5 Drive reports, and records both checksums.
+        """
+        if hasher is None:
+            return upload(*args, **kwargs)
+        file_id, drive_md5 = upload(*args, with_md5=True, **kwargs)
+        hasher.check_download(file, file_id)
+        hasher.check_upload(file, file_id, drive_md5)
+        self._record_state('checksum', file.path_display, {'content_hash': hasher.content_hash(), 'md5': drive_md5})
+        return file_id
+
+    def _downloads_in_ranges(self, file):
+        return self.ranged_download_threshold is not None and file.size >= self.ranged_download_threshold
+
+    def _download_to_file(self, file, local_path, hasher=None):
+        """Downloads a file to `local_path`, in concurrent byte ranges if it is at least `ranged_download_threshold` bytes."""
+        if self._downloads_in_ranges(file):
+            return self.dropbox_client.download_file_ranged(file.path_display, local_path, team_folder_id=self.team_folder_id, max_workers=self.download_ranges)
+        if hasher is not None:
+            return self.dropbox_client.download_file(file.path_display, local_path, team_folder_id=self.team_folder_id, hasher=hasher)
+        return self.dropbox_client.download_file(file.path_display, local_path, team_folder_id=self.team_folder_id)
+
+    def _local_path(self, file):
+        """Returns the temporary path a file is downloaded to, named after its Dropbox path so no other file's copy is ever found there."""
+        path_hash = hashlib.sha1(file.path_display.lower().encode()).hexdigest()[:16]
+        return f"/tmp/{path_hash}_{self._sanitize_filename(file.name)}"
+
+    def _has_complete_copy(self, file, local_path):
+        """
+        Whether `local_path` holds a finished download of the file, with the content hash of the
+        listing; an unfinished ranged download is preallocated to full size.
+        """
+        if not file.content_hash or not os.path.exists(local_path) or os.path.getsize(local_path) != file.size or os.path.exists(local_path + RANGES_SUFFIX):
+            return False
+        hasher = ContentHasher()
+        with open(local_path, 'rb') as f:
+            for block in iter(lambda: f.read(CONTENT_HASH_BLOCK_SIZE), b''):
+                hasher.update(block)
+        if hasher.hexdigest() != file.content_hash:
+            logging.warning(f"The copy of {file.path_display} in {local_path} does not match its content hash. Downloading it again.")
+            return False
+        return True
+
+    def _stream_file(self, file, upload_name, parent_folder_id, replace_file_id, drive_client, session_uri=None, offset=0, hasher=None):
+        """Pipes a Dropbox download into a Google Drive resumable upload through a bounded memory buffer."""
+        metadata, response = self.dropbox_client.open_download(file.path_display, team_folder_id=self.team_folder_id, offset=offset)
+        blocks = response.iter_content(DOWNLOAD_READ_SIZE)
+        if hasher is not None:
+            blocks = hasher.wrap(blocks)
+        media = StreamingMediaUpload(blocks, metadata.size, offset=offset)
+        try:
+            return self._upload_media(file, media, upload_name, parent_folder_id, replace_file_id, drive_client, session_uri, offset, hasher)
+        finally:
+            response.close()
+            media.close()
+
+    def _keeps_upload_session(self, file):
+        return self.resumable_session_threshold is not None and file.size >= self.resumable_session_threshold
+
+    def _resume_upload_session(self, file, drive_client):
+        """
+        Looks up the saved upload session of a file and asks Drive how far it got. Returns the
+        session URI, the offset to continue from and, if the upload completed, the file ID.
+        A session of a file that has changed since, or that Drive has expired, is dropped.
+        """
+        session = self.state.get('upload_sessions', {}).get(file.path_display)
+        if session is None:
+            return None, 0, None
+        if session['size'] != file.size or session['content_hash'] != file.content_hash:
+            logging.info(f"{file.path_display} changed since its upload started. Uploading it from the beginning.")
+            self._record_state('upload_session', file.path_display, None)
+            return None, 0, None
+        offset, file_id = drive_client.query_upload_session(session['uri'], file.size)
+        if offset is None:
+            self._record_state('upload_session', file.path_display, None)
+            return None, 0, None
+        logging.info(f"Resuming upload of {file.path_display} at byte {offset} of {file.size}.")
+        return session['uri'], offset, file_id
+
+    def _upload_media(self, file, media, upload_name, parent_folder_id, replace_file_id, drive_client, session_uri=None, offset=0, hasher=None):
+        """Uploads resumable media, saving the upload session after every chunk if the file is large enough."""
+        on_progress = None
+        if self._keeps_upload_session(file):
+            def on_progress(uri, progress):
+                self._record_state('upload_session', file.path_display, {'uri': uri, 'offset': progress, 'size': file.size, 'content_hash': file.content_hash})
+                self._save_state()
+        file_id = self._verified_upload(file, hasher, drive_client.upload_media, media, upload_name, folder_id=parent_folder_id, replace_file_id=replace_file_id,
+                                        session_uri=session_uri, offset=offset, on_progress=on_progress)
+        if file_id and file.path_display in self.state.get('upload_sessions', {}):
+            self._record_state('upload_session', file.path_display, None)
+        return file_id
+
+    def _download_from_offset(self, file, local_path, offset):
+        """Downloads the part of a file an interrupted upload still needs into `local_path`, at its position in the file."""
+        _, response = self.dropbox_client.open_download(file.path_display, team_folder_id=self.team_folder_id, offset=offset)
+        try:
+            with open(local_path, 'wb') as f:
+                f.seek(offset)
+                for block in response.iter_content(DOWNLOAD_READ_SIZE):
+                    f.write(block)
+        finally:
+            response.close()
+
+    def _record_failure(self, file, error, pbar):
+        logging.error(f"Failed to migrate {file.path_display}: {error}")
+        self.failed_files.append(file.path_display)
+        self._record_state('failed_file', file.path_display, str(error))
+        self._save_state()
+        pbar.update(file.size)
+
     def _handle_file_conflict(self, file, parent_folder_id):
         """Prompts the user to resolve a file conflict."""
         if self.conflict_resolution_strategy:
@@ -329,7 +1473,7 @@ class Migration:
                     self.conflict_resolution_strategy = action
                 
                 if action == 'skip':
-                    self.state['skipped_files'].append(file.path_display)
+                    self._record_state('skipped_file', file.path_display)
                     self._save_state()
 
                 return action
@@ -338,13 +1482,19 @@ class Migration:
     def list_source_directory(self):
         """Lists the contents of the source directory."""
         logging.info(f"Listing contents of Dropbox path: '{self.src_path or '/'}'")
-        items = self.dropbox_client.list_files_and_folders(path=self.src_path or '', recursive=False, team_folder_id=self.team_folder_id)
+        snapshot = self._load_fresh_snapshot() if self.listing_cache is not None else None
+        if snapshot is not None:
+            logging.info("Serving the listing from the listing snapshot.")
+            parent = (self.src_path or '/').rstrip('/').lower() or '/'
+            items = [entry for entry in snapshot.entries if os.path.dirname(entry.path_display).lower() == parent]
+        else:
+            items = to_entries(self.dropbox_client.list_files_and_folders(path=self.src_path or '', recursive=False, team_folder_id=self.team_folder_id))
         if not items:
             print("No items found in this directory.")
             return
         
         for item in items:
-            if isinstance(item, dropbox.files.FolderMetadata):
+            if item.is_folder:
                 print(f"./{item.name}/")
             else:
                 print(f"./{item.name}")
@@ -362,11 +1512,20 @@ class Migration:
             print(f"- {folder.name} (ID: {folder.team_folder_id})")
 
     def _get_unique_name(self, original_name, parent_folder_id):
-        """Generates a unique file name if a conflict exists."""
+        """
+        Generates a unique file name if a conflict exists and reserves it until the file is
+        uploaded. With the Drive index the name is found in memory, and the reservation is kept
+        in the index, shared by all threads under its lock; otherwise each candidate is searched for in Drive.
+        """
+        if self.drive_index is not None:
+            return self.drive_index.reserve_unique_name(original_name, parent_folder_id)
         name, ext = os.path.splitext(original_name)
         counter = 1
         new_name = f"{name} ({counter}){ext}"
-        while self.google_drive_client.find_file(new_name, parent_id=parent_folder_id):
+        while (parent_folder_id, new_name) in self.reserved_names or self.google_drive_client.find_file(new_name, parent_id=parent_folder_id):
             counter += 1
             new_name = f"{name} ({counter}){ext}"
+        # Only the calling thread, which resolves every conflict, reserves names here; other threads only
+        # give them back, so the check and the reservation cannot interleave with another reservation.
+        self.reserved_names.add((parent_folder_id, new_name))
         return new_name
\ No newline at end of file
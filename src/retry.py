@@ -2,18 +2,26 @@ import time
 import random
 import logging
 from functools import wraps
+from src.concurrency import AIMDLimiter
 
 def retry_on_exception(exception, max_retries=5, initial_delay=1, backoff_factor=2, should_retry=None):
     """
     A decorator to retry a function call on a specific exception.
+    If the decorated method's object has a `limiter`, every attempt runs in one of its slots.
     """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
             delay = initial_delay
+            limiter = getattr(args[0], 'limiter', None) if args else None
+            if not isinstance(limiter, AIMDLimiter):
+                limiter = None
             for i in range(max_retries):
                 try:
-                    return func(*args, **kwargs)
+                    if limiter is None:
+                        return func(*args, **kwargs)
+                    with limiter.slot():
+                        return func(*args, **kwargs)
                 except exception as e:
                     if i == max_retries - 1:
                         logging.error(f"Final attempt failed. Exception: {e}")
@@ -0,0 +1,59 @@
+LISTING = 'listing'
+SIZE_BALANCED = 'size-balanced'
+RECENT_FIRST = 'recent-first'
+SMALL_FILES_LANE = 'small-files-lane'
+POLICIES = (LISTING, SIZE_BALANCED, RECENT_FIRST, SMALL_FILES_LANE)
+DEFAULT_SMALL_FILE_SIZE = 16 * 1024 * 1024
+
+class TransferScheduler:
+    """
+    Decides the order in which pending files are transferred.
+
+    - `listing` keeps the order of the Dropbox listing.
+    - `size-balanced` alternates between the largest and the smallest remaining file, so large
+      transfers are always mixed with small ones.
+    - `recent-first` transfers the most recently modified files first.
+    - `small-files-lane` transfers files below `small_file_size` in a lane of their own: with
+      several workers, part of them only take small files; with one, small files go first.
+    """
+    def __init__(self, policy=LISTING, small_file_size=DEFAULT_SMALL_FILE_SIZE):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown transfer policy: {policy}")
+        self.policy = policy
+        self.small_file_size = small_file_size
+
+    def order(self, files):
+        """Returns the files in the order they should be transferred by a single worker."""
+        if self.policy == LISTING:
+            return files
+        files = list(files)
+        if self.policy == SIZE_BALANCED:
+            return self._interleave_by_size(files)
+        if self.policy == RECENT_FIRST:
+            return sorted(files, key=lambda f: f.server_modified or 0, reverse=True)
+        small, large = self.lanes(files)
+        return small + large
+
+    def lanes(self, files):
+        """Splits the files into the small-file lane and the large-file lane, keeping their order."""
+        small, large = [], []
+        for file in files:
+            (small if file.size < self.small_file_size else large).append(file)
+        return small, large
+
+    def lane_slots(self, workers):
+        """Returns how many of `workers` serve the small-file lane and how many the large-file lane."""
+        small = max(1, workers // 2)
+        return small, max(1, workers - small)
+
+    def _interleave_by_size(self, files):
+        by_size = sorted(files, key=lambda f: f.size, reverse=True)
+        ordered = []
+        low, high = 0, len(by_size) - 1
+        while low <= high:
+            ordered.append(by_size[low])
+            if low != high:
+                ordered.append(by_size[high])
+            low += 1
+            high -= 1
+        return ordered
@@ -0,0 +1,111 @@
+import os
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from src.dropbox_client import RANGES_SUFFIX
+
+class SpoolFullError(OSError):
+    """A file does not fit in the free space of the disk holding the spool directory."""
+
+class Spool:
+    """
+    A directory holding downloaded files until they are uploaded, with a byte budget.
+
+    Files are stored under their Dropbox content hash, so a file whose upload failed is kept
+    and a later attempt uploads the local copy instead of downloading it again. A download
+    only starts once its size fits in the budget: copies no transfer is using are evicted,
+    least recently used first, and otherwise the download waits for running transfers to
+    release their space. A file larger than the whole budget is admitted once the spool is
+    otherwise empty. Copies are deleted as soon as their file is migrated.
+    """
+    def __init__(self, directory, budget=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.budget = budget
+        self._condition = threading.Condition()
+        # Content key -> size of every copy in the spool, least recently used first.
+        self._entries = OrderedDict()
+        self._in_use = set()
+        self._waiting = {}
+        self._used = 0
+        self._load_existing()
+
+    def _load_existing(self):
+        """Picks up the copies kept by an earlier run."""
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name.endswith(RANGES_SUFFIX) or not os.path.isfile(path):
+                continue
+            self._entries[name] = os.path.getsize(path)
+            self._used += self._entries[name]
+        if self._entries:
+            logging.info(f"Found {len(self._entries)} spooled files ({self._used / 1e6:.2f} MB) in {self.directory}.")
+
+    def key(self, file):
+        """Returns the name a file's content is spooled under."""
+        if file.content_hash:
+            return file.content_hash
+        return 'path-' + hashlib.sha256(file.path_display.encode('utf-8')).hexdigest()
+
+    def path(self, file):
+        return os.path.join(self.directory, self.key(file))
+
+    def acquire(self, file):
+        """
+        Reserves space for a file and returns the path to download it to, which may already hold
+        a copy from an earlier attempt. Blocks while another transfer uses the same content or
+        until the budget has room for it.
+        """
+        key = self.key(file)
+        with self._condition:
+            self._waiting[key] = self._waiting.get(key, 0) + 1
+            try:
+                self._condition.wait_for(lambda: key not in self._in_use and self._make_room(key, file.size))
+            finally:
+                self._waiting[key] -= 1
+                if not self._waiting[key]:
+                    del self._waiting[key]
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._used -= self._entries[key]
+            else:
+                free = shutil.disk_usage(self.directory).free
+                if file.size > free:
+                    raise SpoolFullError(f"{file.path_display} needs {file.size / 1e6:.2f} MB but only {free / 1e6:.2f} MB are free in {self.directory}.")
+            self._entries[key] = file.size
+            self._used += file.size
+            self._in_use.add(key)
+        return os.path.join(self.directory, key)
+
+    def _make_room(self, key, size):
+        """Evicts unused copies until `size` more bytes fit in the budget. Returns whether they do."""
+        if self.budget is None:
+            return True
+        needed = size - self._entries.get(key, 0)
+        for idle_key in [k for k in self._entries if k != key and k not in self._in_use]:
+            if self._used + needed <= self.budget:
+                break
+            self._remove(idle_key)
+        return self._used + needed <= self.budget or not self._in_use
+
+    def release(self, file, keep=False):
+        """
+        Ends a transfer's use of its copy. With `keep` the copy stays for a later attempt,
+        otherwise it is deleted unless another transfer is waiting for the same content.
+        """
+        key = self.key(file)
+        with self._condition:
+            self._in_use.discard(key)
+            if not keep and not self._waiting.get(key):
+                self._remove(key)
+            self._condition.notify_all()
+
+    def _remove(self, key):
+        path = os.path.join(self.directory, key)
+        for stale in (path, path + RANGES_SUFFIX):
+            if os.path.exists(stale):
+                os.remove(stale)
+        self._used -= self._entries.pop(key, 0)
+        logging.debug(f"Evicted {path} from the spool")
@@ -0,0 +1,358 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+import time
+
+def empty_state():
+    """Returns the state of a migration that has not started yet."""
+    return {'migrated_files': [], 'skipped_files': [], 'failed_files': [], 'migrated_folders': {'/': None}, 'skipped_folders': []}
+
+def build_index(state):
+    """
+    Returns the indexes `apply_event` keeps up to date over a state: the contents of each
+    list key as a set, and the content hash each deduplication source file is recorded under.
+    """
+    index = {key: set(state.get(key, [])) for key in ('migrated_files', 'skipped_files', 'failed_files', 'skipped_folders')}
+    index['content_file_ids'] = {file_id: content_hash for content_hash, file_id in state.get('content_files', {}).items()}
+    return index
+
+def apply_event(state, event, path, value=None, index=None):
+    """
+    Applies a single state event to a state dictionary. Events are idempotent.
+
+    `index` is the `build_index` of the state, so replaying a long journal or recording
+    events during a migration does not scan the lists.
+    """
+    if index is None:
+        index = build_index(state)
+
+    def add(key):
+        if path not in index[key]:
+            index[key].add(path)
+            state.setdefault(key, []).append(path)
+
+    if event == 'migrated_file':
+        add('migrated_files')
+        if path in index['failed_files']:
+            index['failed_files'].discard(path)
+            state['failed_files'].remove(path)
+        if value is not None:
+            # The ID of the Drive file holding it, so it is only ever replaced or trashed by that ID.
+            state.setdefault('file_ids', {})[path] = value
+    elif event == 'skipped_file':
+        add('skipped_files')
+    elif event == 'failed_file':
+        add('failed_files')
+    elif event == 'folder':
+        state['migrated_folders'][path] = value
+    elif event == 'skipped_folder':
+        add('skipped_folders')
+    elif event == 'removed_file':
+        for key in ('migrated_files', 'skipped_files'):
+            if path in index[key]:
+                index[key].discard(path)
+                state[key].remove(path)
+        state.setdefault('file_ids', {}).pop(path, None)
+    elif event == 'removed_folder':
+        state['migrated_folders'].pop(path, None)
+    elif event == 'cursor':
+        state.setdefault('list_cursors', {})[path] = value
+    elif event == 'upload_session':
+        if value is None:
+            state.setdefault('upload_sessions', {}).pop(path, None)
+        else:
+            state.setdefault('upload_sessions', {})[path] = value
+    elif event == 'checksum':
+        state.setdefault('checksums', {})[path] = value
+    elif event == 'content_file':
+        content_files = state.setdefault('content_files', {})
+        index['content_file_ids'].pop(content_files.pop(path, None), None)
+        if value is not None:
+            content_files[path] = value
+            index['content_file_ids'][value] = path
+    else:
+        raise ValueError(f"Unknown state event: {event}")
+
+class JsonStateStore:
+    """
+    Keeps the migration state in a single JSON file that is rewritten on every save.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """Loads the migration state from the JSON file."""
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        return empty_state()
+
+    def record(self, event, path, value=None):
+        """The JSON store persists the whole state on save, so single events need no work."""
+        pass
+
+    def save(self, state):
+        """Saves the migration state to the JSON file."""
+        with open(self.path, 'w') as f:
+            json.dump(state, f, indent=4)
+
+    def close(self):
+        pass
+
+class SQLiteStateStore:
+    """
+    Keeps the migration state in a SQLite database so that every event costs a
+    single row write instead of a rewrite of the whole state.
+
+    An existing JSON state file is imported the first time the database is opened.
+    """
+    def __init__(self, path, json_path=None):
+        self.path = path
+        self.json_path = json_path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, status TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS file_ids (path TEXT PRIMARY KEY, file_id TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS folders (path TEXT PRIMARY KEY, folder_id TEXT, skipped INTEGER NOT NULL DEFAULT 0);
+            CREATE TABLE IF NOT EXISTS failures (path TEXT PRIMARY KEY, error TEXT);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS upload_sessions (path TEXT PRIMARY KEY, session TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS checksums (path TEXT PRIMARY KEY, content_hash TEXT, md5 TEXT);
+            CREATE TABLE IF NOT EXISTS content_files (content_hash TEXT PRIMARY KEY, file_id TEXT NOT NULL);
+            """
+        )
+        self.conn.commit()
+
+    def _get_meta(self, key):
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _import_json(self):
+        """Imports a legacy JSON state file into the database, once."""
+        if self._get_meta('json_imported') or not self.json_path or not os.path.exists(self.json_path):
+            return
+        logging.info(f"Importing migration state from {self.json_path} into {self.path}")
+        with open(self.json_path, 'r') as f:
+            state = json.load(f)
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO files (path, status) VALUES (?, 'migrated')", ((p,) for p in state.get('migrated_files', [])))
+            self.conn.executemany("INSERT OR IGNORE INTO files (path, status) VALUES (?, 'skipped')", ((p,) for p in state.get('skipped_files', [])))
+            self.conn.executemany('INSERT OR REPLACE INTO file_ids (path, file_id) VALUES (?, ?)', state.get('file_ids', {}).items())
+            self.conn.executemany('INSERT OR REPLACE INTO failures (path, error) VALUES (?, NULL)', ((p,) for p in state.get('failed_files', [])))
+            self.conn.executemany('INSERT OR REPLACE INTO folders (path, folder_id, skipped) VALUES (?, ?, 0)', state.get('migrated_folders', {}).items())
+            self.conn.executemany('INSERT OR REPLACE INTO folders (path, folder_id, skipped) VALUES (?, NULL, 1)', ((p,) for p in state.get('skipped_folders', [])))
+            self.conn.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (('cursor:' + key, value) for key, value in state.get('list_cursors', {}).items()))
+            self.conn.executemany('INSERT OR REPLACE INTO upload_sessions (path, session) VALUES (?, ?)', ((key, json.dumps(value)) for key, value in state.get('upload_sessions', {}).items()))
+            self.conn.executemany('INSERT OR REPLACE INTO checksums (path, content_hash, md5) VALUES (?, ?, ?)', ((key, value['content_hash'], value['md5']) for key, value in state.get('checksums', {}).items()))
+            self.conn.executemany('INSERT OR REPLACE INTO content_files (content_hash, file_id) VALUES (?, ?)', state.get('content_files', {}).items())
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_imported', ?)", (self.json_path,))
+
+    def load(self):
+        """Loads the migration state from the database."""
+        self._import_json()
+        state = empty_state()
+        for path, status in self.conn.execute('SELECT path, status FROM files'):
+            if status == 'migrated':
+                state['migrated_files'].append(path)
+            else:
+                state['skipped_files'].append(path)
+        for path, folder_id, skipped in self.conn.execute('SELECT path, folder_id, skipped FROM folders'):
+            if skipped:
+                state['skipped_folders'].append(path)
+            else:
+                state['migrated_folders'][path] = folder_id
+        state['failed_files'] = [path for (path,) in self.conn.execute('SELECT path FROM failures')]
+        state['file_ids'] = dict(self.conn.execute('SELECT path, file_id FROM file_ids'))
+        state['list_cursors'] = {key[len('cursor:'):]: value for key, value in self.conn.execute("SELECT key, value FROM meta WHERE key LIKE 'cursor:%'")}
+        state['upload_sessions'] = {path: json.loads(session) for path, session in self.conn.execute('SELECT path, session FROM upload_sessions')}
+        state['checksums'] = {path: {'content_hash': content_hash, 'md5': md5} for path, content_hash, md5 in self.conn.execute('SELECT path, content_hash, md5 FROM checksums')}
+        state['content_files'] = dict(self.conn.execute('SELECT content_hash, file_id FROM content_files'))
+        return state
+
+    def record(self, event, path, value=None):
+        """Writes a single state event. It becomes durable on the next save."""
+        if event == 'migrated_file':
+            self.conn.execute("INSERT OR REPLACE INTO files (path, status) VALUES (?, 'migrated')", (path,))
+            self.conn.execute('DELETE FROM failures WHERE path = ?', (path,))
+            if value is not None:
+                self.conn.execute('INSERT OR REPLACE INTO file_ids (path, file_id) VALUES (?, ?)', (path, value))
+        elif event == 'skipped_file':
+            self.conn.execute("INSERT OR IGNORE INTO files (path, status) VALUES (?, 'skipped')", (path,))
+        elif event == 'failed_file':
+            self.conn.execute('INSERT OR REPLACE INTO failures (path, error) VALUES (?, ?)', (path, value))
+        elif event == 'folder':
+            self.conn.execute('INSERT OR REPLACE INTO folders (path, folder_id, skipped) VALUES (?, ?, 0)', (path, value))
+        elif event == 'skipped_folder':
+            self.conn.execute('INSERT OR IGNORE INTO folders (path, folder_id, skipped) VALUES (?, NULL, 1)', (path,))
+        elif event == 'removed_file':
+            self.conn.execute('DELETE FROM files WHERE path = ?', (path,))
+            self.conn.execute('DELETE FROM file_ids WHERE path = ?', (path,))
+        elif event == 'removed_folder':
+            self.conn.execute('DELETE FROM folders WHERE path = ? AND skipped = 0', (path,))
+        elif event == 'cursor':
+            self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', ('cursor:' + path, value))
+        elif event == 'upload_session':
+            if value is None:
+                self.conn.execute('DELETE FROM upload_sessions WHERE path = ?', (path,))
+            else:
+                self.conn.execute('INSERT OR REPLACE INTO upload_sessions (path, session) VALUES (?, ?)', (path, json.dumps(value)))
+        elif event == 'checksum':
+            self.conn.execute('INSERT OR REPLACE INTO checksums (path, content_hash, md5) VALUES (?, ?, ?)', (path, value['content_hash'], value['md5']))
+        elif event == 'content_file':
+            if value is None:
+                self.conn.execute('DELETE FROM content_files WHERE content_hash = ?', (path,))
+            else:
+                self.conn.execute('INSERT OR REPLACE INTO content_files (content_hash, file_id) VALUES (?, ?)', (path, value))
+        else:
+            raise ValueError(f"Unknown state event: {event}")
+
+    def save(self, state):
+        """Commits the events recorded since the last save."""
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+class JournalStateStore:
+    """
+    Appends every state event to a journal next to a JSON snapshot of the state.
+
+    Events are buffered and written with a single fsync once `commit_events` events
+    are pending or `commit_interval` seconds have passed, so a crash loses at most
+    that many recent events. Every `compact_events` events the journal is folded
+    into the snapshot on a background thread.
+    """
+    def __init__(self, snapshot_path, commit_events=100, commit_interval=5.0, compact_events=100000):
+        self.snapshot_path = snapshot_path
+        self.journal_path = snapshot_path + '.journal'
+        self.compacting_path = snapshot_path + '.journal.compacting'
+        self.commit_events = commit_events
+        self.commit_interval = commit_interval
+        self.compact_events = compact_events
+        self.pending = []
+        self.last_commit = time.monotonic()
+        self.events_since_compaction = 0
+        self.compaction_thread = None
+        self.journal = None
+
+    def _replay(self, state, index, path):
+        """
+        Applies the events of a journal file to the state, ignoring a torn last line.
+        Returns the length of the journal up to the end of its last complete entry.
+        """
+        complete = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError(line)
+                    event, event_path, value = json.loads(line)
+                except ValueError:
+                    logging.warning(f"Ignoring incomplete journal entry in {path}")
+                    break
+                apply_event(state, event, event_path, value, index)
+                self.events_since_compaction += 1
+                complete += len(line)
+        return complete
+
+    def load(self):
+        """Loads the snapshot and replays any journal written after it."""
+        state = JsonStateStore(self.snapshot_path).load()
+        state.setdefault('failed_files', [])
+        index = build_index(state)
+        complete = {}
+        for path in (self.compacting_path, self.journal_path):
+            if os.path.exists(path):
+                complete[path] = self._replay(state, index, path)
+        if os.path.exists(self.compacting_path):
+            # A compaction was interrupted; keep its events in front of the live journal.
+            tmp_path = self.journal_path + '.tmp'
+            with open(tmp_path, 'wb') as out:
+                for path, length in complete.items():
+                    with open(path, 'rb') as f:
+                        out.write(f.read(length))
+            os.replace(tmp_path, self.journal_path)
+            os.remove(self.compacting_path)
+        elif self.journal_path in complete and os.path.getsize(self.journal_path) > complete[self.journal_path]:
+            # Drop a torn last line so new events are not appended onto it.
+            os.truncate(self.journal_path, complete[self.journal_path])
+        self.journal = open(self.journal_path, 'a')
+        return state
+
+    def record(self, event, path, value=None):
+        """Buffers a state event for the next group commit."""
+        self.pending.append(json.dumps([event, path, value]) + '\n')
+
+    def _commit(self):
+        if not self.pending:
+            return
+        if self.journal is None:
+            self.journal = open(self.journal_path, 'a')
+        self.journal.write(''.join(self.pending))
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.events_since_compaction += len(self.pending)
+        self.pending = []
+        self.last_commit = time.monotonic()
+
+    def save(self, state):
+        """Group-commits the buffered events and starts a compaction when the journal is long."""
+        if len(self.pending) >= self.commit_events or time.monotonic() - self.last_commit >= self.commit_interval:
+            self._commit()
+            if self.events_since_compaction >= self.compact_events:
+                self._start_compaction(state)
+
+    def _start_compaction(self, state):
+        if self.compaction_thread is not None and self.compaction_thread.is_alive():
+            return
+        if os.path.exists(self.compacting_path):
+            # A previous compaction failed; its events are only in that file until the next load.
+            return
+        snapshot = {key: (value.copy() if isinstance(value, (dict, list)) else value) for key, value in state.items()}
+        self.journal.close()
+        os.replace(self.journal_path, self.compacting_path)
+        self.journal = open(self.journal_path, 'a')
+        self.events_since_compaction = 0
+        self.compaction_thread = threading.Thread(target=self._compact, args=(snapshot,), daemon=True)
+        self.compaction_thread.start()
+
+    def _compact(self, snapshot):
+        """Writes a new snapshot and drops the journal it supersedes."""
+        try:
+            tmp_path = self.snapshot_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            os.remove(self.compacting_path)
+            logging.info(f"Compacted migration state journal into {self.snapshot_path}")
+        except OSError as e:
+            logging.error(f"Failed to compact migration state journal: {e}")
+
+    def close(self):
+        self._commit()
+        if self.compaction_thread is not None:
+            self.compaction_thread.join()
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+def create_state_store(backend, state_file):
+    """
+    Returns the state store for the given backend name.
+    """
+    if backend == 'json':
+        return JsonStateStore(state_file)
+    if backend == 'sqlite':
+        db_path = os.path.splitext(state_file)[0] + '.db'
+        return SQLiteStateStore(db_path, json_path=state_file)
+    if backend == 'journal':
+        return JournalStateStore(state_file)
+    raise ValueError(f"Unknown state backend: {backend}")
@@ -0,0 +1,94 @@
+import queue
+import logging
+import threading
+from googleapiclient.http import MediaUpload
+
+# Drive requires resumable upload chunks to be multiples of 256 KB.
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+DOWNLOAD_READ_SIZE = 1024 * 1024
+# Download reads that may wait for the upload, on top of the chunk being uploaded.
+DEFAULT_BUFFER_READS = 8
+
+class StreamingMediaUpload(MediaUpload):
+    """
+    A resumable upload fed from an iterator of byte blocks, such as the body of a Dropbox
+    download, without touching the local disk.
+
+    A background thread reads ahead into a bounded queue so the download keeps going while
+    a chunk is being uploaded. Bytes are only dropped once Drive has confirmed them, so a
+    chunk that has to be sent again is served from memory instead of downloading the file again.
+    At most one chunk plus `buffer_reads` download reads are held in memory.
+
+    `offset` is the position in the file of the first block, when continuing an earlier upload.
+    """
+    def __init__(self, blocks, size, mimetype='application/octet-stream', chunksize=DEFAULT_CHUNK_SIZE, buffer_reads=DEFAULT_BUFFER_READS, offset=0):
+        super().__init__()
+        self._size = size
+        self._mimetype = mimetype
+        self._chunksize = chunksize
+        self._queue = queue.Queue(maxsize=buffer_reads)
+        self._stop = threading.Event()
+        self._retained = bytearray()
+        self._retained_offset = offset
+        self._finished = False
+        self._reader = threading.Thread(target=self._read_ahead, args=(blocks,), daemon=True)
+        self._reader.start()
+
+    def _read_ahead(self, blocks):
+        try:
+            for block in blocks:
+                if not self._put(block):
+                    return
+            self._put(None)
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def chunksize(self):
+        return self._chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def size(self):
+        return self._size
+
+    def resumable(self):
+        return True
+
+    def has_stream(self):
+        return False
+
+    def getbytes(self, begin, length):
+        """Returns `length` bytes from offset `begin`, which is the offset Drive has confirmed so far."""
+        if begin < self._retained_offset:
+            raise IOError(f"Bytes from offset {begin} are no longer buffered; the upload has to restart.")
+        del self._retained[:begin - self._retained_offset]
+        self._retained_offset = begin
+        while len(self._retained) < length and not self._finished:
+            block = self._queue.get()
+            if block is None:
+                self._finished = True
+            elif isinstance(block, Exception):
+                raise block
+            else:
+                self._retained.extend(block)
+        return bytes(self._retained[:length])
+
+    def close(self):
+        """Stops reading ahead and drops the buffered bytes."""
+        self._stop.set()
+        self._reader.join()
+        self._retained = bytearray()
+        logging.debug("Closed streaming upload buffer")
+
+    def to_json(self):
+        raise NotImplementedError("A streaming upload cannot be serialized.")
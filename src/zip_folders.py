@@ -0,0 +1,56 @@
+import os
+import zipfile
+
+# Dropbox refuses to zip folders with more entries than this, or larger than MAX_ZIP_SIZE bytes.
+MAX_ZIP_FILES = 10000
+MAX_ZIP_SIZE = 20 * 1024 ** 3
+DEFAULT_MIN_FILES = 100
+DEFAULT_MAX_FILE_SIZE = 64 * 1024
+
+def group_zip_folders(files, listing, min_files=DEFAULT_MIN_FILES, max_file_size=DEFAULT_MAX_FILE_SIZE):
+    """
+    Picks the folders worth downloading as one zip archive: folders with at least `min_files`
+    of the pending `files`, whose full contents in `listing` have no subfolders, no file larger
+    than `max_file_size`, and fit Dropbox's limits for zip downloads. Files migrated by an earlier
+    run count too, since the archive holds them as well.
+    Returns a dict of those folders' paths to their pending files, and the list of the other files.
+    """
+    contents = {}
+    with_subfolders = set()
+    for entry in listing:
+        parent = os.path.dirname(entry.path_display.lower())
+        if entry.is_file:
+            contents.setdefault(parent, []).append(entry)
+        elif entry.is_folder:
+            with_subfolders.add(parent)
+
+    by_folder = {}
+    for file in files:
+        by_folder.setdefault(os.path.dirname(file.path_display), []).append(file)
+
+    zip_folders = {}
+    rest = []
+    for folder, folder_files in by_folder.items():
+        archived = contents.get(folder.lower(), folder_files)
+        if (folder not in ('', '/') and folder.lower() not in with_subfolders
+                and len(folder_files) >= min_files
+                and len(archived) <= MAX_ZIP_FILES
+                and sum(file.size for file in archived) <= MAX_ZIP_SIZE
+                and all(file.size <= max_file_size for file in archived)):
+            zip_folders[folder] = folder_files
+        else:
+            rest.extend(folder_files)
+    return zip_folders, rest
+
+def iter_zip_members(archive_path, folder_path):
+    """
+    Reads a zip archive of a Dropbox folder one member at a time. Yields the lowercased Dropbox
+    path of each file and a function returning its content. Dropbox puts the folder's own
+    name at the root of the archive.
+    """
+    with zipfile.ZipFile(archive_path) as archive:
+        for member in archive.infolist():
+            if member.is_dir() or '/' not in member.filename:
+                continue
+            relative_path = member.filename.split('/', 1)[1]
+            yield f"{folder_path}/{relative_path}".lower(), lambda member=member: archive.read(member)
@@ -0,0 +1,176 @@
+import unittest
+import json
+import logging
+import hashlib
+import threading
+from unittest.mock import MagicMock
+import dropbox
+from src.listing import ListingEntry, FILE
+from src.integrity import ContentHasher, IntegrityError
+from src.async_transfer import AsyncTransferEngine, TransferError, aiohttp
+
+if aiohttp is not None:
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+
+@unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+class TestAsyncTransferEngine(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    async def asyncSetUp(self):
+        self.contents = {'/a.txt': b'alpha', '/b.txt': b'beta'}
+        self.download_statuses = []
+        self.uploads = []
+        self.updates = []
+        self.corrupt_downloads = []
+
+        async def download(request):
+            arg = json.loads(request.headers['Dropbox-API-Arg'])
+            self.path_roots = request.headers.get('Dropbox-API-Path-Root')
+            if self.download_statuses:
+                status = self.download_statuses.pop(0)
+                return web.Response(status=status, text='{"error_summary": "expired_access_token/"}', headers={'Retry-After': '0'})
+            if arg['path'] not in self.contents:
+                return web.Response(status=409, text='{"error_summary": "path/not_found/"}')
+            if arg['path'] in self.corrupt_downloads:
+                self.corrupt_downloads.remove(arg['path'])
+                return web.Response(body=b'corrupt')
+            return web.Response(body=self.contents[arg['path']])
+
+        async def upload(request):
+            reader = await request.multipart()
+            metadata = await (await reader.next()).json()
+            content = await (await reader.next()).read()
+            self.uploads.append((request.headers['Authorization'], metadata, bytes(content)))
+            return web.json_response({'id': f"id_{metadata['name']}", 'md5Checksum': hashlib.md5(content).hexdigest()})
+
+        async def update(request):
+            content = await request.read()
+            self.updates.append((request.match_info['file_id'], content))
+            return web.json_response({'id': request.match_info['file_id'], 'md5Checksum': hashlib.md5(content).hexdigest()})
+
+        app = web.Application()
+        app.router.add_post('/2/files/download', download)
+        app.router.add_post('/upload/drive/v3/files', upload)
+        app.router.add_patch('/upload/drive/v3/files/{file_id}', update)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+        credentials = MagicMock(valid=True, token='google_token')
+        self.engine = AsyncTransferEngine('dropbox_token', credentials, team_folder_id='ns1', concurrency=2)
+        self.engine.dropbox_download_url = str(self.server.make_url('/2/files/download'))
+        self.engine.drive_upload_url = str(self.server.make_url('/upload/drive/v3/files'))
+        self.results = []
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    def on_done(self, file, file_id, error, checksums):
+        self.results.append((file.path_display, file_id, error))
+        self.checksums = checksums
+
+    def _entry(self, path, content_hash=None):
+        if content_hash is None:
+            hasher = ContentHasher()
+            hasher.update(self.contents[path])
+            content_hash = hasher.hexdigest()
+        return ListingEntry(FILE, path, path[1:], len(self.contents[path]), content_hash)
+
+    async def test_transfers_files(self):
+        jobs = [
+            (ListingEntry(FILE, '/a.txt', 'a.txt', 5), ('folder_1', 'a.txt', None)),
+            (ListingEntry(FILE, '/b.txt', 'b.txt', 4), (None, 'b (1).txt', None)),
+        ]
+        await self.engine.transfer_all(jobs, self.on_done)
+
+        self.assertEqual(sorted(self.results), [('/a.txt', 'id_a.txt', None), ('/b.txt', 'id_b (1).txt', None)])
+        self.assertEqual(sorted(self.uploads, key=lambda u: u[1]['name']), [
+            ('Bearer google_token', {'name': 'a.txt', 'parents': ['folder_1']}, b'alpha'),
+            ('Bearer google_token', {'name': 'b (1).txt'}, b'beta'),
+        ])
+        self.assertEqual(json.loads(self.path_roots), {'.tag': 'namespace_id', 'namespace_id': 'ns1'})
+
+    async def test_results_are_recorded_off_the_event_loop(self):
+        loop_thread = threading.current_thread()
+        threads = []
+
+        def on_done(file, file_id, error, checksums):
+            threads.append(threading.current_thread())
+        await self.engine.transfer_all([(ListingEntry(FILE, '/a.txt', 'a.txt', 5), (None, 'a.txt', None))], on_done)
+
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], loop_thread)
+
+    async def test_local_copies_are_uploaded_without_downloading(self):
+        jobs = [
+            (ListingEntry(FILE, '/a.txt', 'a.txt', 5), (None, 'a.txt', None)),
+            (ListingEntry(FILE, '/b.txt', 'b.txt', 4), (None, 'b.txt', None)),
+        ]
+        self.contents.pop('/a.txt')
+        await self.engine.transfer_all(jobs, self.on_done, read_local=lambda file: b'local' if file.path_display == '/a.txt' else None)
+
+        self.assertEqual(sorted(self.results), [('/a.txt', 'id_a.txt', None), ('/b.txt', 'id_b.txt', None)])
+        self.assertEqual(sorted(content for _, _, content in self.uploads), [b'beta', b'local'])
+
+    async def test_replaces_existing_file(self):
+        await self.engine.transfer_all([(ListingEntry(FILE, '/a.txt', 'a.txt', 5), ('folder_1', 'a.txt', 'existing_id'))], self.on_done)
+        self.assertEqual(self.results, [('/a.txt', 'existing_id', None)])
+        self.assertEqual(self.updates, [('existing_id', b'alpha')])
+        self.assertEqual(self.uploads, [])
+
+    async def test_retries_rate_limits_and_reports_failures(self):
+        self.download_statuses = [429]
+        jobs = [
+            (ListingEntry(FILE, '/a.txt', 'a.txt', 5), (None, 'a.txt', None)),
+            (ListingEntry(FILE, '/missing.txt', 'missing.txt', 5), (None, 'missing.txt', None)),
+        ]
+        self.engine.concurrency = 1
+        await self.engine.transfer_all(jobs, self.on_done)
+
+        self.assertEqual(self.results[0], ('/a.txt', 'id_a.txt', None))
+        path, file_id, error = self.results[1]
+        self.assertEqual((path, file_id), ('/missing.txt', None))
+        self.assertIsInstance(error, TransferError)
+        self.assertEqual(error.status, 409)
+
+    async def test_verified_transfer_records_checksums(self):
+        self.engine.verify_integrity = True
+        file = self._entry('/a.txt')
+        await self.engine.transfer_all([(file, (None, 'a.txt', None))], self.on_done)
+
+        self.assertEqual(self.results, [('/a.txt', 'id_a.txt', None)])
+        self.assertEqual(self.checksums, {'content_hash': file.content_hash, 'md5': hashlib.md5(b'alpha').hexdigest()})
+
+    async def test_corrupt_download_is_transferred_again(self):
+        self.engine.verify_integrity = True
+        self.corrupt_downloads = ['/a.txt']
+        await self.engine.transfer_all([(self._entry('/a.txt'), (None, 'a.txt', None))], self.on_done)
+
+        self.assertEqual(self.results, [('/a.txt', 'id_a.txt', None)])
+        self.assertEqual([content for _, _, content in self.uploads], [b'alpha'])
+
+    async def test_transfer_that_never_matches_fails(self):
+        self.engine.verify_integrity = True
+        await self.engine.transfer_all([(self._entry('/a.txt', 'other_hash'), (None, 'a.txt', None))], self.on_done)
+
+        path, file_id, error = self.results[0]
+        self.assertEqual((path, file_id), ('/a.txt', None))
+        self.assertIsInstance(error, IntegrityError)
+        self.assertEqual(self.uploads, [])
+
+    async def test_expired_dropbox_token_stops_the_batch(self):
+        self.download_statuses = [401]
+        with self.assertRaises(dropbox.exceptions.AuthError) as cm:
+            await self.engine.transfer_all([(ListingEntry(FILE, '/a.txt', 'a.txt', 5), (None, 'a.txt', None))], self.on_done)
+        self.assertIn('expired_access_token', str(cm.exception))
+        self.assertEqual(self.results, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+import threading
+import logging
+from src.concurrency import AIMDLimiter
+
+class TestAIMDLimiter(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def test_limit_grows_additively_up_to_the_maximum(self):
+        limiter = AIMDLimiter('Test', 4, initial=1)
+        for _ in range(3):
+            limiter.on_success(0.1)
+        self.assertAlmostEqual(limiter.limit, 1 + 1 + 0.5 + 1 / 2.5)
+        for _ in range(100):
+            limiter.on_success(0.1)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_slow_requests_do_not_raise_the_limit(self):
+        limiter = AIMDLimiter('Test', 8, initial=2)
+        limiter.on_success(0.1)
+        limiter.on_success(5.0)
+        self.assertEqual(limiter.limit, 2.5)
+
+    def test_limit_only_grows_while_every_slot_is_taken(self):
+        limiter = AIMDLimiter('Test', 64, initial=16)
+        # Fewer requests than the limit allows: the limit is not what holds them back.
+        for _ in range(100):
+            with limiter.slot():
+                pass
+        self.assertEqual(limiter.limit, 16)
+
+        limiter = AIMDLimiter('Test', 64, initial=1)
+        with limiter.slot():
+            pass
+        self.assertEqual(limiter.limit, 2)
+
+    def test_throttling_cuts_the_limit_once_per_cooldown(self):
+        limiter = AIMDLimiter('Test', 64, initial=32, cooldown=60)
+        limiter.on_throttle()
+        limiter.on_throttle()
+        self.assertEqual(limiter.limit, 16)
+
+        limiter = AIMDLimiter('Test', 64, initial=2, cooldown=0)
+        for _ in range(3):
+            limiter.on_throttle()
+        self.assertEqual(limiter.limit, 1)
+
+    def test_throttling_error_in_a_slot_cuts_the_limit(self):
+        limiter = AIMDLimiter('Test', 64, initial=16, is_throttle=lambda e: str(e) == '429')
+        with self.assertRaises(ValueError):
+            with limiter.slot():
+                raise ValueError('404')
+        self.assertEqual(limiter.limit, 16)
+        with self.assertRaises(ValueError):
+            with limiter.slot():
+                raise ValueError('429')
+        self.assertEqual(limiter.limit, 8)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_requests_wait_for_a_free_slot(self):
+        limiter = AIMDLimiter('Test', 1, initial=1)
+        release = threading.Event()
+        entered = threading.Event()
+
+        def hold():
+            with limiter.slot():
+                entered.set()
+                release.wait(5)
+        thread = threading.Thread(target=hold)
+        thread.start()
+        entered.wait(5)
+
+        second = threading.Event()
+
+        def wait_for_slot():
+            with limiter.slot():
+                second.set()
+        waiter = threading.Thread(target=wait_for_slot)
+        waiter.start()
+        self.assertFalse(second.wait(0.2))
+        release.set()
+        self.assertTrue(second.wait(5))
+        thread.join()
+        waiter.join()
+
+    def test_nested_requests_share_the_slot(self):
+        limiter = AIMDLimiter('Test', 1, initial=1)
+        with limiter.slot():
+            with limiter.slot():
+                self.assertEqual(limiter.in_flight, 1)
+        self.assertEqual(limiter.in_flight, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from unittest.mock import MagicMock
+from src.drive_index import DriveChildrenIndex
+
+class TestDriveChildrenIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.drive_client = MagicMock()
+        self.drive_client.list_children.side_effect = lambda parent_id: iter([
+            {'id': f"{parent_id}_a", 'name': 'a.txt'},
+            {'id': f"{parent_id}_b", 'name': 'b.txt'},
+        ])
+
+    def test_folder_is_listed_once(self):
+        index = DriveChildrenIndex(self.drive_client)
+
+        self.assertEqual(index.find('a.txt', 'folder'), [{'id': 'folder_a', 'name': 'a.txt'}])
+        self.assertEqual(index.find('missing.txt', 'folder'), [])
+        self.assertEqual(index.names('folder'), {'a.txt', 'b.txt'})
+        self.drive_client.list_children.assert_called_once_with('folder')
+
+    def test_created_and_trashed_files_update_the_index(self):
+        index = DriveChildrenIndex(self.drive_client)
+        index.add('folder', {'id': 'ignored', 'name': 'c.txt'})
+        index.find('a.txt', 'folder')
+
+        index.add('folder', {'id': 'new', 'name': 'c.txt'})
+        index.remove('folder', 'folder_a')
+
+        self.assertEqual(index.find('c.txt', 'folder'), [{'id': 'new', 'name': 'c.txt'}])
+        self.assertEqual(index.names('folder'), {'b.txt', 'c.txt'})
+
+    def test_least_recently_used_folder_is_evicted(self):
+        index = DriveChildrenIndex(self.drive_client, max_folders=2)
+        index.find('a.txt', 'one')
+        index.find('a.txt', 'two')
+        index.find('a.txt', 'one')
+        index.find('a.txt', 'three')
+
+        index.find('a.txt', 'one')
+        index.find('a.txt', 'two')
+        self.assertEqual([c.args[0] for c in self.drive_client.list_children.call_args_list], ['one', 'two', 'three', 'two'])
+
+    def test_unique_names_are_reserved_without_requests(self):
+        self.drive_client.list_children.side_effect = lambda parent_id: iter([
+            {'id': '1', 'name': 'a.txt'},
+            {'id': '2', 'name': 'a (1).txt'},
+            {'id': '3', 'name': 'a (3).txt'},
+        ])
+        index = DriveChildrenIndex(self.drive_client)
+
+        self.assertEqual(index.reserve_unique_name('a.txt', 'folder'), 'a (2).txt')
+        self.assertEqual(index.reserve_unique_name('a.txt', 'folder'), 'a (4).txt')
+        # A reservation is not a child a conflict could be resolved against.
+        self.assertEqual(index.find('a (2).txt', 'folder'), [])
+        self.assertEqual(index.reserve_unique_name('a (1).txt', 'folder'), 'a (1) (1).txt')
+
+        index.add('folder', {'id': '4', 'name': 'a (2).txt'})
+        self.assertEqual(index.find('a (2).txt', 'folder'), [{'id': '4', 'name': 'a (2).txt'}])
+        self.drive_client.list_children.assert_called_once_with('folder')
+
+    def test_released_name_can_be_reserved_again(self):
+        index = DriveChildrenIndex(self.drive_client)
+        self.assertEqual(index.reserve_unique_name('c.txt', 'folder'), 'c (1).txt')
+        self.assertEqual(index.reserve_unique_name('d.txt', 'folder'), 'd (1).txt')
+
+        index.release('folder', 'c (1).txt')
+
+        self.assertEqual(index.reserve_unique_name('c (1).txt', 'folder'), 'c (1) (1).txt')
+        self.assertEqual(index.reserve_unique_name('c.txt', 'folder'), 'c (2).txt')
+        self.assertEqual(index.reserve_unique_name('d.txt', 'folder'), 'd (2).txt')
+
+    def test_folder_with_reservations_is_not_evicted(self):
+        index = DriveChildrenIndex(self.drive_client, max_folders=1)
+        index.reserve_unique_name('a.txt', 'one')
+        index.find('a.txt', 'two')
+
+        # The upload has not landed, so listing the folder again would hand out its name twice.
+        self.assertEqual(index.reserve_unique_name('a.txt', 'one'), 'a (2).txt')
+        self.assertEqual([c.args[0] for c in self.drive_client.list_children.call_args_list], ['one', 'two'])
+
+        index.add('one', {'id': 'uploaded', 'name': 'a (1).txt'})
+        index.release('one', 'a (2).txt')
+        index.find('a.txt', 'three')
+        index.find('a.txt', 'one')
+        self.assertEqual([c.args[0] for c in self.drive_client.list_children.call_args_list], ['one', 'two', 'three', 'one'])
+
+if __name__ == '__main__':
+    unittest.main()
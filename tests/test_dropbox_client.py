@@ -1,7 +1,11 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from src.dropbox_client import DropboxClient
+from src.dropbox_client import DropboxClient, RangeIgnoredError
 import dropbox
+import json
+import os
+import tempfile
+import requests
 import logging
 
 class TestDropboxClient(unittest.TestCase):
@@ -55,16 +59,148 @@ class TestDropboxClient(unittest.TestCase):
         with self.assertRaises(dropbox.exceptions.ApiError):
             self.client.list_files_and_folders('/test_path')
 
+    def test_iter_list_folder_pages(self):
+        mock_result1 = MagicMock(entries=['file1'], has_more=True, cursor='cursor123')
+        mock_result2 = MagicMock(entries=['file2'], has_more=False, cursor='cursor456')
+        self.mock_dbx.files_list_folder.return_value = mock_result1
+        self.mock_dbx.files_list_folder_continue.return_value = mock_result2
+
+        pages = self.client.iter_list_folder_pages('/test_path', recursive=True)
+        self.assertEqual(next(pages).entries, ['file1'])
+        self.mock_dbx.files_list_folder_continue.assert_not_called()
+        self.assertEqual([page.entries for page in pages], [['file2']])
+        self.mock_dbx.files_list_folder.assert_called_once_with('/test_path', recursive=True)
+        self.mock_dbx.files_list_folder_continue.assert_called_once_with('cursor123')
+
+    def test_iter_list_folder_pages_from_cursor(self):
+        self.mock_dbx.files_list_folder_continue.return_value = MagicMock(entries=['file3'], has_more=False)
+
+        pages = list(self.client.iter_list_folder_pages('/test_path', cursor='saved_cursor'))
+
+        self.mock_dbx.files_list_folder.assert_not_called()
+        self.mock_dbx.files_list_folder_continue.assert_called_once_with('saved_cursor')
+        self.assertEqual(pages[0].entries, ['file3'])
+
+    def test_reset_cursor_is_not_retried(self):
+        self.mock_dbx.files_list_folder_continue.side_effect = dropbox.exceptions.ApiError('request_id', dropbox.files.ListFolderContinueError.reset, None, None)
+
+        with self.assertRaises(dropbox.exceptions.ApiError):
+            list(self.client.iter_list_folder_pages('/test_path', cursor='expired_cursor'))
+        self.mock_dbx.files_list_folder_continue.assert_called_once_with('expired_cursor')
+
+    def test_iter_list_folder_pages_parallel(self):
+        folder_a = dropbox.files.FolderMetadata(name='A', path_display='/A')
+        folder_b = dropbox.files.FolderMetadata(name='B', path_display='/B')
+        top_file = dropbox.files.FileMetadata(name='top.txt', path_display='/top.txt', size=1)
+        listings = {
+            '': MagicMock(entries=[folder_a, folder_b, top_file], has_more=False),
+            '/A': MagicMock(entries=['a1', 'a2'], has_more=True, cursor='cursor_a'),
+            '/B': MagicMock(entries=['b1'], has_more=False),
+        }
+        self.mock_dbx.files_list_folder.side_effect = lambda path, recursive: listings[path]
+        self.mock_dbx.files_list_folder_continue.return_value = MagicMock(entries=['a3'], has_more=False)
+
+        pages = list(self.client.iter_list_folder_pages_parallel('', max_workers=2))
+
+        self.assertEqual(pages[0], [folder_a, folder_b, top_file])
+        self.assertCountEqual([entry for page in pages[1:] for entry in page], ['a1', 'a2', 'a3', 'b1'])
+        self.mock_dbx.files_list_folder.assert_any_call('', recursive=False)
+        self.mock_dbx.files_list_folder.assert_any_call('/A', recursive=True)
+        self.mock_dbx.files_list_folder.assert_any_call('/B', recursive=True)
+
+    def test_iter_list_folder_pages_parallel_failure(self):
+        folder_a = dropbox.files.FolderMetadata(name='A', path_display='/A')
+        def list_folder(path, recursive):
+            if path == '':
+                return MagicMock(entries=[folder_a], has_more=False)
+            raise dropbox.exceptions.AuthError('request_id', 'expired_access_token')
+        self.mock_dbx.files_list_folder.side_effect = list_folder
+
+        with self.assertRaises(dropbox.exceptions.AuthError):
+            list(self.client.iter_list_folder_pages_parallel('', max_workers=2))
+
+    @patch('time.sleep')
+    def test_rate_limit_backoff_is_shared(self, mock_sleep):
+        rate_limit_error = dropbox.exceptions.RateLimitError('request_id', backoff=30)
+        self.mock_dbx.files_list_folder.side_effect = [rate_limit_error, MagicMock(entries=['file1'], has_more=False)]
+
+        pages = list(self.client.iter_list_folder_pages('/test_path'))
+
+        self.assertEqual(pages[0].entries, ['file1'])
+        self.assertGreater(self.client._rate_limited_until, 0)
+        self.assertTrue(any(call.args[0] > 25 for call in mock_sleep.call_args_list))
+
+    def test_get_latest_cursor(self):
+        self.mock_dbx.files_list_folder_get_latest_cursor.return_value = MagicMock(cursor='cursor123')
+
+        cursor = self.client.get_latest_cursor('/test_path')
+        self.mock_dbx.files_list_folder_get_latest_cursor.assert_called_once_with('/test_path', recursive=True)
+        self.assertEqual(cursor, 'cursor123')
+
     def test_download_file_success(self):
         result = self.client.download_file('/dbx_path', '/local_path')
         self.mock_dbx.files_download_to_file.assert_called_with('/local_path', '/dbx_path')
         self.assertTrue(result)
 
+    def test_download_file_with_hasher(self):
+        response = MagicMock()
+        response.iter_content.return_value = [b'hello ', b'world']
+        self.mock_dbx.files_download.return_value = ('metadata', response)
+        hasher = MagicMock()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            local_path = os.path.join(tmpdir, 'file.txt')
+            self.assertTrue(self.client.download_file('/dbx_path', local_path, hasher=hasher))
+            with open(local_path, 'rb') as f:
+                self.assertEqual(f.read(), b'hello world')
+        hasher.reset.assert_called_once()
+        self.assertEqual([c.args[0] for c in hasher.update.call_args_list], [b'hello ', b'world'])
+        response.close.assert_called_once()
+
     def test_download_file_failure(self):
         self.mock_dbx.files_download_to_file.side_effect = dropbox.exceptions.ApiError('request_id', 'error', 'user_message_text', 'user_message_locale')
         with self.assertRaises(dropbox.exceptions.ApiError):
             self.client.download_file('/dbx_path', '/local_path')
 
+    def test_open_download(self):
+        self.mock_dbx.files_download.return_value = ('metadata', 'response')
+        self.assertEqual(self.client.open_download('/dbx_path'), ('metadata', 'response'))
+        self.mock_dbx.files_download.assert_called_with('/dbx_path')
+
+    @patch('src.dropbox_client.requests.post')
+    def test_open_download_from_offset(self, mock_post):
+        metadata = {'name': 'big.bin', 'id': 'id:abc', 'client_modified': '2020-01-01T00:00:00Z', 'server_modified': '2020-01-01T00:00:00Z',
+                    'rev': '0123456789abc', 'size': 4096, 'path_display': '/big.bin', 'content_hash': 'a' * 64}
+        mock_post.return_value = MagicMock(status_code=206, headers={'Dropbox-API-Result': json.dumps(metadata)})
+
+        result, response = self.client.open_download('/big.bin', team_folder_id='ns1', offset=1024)
+        self.assertEqual(result.size, 4096)
+        self.assertIs(response, mock_post.return_value)
+        headers = mock_post.call_args.kwargs['headers']
+        self.assertEqual(headers['Range'], 'bytes=1024-')
+        self.assertEqual(json.loads(headers['Dropbox-API-Arg']), {'path': '/big.bin'})
+        self.assertEqual(json.loads(headers['Dropbox-API-Path-Root']), {'.tag': 'namespace_id', 'namespace_id': 'ns1'})
+        self.mock_dbx.files_download.assert_not_called()
+
+    @patch('src.dropbox_client.requests.post')
+    def test_open_download_from_offset_rejects_the_whole_file(self, mock_post):
+        mock_post.return_value = MagicMock(status_code=200, headers={})
+        with self.assertRaises(RangeIgnoredError):
+            self.client.open_download('/big.bin', offset=1024)
+        mock_post.return_value.close.assert_called_once()
+
+    @patch('src.dropbox_client.requests.post')
+    def test_open_download_from_offset_expired_token(self, mock_post):
+        mock_post.return_value = MagicMock(status_code=401, headers={}, text='{"error_summary": "expired_access_token/"}')
+        with self.assertRaises(dropbox.exceptions.AuthError):
+            self.client.open_download('/big.bin', offset=1024)
+
+    def test_download_bytes(self):
+        response = MagicMock(content=b'content')
+        self.mock_dbx.files_download.return_value = ('metadata', response)
+        self.assertEqual(self.client.download_bytes('/dbx_path'), b'content')
+        self.mock_dbx.files_download.assert_called_with('/dbx_path')
+        response.close.assert_called_once()
+
     def test_list_team_folders_success(self):
         mock_result = MagicMock()
         mock_result.team_folders = ['folder1', 'folder2']
@@ -88,4 +224,88 @@ class TestDropboxClient(unittest.TestCase):
         mock_dbx_with_path_root.files_list_folder.assert_called_with('/test_path', recursive=False)
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
+class TestRangedDownload(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        self.mock_dbx = MagicMock()
+        with patch('dropbox.Dropbox', return_value=self.mock_dbx), patch('dropbox.DropboxTeam'):
+            self.client = DropboxClient('test_token')
+        self.data = bytes(range(256)) * 40
+        self.mock_dbx.files_get_metadata.return_value = MagicMock(size=len(self.data), rev='rev1')
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.local_path = os.path.join(self.tmpdir.name, 'big.bin')
+        self.requested = []
+        self.fail_at = None
+        patcher = patch('src.dropbox_client.requests.post', side_effect=self._serve_range)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _serve_range(self, url, headers=None, **kwargs):
+        start, end = (int(x) for x in headers['Range'][len('bytes='):].split('-'))
+        self.requested.append((json.loads(headers['Dropbox-API-Arg'])['path'], start))
+        if start == self.fail_at:
+            raise requests.exceptions.ConnectionError('connection reset')
+        response = MagicMock(status_code=206, headers={'Dropbox-API-Result': json.dumps({
+            'name': 'big.bin', 'id': 'id:abc', 'client_modified': '2020-01-01T00:00:00Z', 'server_modified': '2020-01-01T00:00:00Z',
+            'rev': '0123456789abc', 'size': len(self.data), 'path_display': '/big.bin'})})
+        response.iter_content.return_value = iter([self.data[start:end + 1]])
+        return response
+
+    def test_ranges_are_downloaded_into_place(self):
+        self.assertTrue(self.client.download_file_ranged('/big.bin', self.local_path, max_workers=3, range_size=1000))
+
+        with open(self.local_path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(sorted(self.requested), [('rev:rev1', start) for start in range(0, len(self.data), 1000)])
+        self.assertFalse(os.path.exists(self.local_path + '.ranges'))
+
+    @patch('src.retry.time.sleep')
+    def test_interrupted_download_fetches_only_missing_ranges(self, mock_sleep):
+        self.fail_at = 5000
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.client.download_file_ranged('/big.bin', self.local_path, max_workers=1, range_size=1000)
+        self.assertTrue(os.path.exists(self.local_path + '.ranges'))
+
+        self.fail_at = None
+        self.requested = []
+        self.assertTrue(self.client.download_file_ranged('/big.bin', self.local_path, max_workers=2, range_size=1000))
+
+        with open(self.local_path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        # Ranges finished before the failure are not fetched again.
+        requested = sorted(start for _, start in self.requested)
+        self.assertEqual(requested[0], 5000)
+        self.assertLessEqual(len(requested), 6)
+
+    @patch('src.retry.time.sleep')
+    def test_rate_limited_metadata_request_is_retried(self, mock_sleep):
+        metadata = self.mock_dbx.files_get_metadata.return_value
+        self.mock_dbx.files_get_metadata.side_effect = [dropbox.exceptions.RateLimitError('request_id', backoff=0), metadata]
+
+        self.assertTrue(self.client.download_file_ranged('/big.bin', self.local_path, range_size=1000))
+        self.assertEqual(self.mock_dbx.files_get_metadata.call_count, 2)
+        with open(self.local_path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_new_revision_is_downloaded_from_scratch(self):
+        with open(self.local_path + '.ranges', 'w') as f:
+            f.write(json.dumps({'size': len(self.data), 'rev': 'rev0', 'range_size': 1000}) + '\n0\n1000\n')
+        with open(self.local_path, 'wb') as f:
+            f.truncate(len(self.data))
+
+        self.client.download_file_ranged('/big.bin', self.local_path, range_size=1000)
+        self.assertEqual(len(self.requested), 11)
+        with open(self.local_path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
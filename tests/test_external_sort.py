@@ -0,0 +1,46 @@
+import unittest
+import os
+import random
+from unittest.mock import patch
+from src.listing import ListingEntry, FILE, FOLDER
+from src.external_sort import ExternalSorter, depth_key
+
+class TestExternalSorter(unittest.TestCase):
+
+    def _entries(self):
+        paths = [f"/a{i % 7}/b{i % 5}/file{i}.txt" for i in range(200)] + [f"/a{i}" for i in range(7)]
+        random.Random(0).shuffle(paths)
+        return [ListingEntry(FILE if path.endswith('.txt') else FOLDER, path, os.path.basename(path)) for path in paths]
+
+    def test_sorts_in_memory_within_budget(self):
+        entries = self._entries()
+        with ExternalSorter(10 ** 9) as sorter:
+            sorter.extend(entries)
+            self.assertEqual(sorter.runs, [])
+            self.assertEqual([e.path_display for e in sorter], [e.path_display for e in sorted(entries, key=depth_key)])
+
+    def test_spills_runs_and_merges_them(self):
+        entries = self._entries()
+        with ExternalSorter(2000) as sorter:
+            sorter.extend(entries)
+            self.assertGreater(len(sorter.runs), 1)
+            self.assertTrue(all(os.path.exists(path) for path in sorter.runs))
+            result = list(sorter)
+            run_dir = sorter.tmpdir.name
+        self.assertEqual(len(result), len(entries))
+        self.assertEqual([e.path_display for e in result], [e.path_display for e in sorted(entries, key=depth_key)])
+        self.assertEqual(result[0].kind, FOLDER)
+        self.assertFalse(os.path.exists(run_dir))
+
+    @patch('src.external_sort.MAX_MERGE_RUNS', 3)
+    def test_many_runs_are_merged_in_passes(self):
+        entries = self._entries()
+        with ExternalSorter(1000) as sorter:
+            sorter.extend(entries)
+            self.assertGreater(len(sorter.runs), 3)
+            result = [e.path_display for e in sorter]
+            self.assertLessEqual(len(sorter.runs), 3)
+        self.assertEqual(result, [e.path_display for e in sorted(entries, key=depth_key)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
 from unittest.mock import patch, MagicMock
+from googleapiclient.errors import HttpError
 from src.google_drive_client import GoogleDriveClient
 import logging
 
@@ -40,6 +41,133 @@ class TestGoogleDriveClient(unittest.TestCase):
         file_id = self.client.upload_file('/local_path', 'my_file.txt', folder_id='folder_id_123')
         self.assertEqual(file_id, 'file_id_789')
 
+    @patch('src.google_drive_client.MediaFileUpload')
+    def test_update_file_success(self, MockMediaFileUpload):
+        self.mock_service.files().update().execute.return_value = {'id': 'file_id_789'}
+
+        file_id = self.client.update_file('file_id_789', '/local_path')
+        self.assertEqual(file_id, 'file_id_789')
+        self.mock_service.files().update.assert_called_with(fileId='file_id_789', media_body=MockMediaFileUpload.return_value, fields='id')
+
+    @patch('src.google_drive_client.MediaIoBaseUpload')
+    def test_upload_bytes(self, MockMediaIoBaseUpload):
+        self.mock_service.files().create().execute.return_value = {'id': 'file_id_789'}
+
+        file_id = self.client.upload_bytes(b'content', 'my_file.txt', folder_id='folder_id_123')
+        self.assertEqual(file_id, 'file_id_789')
+        self.assertFalse(MockMediaIoBaseUpload.call_args.kwargs['resumable'])
+        self.assertEqual(MockMediaIoBaseUpload.call_args.args[0].getvalue(), b'content')
+        self.mock_service.files().create.assert_called_with(body={'name': 'my_file.txt', 'parents': ['folder_id_123']}, media_body=MockMediaIoBaseUpload.return_value, fields='id')
+
+    @patch('src.google_drive_client.MediaIoBaseUpload')
+    def test_upload_bytes_replaces_file(self, MockMediaIoBaseUpload):
+        self.mock_service.files().update().execute.return_value = {'id': 'file_id_789'}
+
+        self.assertEqual(self.client.upload_bytes(b'content', 'my_file.txt', replace_file_id='file_id_789'), 'file_id_789')
+        self.mock_service.files().update.assert_called_with(fileId='file_id_789', media_body=MockMediaIoBaseUpload.return_value, fields='id')
+
+    @patch('src.google_drive_client.MediaFileUpload')
+    def test_upload_file_with_md5(self, MockMediaFileUpload):
+        self.mock_service.files().create().execute.return_value = {'id': 'file_id_789', 'md5Checksum': 'abc'}
+
+        self.assertEqual(self.client.upload_file('/local_path', 'my_file.txt', with_md5=True), ('file_id_789', 'abc'))
+        self.mock_service.files().create.assert_called_with(body={'name': 'my_file.txt'}, media_body=MockMediaFileUpload.return_value, fields='id, md5Checksum')
+
+    def test_query_upload_session(self):
+        self.mock_service._http.request.return_value = (MagicMock(status=308, get=lambda key: 'bytes=0-1023'), b'')
+        self.assertEqual(self.client.query_upload_session('https://upload/session', 4096), (1024, None))
+        self.mock_service._http.request.assert_called_with('https://upload/session', method='PUT', body=b'', headers={'Content-Length': '0', 'Content-Range': 'bytes */4096'})
+
+        self.mock_service._http.request.return_value = (MagicMock(status=308, get=lambda key: None), b'')
+        self.assertEqual(self.client.query_upload_session('https://upload/session', 4096), (0, None))
+
+        self.mock_service._http.request.return_value = (MagicMock(status=200), b'{"id": "file_id_789"}')
+        self.assertEqual(self.client.query_upload_session('https://upload/session', 4096), (4096, 'file_id_789'))
+
+        self.mock_service._http.request.return_value = (MagicMock(status=404), b'')
+        self.assertEqual(self.client.query_upload_session('https://upload/session', 4096), (None, None))
+
+    def test_upload_media_continues_session(self):
+        request = self.mock_service.files().create.return_value
+        request.next_chunk.side_effect = [(None, None), (None, {'id': 'file_id_789'})]
+        request.resumable_uri = None
+        progress = []
+
+        def on_progress(uri, offset):
+            progress.append((uri, offset))
+        file_id = self.client.upload_media(MagicMock(), 'big.bin', session_uri='https://upload/session', offset=1024, on_progress=on_progress)
+
+        self.assertEqual(file_id, 'file_id_789')
+        self.assertEqual(progress, [('https://upload/session', 1024)])
+
+    def _fake_batches(self, respond):
+        """Makes batches answer each sub-request with `respond(request)`, which returns (response, exception)."""
+        self.batches = []
+
+        def new_batch_http_request(callback):
+            requests = []
+            batch = MagicMock()
+            batch.add.side_effect = lambda request, request_id: requests.append((request_id, request))
+
+            def execute():
+                self.batches.append([request for _, request in requests])
+                for request_id, request in requests:
+                    callback(request_id, *respond(request))
+            batch.execute.side_effect = execute
+            return batch
+        self.mock_service.new_batch_http_request.side_effect = new_batch_http_request
+
+    def test_create_folders_batch(self):
+        self.mock_service.files().create.side_effect = lambda body, fields: body['name']
+        self._fake_batches(lambda name: ({'id': f"id_{name}"}, None))
+
+        folders = [(f"Folder {i}", 'parent_id') for i in range(250)]
+        self.assertEqual(self.client.create_folders_batch(folders), [f"id_Folder {i}" for i in range(250)])
+        self.assertEqual([len(batch) for batch in self.batches], [100, 100, 50])
+
+    @patch('src.google_drive_client.time.sleep')
+    def test_batch_retries_only_failed_requests(self, mock_sleep):
+        self.mock_service.files().list.side_effect = lambda q, spaces, fields: q
+        rate_limited = HttpError(MagicMock(status=429), b'Rate limit exceeded')
+        not_found = HttpError(MagicMock(status=404), b'Not found')
+        attempts = {}
+
+        def respond(query):
+            attempts[query] = attempts.get(query, 0) + 1
+            if 'B' in query and attempts[query] == 1:
+                return None, rate_limited
+            if 'C' in query:
+                return None, not_found
+            return {'files': [{'id': query}]}, None
+        self._fake_batches(respond)
+
+        results = self.client.find_files_batch([('A', 'p'), ('B', 'p'), ('C', 'p')])
+
+        self.assertEqual(results[0], [{'id': 'name = "A" and \'p\' in parents'}])
+        self.assertEqual(results[1], [{'id': 'name = "B" and \'p\' in parents'}])
+        self.assertIs(results[2], not_found)
+        self.assertEqual([len(batch) for batch in self.batches], [3, 1])
+
+    def test_list_children_follows_pages(self):
+        self.mock_service.files().list().execute.side_effect = [
+            {'files': [{'id': '1', 'name': 'a.txt'}], 'nextPageToken': 'page2'},
+            {'files': [{'id': '2', 'name': 'b.txt'}]},
+        ]
+
+        self.assertEqual([child['id'] for child in self.client.list_children('folder_id_123')], ['1', '2'])
+        self.mock_service.files().list.assert_called_with(q="'folder_id_123' in parents and trashed = false", spaces='drive', pageSize=1000,
+                                                          pageToken='page2', fields='nextPageToken, files(id, name, size, md5Checksum)')
+
+    def test_copy_file(self):
+        self.mock_service.files().copy().execute.return_value = {'id': 'copy_id'}
+
+        self.assertEqual(self.client.copy_file('file_id_789', 'copy.txt', folder_id='folder_id_123'), 'copy_id')
+        self.mock_service.files().copy.assert_called_with(fileId='file_id_789', body={'name': 'copy.txt', 'parents': ['folder_id_123']}, fields='id')
+
+    def test_trash_file(self):
+        self.client.trash_file('file_id_789')
+        self.mock_service.files().update.assert_called_with(fileId='file_id_789', body={'trashed': True}, fields='id')
+
     def test_find_file_success(self):
         mock_response = {'files': [{'id': 'file_id_123', 'name': 'MyFile.txt'}]}
         self.mock_service.files().list().execute.return_value = mock_response
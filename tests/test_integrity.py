@@ -0,0 +1,37 @@
+import unittest
+import hashlib
+from src.listing import ListingEntry, FILE
+from src.integrity import ContentHasher, TransferHasher, IntegrityError, CONTENT_HASH_BLOCK_SIZE
+
+class TestIntegrity(unittest.TestCase):
+
+    def test_content_hash_of_blocks_fed_in_any_sizes(self):
+        data = bytes(range(256)) * (CONTENT_HASH_BLOCK_SIZE // 128 + 10)
+        blocks = [data[i:i + CONTENT_HASH_BLOCK_SIZE] for i in range(0, len(data), CONTENT_HASH_BLOCK_SIZE)]
+        expected = hashlib.sha256(b''.join(hashlib.sha256(block).digest() for block in blocks)).hexdigest()
+
+        hasher = ContentHasher()
+        for start in range(0, len(data), 1000003):
+            hasher.update(data[start:start + 1000003])
+
+        self.assertEqual(hasher.hexdigest(), expected)
+        self.assertEqual(ContentHasher().hexdigest(), hashlib.sha256(b'').hexdigest())
+
+    def test_checks_download_and_upload(self):
+        hasher = TransferHasher()
+        self.assertEqual(list(hasher.wrap([b'hello ', b'world'])), [b'hello ', b'world'])
+        content_hash = hashlib.sha256(hashlib.sha256(b'hello world').digest()).hexdigest()
+        md5 = hashlib.md5(b'hello world').hexdigest()
+        self.assertEqual(hasher.content_hash(), content_hash)
+        self.assertEqual(hasher.md5(), md5)
+
+        hasher.check_download(ListingEntry(FILE, '/a.txt', 'a.txt', 11, content_hash))
+        hasher.check_upload(ListingEntry(FILE, '/a.txt', 'a.txt', 11, content_hash), 'file_id', md5)
+        with self.assertRaises(IntegrityError):
+            hasher.check_download(ListingEntry(FILE, '/a.txt', 'a.txt', 11, 'other'))
+        with self.assertRaises(IntegrityError) as raised:
+            hasher.check_upload(ListingEntry(FILE, '/a.txt', 'a.txt', 11, content_hash), 'file_id', 'other')
+        self.assertEqual(raised.exception.file_id, 'file_id')
+
+if __name__ == '__main__':
+    unittest.main()
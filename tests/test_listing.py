@@ -0,0 +1,42 @@
+import unittest
+import datetime
+import sys
+import dropbox
+from src.listing import ListingEntry, to_entries, FILE, FOLDER, DELETED
+
+class TestListingEntry(unittest.TestCase):
+
+    def test_from_file_metadata(self):
+        modified = datetime.datetime(2024, 1, 2, 3, 4, 5)
+        metadata = dropbox.files.FileMetadata(name='a.txt', path_display='/Docs/a.txt', size=42, content_hash='a' * 64, server_modified=modified)
+
+        entry = ListingEntry.from_metadata(metadata)
+
+        self.assertEqual(entry.kind, FILE)
+        self.assertTrue(entry.is_file)
+        self.assertEqual((entry.path_display, entry.name, entry.size, entry.content_hash), ('/Docs/a.txt', 'a.txt', 42, 'a' * 64))
+        self.assertEqual(entry.server_modified, modified.timestamp())
+
+    def test_from_file_metadata_without_optional_fields(self):
+        entry = ListingEntry.from_metadata(dropbox.files.FileMetadata(name='a.txt', path_display='/a.txt', size=1))
+        self.assertIsNone(entry.content_hash)
+        self.assertIsNone(entry.server_modified)
+
+    def test_from_folder_and_deleted_metadata(self):
+        entries = to_entries([
+            dropbox.files.FolderMetadata(name='Docs', path_display='/Docs'),
+            dropbox.files.DeletedMetadata(name='old.txt', path_display='/old.txt'),
+        ])
+        self.assertEqual([entry.kind for entry in entries], [FOLDER, DELETED])
+        self.assertTrue(entries[0].is_folder)
+        self.assertTrue(entries[1].is_deleted)
+        self.assertEqual(entries[0].size, 0)
+
+    def test_entry_is_smaller_than_metadata(self):
+        metadata = dropbox.files.FileMetadata(name='a.txt', path_display='/a.txt', size=1)
+        entry = ListingEntry.from_metadata(metadata)
+        self.assertFalse(hasattr(entry, '__dict__'))
+        self.assertLess(sys.getsizeof(entry), sys.getsizeof(metadata))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+import tempfile
+import os
+import time
+from src.listing import ListingEntry, FILE, FOLDER, DELETED
+from src.listing_cache import ListingCache, ListingSnapshot
+
+class TestListingCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = ListingCache(os.path.join(self.tmpdir.name, 'cache'))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_load_missing_snapshot(self):
+        self.assertIsNone(self.cache.load(None, '/src'))
+
+    def test_write_and_load(self):
+        writer = self.cache.writer('123', '/src', 'cursor_1')
+        writer.add([ListingEntry(FOLDER, '/src/A', 'A')])
+        writer.add([ListingEntry(FILE, '/src/A/a.txt', 'a.txt', 10, 'hash', 1.5)])
+        writer.commit('cursor_2')
+
+        snapshot = self.cache.load('123', '/src')
+        self.assertEqual(snapshot.cursor, 'cursor_2')
+        self.assertLess(snapshot.age, 60)
+        self.assertEqual([entry.to_row() for entry in snapshot.entries], [
+            ['folder', '/src/A', 'A', 0, None, None],
+            ['file', '/src/A/a.txt', 'a.txt', 10, 'hash', 1.5],
+        ])
+        # Snapshots are keyed by team folder and source path.
+        self.assertIsNone(self.cache.load(None, '/src'))
+
+    def test_discarded_writer_keeps_previous_snapshot(self):
+        self.cache.save(None, '', ListingSnapshot([ListingEntry(FILE, '/a.txt', 'a.txt', 1)], 'cursor_1', time.time()))
+
+        writer = self.cache.writer(None, '', 'cursor_2')
+        writer.add([ListingEntry(FILE, '/b.txt', 'b.txt', 1)])
+        writer.discard()
+
+        snapshot = self.cache.load(None, '')
+        self.assertEqual(snapshot.cursor, 'cursor_1')
+        self.assertEqual([entry.path_display for entry in snapshot.entries], ['/a.txt'])
+
+    def test_apply_changes(self):
+        snapshot = ListingSnapshot([
+            ListingEntry(FOLDER, '/A', 'A'),
+            ListingEntry(FILE, '/A/a.txt', 'a.txt', 1),
+            ListingEntry(FILE, '/b.txt', 'b.txt', 1),
+        ], 'cursor_1', time.time())
+
+        snapshot.apply_changes([
+            ListingEntry(DELETED, '/a', 'A'),
+            ListingEntry(FILE, '/B.txt', 'B.txt', 2),
+            ListingEntry(FILE, '/c.txt', 'c.txt', 3),
+        ])
+
+        self.assertEqual([(entry.path_display, entry.size) for entry in snapshot.entries], [('/B.txt', 2), ('/c.txt', 3)])
+
+class TestListingCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = ListingCache(os.path.join(self.tmpdir.name, 'cache'))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_append_and_resume(self):
+        checkpoint = self.cache.checkpoint(None, '/src')
+        self.assertEqual(checkpoint.load(), [])
+        checkpoint.append([ListingEntry(FILE, '/src/a.txt', 'a.txt', 1)], 'cursor_1')
+        checkpoint.append([ListingEntry(FILE, '/src/b.txt', 'b.txt', 1)], 'cursor_2')
+
+        resumed = self.cache.checkpoint(None, '/src')
+        entries = resumed.load()
+        self.assertEqual([entry.path_display for entry in entries], ['/src/a.txt', '/src/b.txt'])
+        self.assertEqual((resumed.cursor, resumed.pages), ('cursor_2', 2))
+
+    def test_page_saved_without_cursor_is_not_duplicated(self):
+        checkpoint = self.cache.checkpoint(None, '')
+        checkpoint.append([ListingEntry(FILE, '/a.txt', 'a.txt', 1)], 'cursor_1')
+        checkpoint.file.write('["file", "/a.txt", "a.txt", 2, null, null]\n["file", "/b.t')
+        checkpoint.file.flush()
+
+        entries = self.cache.checkpoint(None, '').load()
+        self.assertEqual([(entry.path_display, entry.size) for entry in entries], [('/a.txt', 2)])
+
+    def test_pages_after_a_torn_line_survive_another_interruption(self):
+        checkpoint = self.cache.checkpoint(None, '')
+        checkpoint.append([ListingEntry(FILE, '/a.txt', 'a.txt', 1)], 'cursor_1')
+        checkpoint.file.write('["file", "/b.t')
+        checkpoint.file.flush()
+
+        resumed = self.cache.checkpoint(None, '')
+        resumed.load()
+        resumed.append([ListingEntry(FILE, '/b.txt', 'b.txt', 1)], 'cursor_2')
+        resumed.append([ListingEntry(FILE, '/c.txt', 'c.txt', 1)], 'cursor_3')
+        resumed.file.write('["file", "/d.t')
+        resumed.file.flush()
+
+        second = self.cache.checkpoint(None, '')
+        entries = second.load()
+        self.assertEqual([entry.path_display for entry in entries], ['/a.txt', '/b.txt', '/c.txt'])
+        self.assertEqual(second.cursor, 'cursor_3')
+
+    def test_finish_removes_checkpoint(self):
+        checkpoint = self.cache.checkpoint(None, '')
+        checkpoint.append([ListingEntry(FILE, '/a.txt', 'a.txt', 1)], 'cursor_1')
+        checkpoint.finish()
+
+        resumed = self.cache.checkpoint(None, '')
+        self.assertEqual(resumed.load(), [])
+        self.assertIsNone(resumed.cursor)
+
+if __name__ == '__main__':
+    unittest.main()
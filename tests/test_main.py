@@ -98,7 +98,7 @@ class TestMain(unittest.TestCase):
     def test_main_with_src_and_dest_flags(self, MockMigration, mock_get_google_credentials, mock_load_dropbox_credentials, mock_setup_logger, mock_get_config):
         mock_load_dropbox_credentials.return_value = 'test_token'
         main(['--src', '/my_dropbox_path', '--dest', 'my_gdrive_path'])
-        MockMigration.assert_called_once_with('test_token', mock_get_google_credentials.return_value, src_path='/my_dropbox_path', dest_path='my_gdrive_path', team_folder_id=None)
+        MockMigration.assert_called_once_with('test_token', mock_get_google_credentials.return_value, src_path='/my_dropbox_path', dest_path='my_gdrive_path', team_folder_id=None, state_backend='json', streaming=False, list_workers=1, listing_cache_dir=None, listing_max_age=86400, refresh_listing=False, listing_checkpoint_dir=None, memory_budget=None, transfer_workers=1, async_concurrency=None, stream_transfers=False, small_file_threshold=1048576, resumable_session_threshold=104857600, ranged_download_threshold=None, download_ranges=4, transfer_policy='listing', batch_requests=False, spool_dir=None, spool_budget=None, zip_min_files=None, zip_max_file_size=65536, verify_integrity=False, dedup=False, adaptive_concurrency=None, drive_index_folders=None)
 
     @patch('src.main.get_config', return_value=('test_key', 'test_secret'))
     @patch('src.main.setup_logger')
@@ -108,7 +108,7 @@ class TestMain(unittest.TestCase):
     def test_main_with_team_flag(self, MockMigration, mock_get_google_credentials, mock_load_dropbox_credentials, mock_setup_logger, mock_get_config):
         mock_load_dropbox_credentials.return_value = 'test_token'
         main(['--team', '12345'])
-        MockMigration.assert_called_once_with('test_token', mock_get_google_credentials.return_value, src_path=None, dest_path=None, team_folder_id='12345')
+        MockMigration.assert_called_once_with('test_token', mock_get_google_credentials.return_value, src_path=None, dest_path=None, team_folder_id='12345', state_backend='json', streaming=False, list_workers=1, listing_cache_dir=None, listing_max_age=86400, refresh_listing=False, listing_checkpoint_dir=None, memory_budget=None, transfer_workers=1, async_concurrency=None, stream_transfers=False, small_file_threshold=1048576, resumable_session_threshold=104857600, ranged_download_threshold=None, download_ranges=4, transfer_policy='listing', batch_requests=False, spool_dir=None, spool_budget=None, zip_min_files=None, zip_max_file_size=65536, verify_integrity=False, dedup=False, adaptive_concurrency=None, drive_index_folders=None)
 
     @patch('src.main.get_config', return_value=('test_key', 'test_secret'))
     @patch('src.main.setup_logger')
@@ -1,12 +1,31 @@
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, patch, call
 from src.migration import Migration
+from src.listing import ListingEntry, FILE, FOLDER, to_entries
+from src.listing_cache import ListingCache, ListingSnapshot
+from src.integrity import ContentHasher
+from src.dropbox_client import RangeIgnoredError
+from googleapiclient.errors import HttpError
 import dropbox
 import logging
 import os
+import time
+import tempfile
+import threading
+import zipfile
+import hashlib
 
 TEST_STATE_FILE = 'test_migration_state.json'
 
+def tmp_path(dropbox_path, name=None):
+    """Returns the temporary path a file is downloaded to."""
+    path_hash = hashlib.sha1(dropbox_path.lower().encode()).hexdigest()[:16]
+    return f"/tmp/{path_hash}_{name or os.path.basename(dropbox_path)}"
+
+def listing_pages(entries):
+    """Returns a side effect for `iter_list_folder_pages` listing `entries` in a single page."""
+    return lambda *args, **kwargs: iter([MagicMock(entries=entries, cursor='cursor', has_more=False)])
+
 class TestMigration(unittest.TestCase):
 
     def setUp(self):
@@ -32,11 +51,11 @@ class TestMigration(unittest.TestCase):
     def test_migration_process(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, mock_tqdm, mock_input):
         mock_load_state.return_value = self.mock_state
         mock_dbx_client = MockDropboxClient.return_value
-        mock_dbx_client.list_files_and_folders.return_value = [
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
             dropbox.files.FolderMetadata(name='Photos', path_display='/Photos'),
             dropbox.files.FileMetadata(name='document.txt', path_display='/document.txt', size=100),
             dropbox.files.FileMetadata(name='image.jpg', path_display='/Photos/image.jpg', size=200),
-        ]
+        ])
         mock_dbx_client.download_file.return_value = True
         mock_gdrive_client = MockGoogleDriveClient.return_value
         mock_gdrive_client.find_file.return_value = []
@@ -49,8 +68,8 @@ class TestMigration(unittest.TestCase):
         mock_gdrive_client.create_folder.assert_called_once_with('Photos', parent_id=None)
         self.assertEqual(mock_dbx_client.download_file.call_count, 2)
         self.assertEqual(mock_gdrive_client.upload_file.call_count, 2)
-        mock_gdrive_client.upload_file.assert_any_call('/tmp/document.txt', 'document.txt', folder_id=None)
-        mock_gdrive_client.upload_file.assert_any_call('/tmp/image.jpg', 'image.jpg', folder_id='folder_id_123')
+        mock_gdrive_client.upload_file.assert_any_call(tmp_path('/document.txt'), 'document.txt', folder_id=None)
+        mock_gdrive_client.upload_file.assert_any_call(tmp_path('/Photos/image.jpg'), 'image.jpg', folder_id='folder_id_123')
         mock_tqdm.assert_called_with(total=300, unit='B', unit_scale=True, desc="Migrating files")
         pbar = mock_tqdm.return_value.__enter__.return_value
         pbar.update.assert_any_call(100)
@@ -65,9 +84,9 @@ class TestMigration(unittest.TestCase):
     def test_folder_conflict(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, mock_input):
         mock_load_state.return_value = self.mock_state
         mock_dbx_client = MockDropboxClient.return_value
-        mock_dbx_client.list_files_and_folders.return_value = [
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
             dropbox.files.FolderMetadata(name='Photos', path_display='/Photos'),
-        ]
+        ])
         mock_gdrive_client = MockGoogleDriveClient.return_value
         mock_gdrive_client.find_file.return_value = [{'id': 'existing_folder_id'}]
 
@@ -87,10 +106,10 @@ class TestMigration(unittest.TestCase):
     def test_file_conflict_skip_and_remember(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, mock_tqdm, mock_input):
         mock_load_state.return_value = self.mock_state
         mock_dbx_client = MockDropboxClient.return_value
-        mock_dbx_client.list_files_and_folders.return_value = [
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
             dropbox.files.FileMetadata(name='document.txt', path_display='/document.txt', size=100),
             dropbox.files.FileMetadata(name='document2.txt', path_display='/document2.txt', size=100),
-        ]
+        ])
         mock_gdrive_client = MockGoogleDriveClient.return_value
         mock_gdrive_client.find_file.return_value = [{'id': 'existing_file_id'}]
 
@@ -113,10 +132,10 @@ class TestMigration(unittest.TestCase):
     def test_file_conflict_rename(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, mock_tqdm, mock_input):
         mock_load_state.return_value = self.mock_state
         mock_dbx_client = MockDropboxClient.return_value
-        mock_dbx_client.list_files_and_folders.return_value = [
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
             dropbox.files.FileMetadata(name='document.txt', path_display='/document.txt', size=100),
             dropbox.files.FileMetadata(name='document2.txt', path_display='/document2.txt', size=100),
-        ]
+        ])
         mock_dbx_client.download_file.return_value = True
         mock_gdrive_client = MockGoogleDriveClient.return_value
         mock_gdrive_client.find_file.side_effect = [[{'id': 'existing_file_id'}], [], [{'id': 'existing_file_id'}], []]
@@ -139,10 +158,10 @@ class TestMigration(unittest.TestCase):
     def test_failed_file_is_reported(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, mock_tqdm, mock_input):
         mock_load_state.return_value = self.mock_state
         mock_dbx_client = MockDropboxClient.return_value
-        mock_dbx_client.list_files_and_folders.return_value = [
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
             dropbox.files.FileMetadata(name='good_file.txt', path_display='/good_file.txt', size=100),
             dropbox.files.FileMetadata(name='bad_file.txt', path_display='/bad_file.txt', size=100),
-        ]
+        ])
         mock_dbx_client.download_file.side_effect = [True, Exception("Download failed")]
         mock_gdrive_client = MockGoogleDriveClient.return_value
         mock_gdrive_client.find_file.return_value = []
@@ -166,9 +185,9 @@ class TestMigration(unittest.TestCase):
         original_name = "Computer Systems - A Programmer's Persp. 2nd ed. - R. Bryant, D. O'Hallaron (Pearson, 2010) BBS.pdf"
         sanitized_name = "Computer Systems - A Programmer_s Persp. 2nd ed. - R. Bryant, D. O_Hallaron (Pearson, 2010) BBS.pdf"
         mock_dbx_client = MockDropboxClient.return_value
-        mock_dbx_client.list_files_and_folders.return_value = [
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
             dropbox.files.FileMetadata(name=original_name, path_display=f'/{original_name}', size=100),
-        ]
+        ])
         mock_dbx_client.download_file.return_value = True
         mock_gdrive_client = MockGoogleDriveClient.return_value
         mock_gdrive_client.find_file.return_value = []
@@ -177,8 +196,8 @@ class TestMigration(unittest.TestCase):
         migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE)
         migration.start()
 
-        mock_dbx_client.download_file.assert_called_once_with(f'/{original_name}', f'/tmp/{sanitized_name}', team_folder_id=None)
-        mock_gdrive_client.upload_file.assert_called_once_with(f'/tmp/{sanitized_name}', original_name, folder_id=None)
+        mock_dbx_client.download_file.assert_called_once_with(f'/{original_name}', tmp_path(f'/{original_name}', sanitized_name), team_folder_id=None)
+        mock_gdrive_client.upload_file.assert_called_once_with(tmp_path(f'/{original_name}', sanitized_name), original_name, folder_id=None)
 
     @patch('builtins.print')
     @patch('src.migration.Migration._load_state')
@@ -187,10 +206,10 @@ class TestMigration(unittest.TestCase):
     def test_dry_run(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_print):
         mock_load_state.return_value = self.mock_state
         mock_dbx_client = MockDropboxClient.return_value
-        mock_dbx_client.list_files_and_folders.return_value = [
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
             dropbox.files.FileMetadata(name='file1.txt', path_display='/file1.txt', size=100),
             dropbox.files.FileMetadata(name='file2.txt', path_display='/file2.txt', size=200),
-        ]
+        ])
 
         migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE)
         migration.start(dry_run=True)
@@ -213,9 +232,9 @@ class TestMigration(unittest.TestCase):
     def test_dry_run_with_limit(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_print):
         mock_load_state.return_value = self.mock_state
         mock_dbx_client = MockDropboxClient.return_value
-        mock_dbx_client.list_files_and_folders.return_value = [
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
             dropbox.files.FileMetadata(name=f'file_{i}.txt', path_display=f'/file_{i}.txt', size=100) for i in range(5)
-        ]
+        ])
 
         migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE)
         migration.start(dry_run=True, limit=2)
@@ -231,9 +250,9 @@ class TestMigration(unittest.TestCase):
     def test_dry_run_with_src_and_dest(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_print):
         mock_load_state.return_value = self.mock_state
         mock_dbx_client = MockDropboxClient.return_value
-        mock_dbx_client.list_files_and_folders.return_value = [
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
             dropbox.files.FileMetadata(name='file1.txt', path_display='/src_folder/file1.txt', size=100),
-        ]
+        ])
 
         migration = Migration('fake_dbx_token', 'fake_gdrive_creds', src_path='/src_folder', dest_path='dest_folder', state_file=TEST_STATE_FILE)
         migration.start(dry_run=True)
@@ -255,9 +274,9 @@ class TestMigration(unittest.TestCase):
     def test_dry_run_large_migration_confirm(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_print, mock_input):
         mock_load_state.return_value = self.mock_state
         mock_dbx_client = MockDropboxClient.return_value
-        mock_dbx_client.list_files_and_folders.return_value = [
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
             dropbox.files.FileMetadata(name=f'file_{i}.txt', path_display=f'/file_{i}.txt', size=100) for i in range(101)
-        ]
+        ])
 
         migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE)
         migration.start(dry_run=True)
@@ -273,9 +292,9 @@ class TestMigration(unittest.TestCase):
     def test_dry_run_large_migration_with_limit(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_print, mock_input):
         mock_load_state.return_value = self.mock_state
         mock_dbx_client = MockDropboxClient.return_value
-        mock_dbx_client.list_files_and_folders.return_value = [
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
             dropbox.files.FileMetadata(name=f'file_{i}.txt', path_display=f'/file_{i}.txt', size=100) for i in range(101)
-        ]
+        ])
 
         migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE)
         migration.start(dry_run=True, limit=20)
@@ -295,9 +314,9 @@ class TestMigration(unittest.TestCase):
     def test_dry_run_large_migration_cancel(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_print, mock_input):
         mock_load_state.return_value = self.mock_state
         mock_dbx_client = MockDropboxClient.return_value
-        mock_dbx_client.list_files_and_folders.return_value = [
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
             dropbox.files.FileMetadata(name=f'file_{i}.txt', path_display=f'/file_{i}.txt', size=100) for i in range(101)
-        ]
+        ])
 
         migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE)
         migration.start(dry_run=True)
@@ -315,12 +334,12 @@ class TestMigration(unittest.TestCase):
     def test_interactive_mode(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, mock_input):
         mock_load_state.return_value = self.mock_state
         mock_dbx_client = MockDropboxClient.return_value
-        mock_dbx_client.list_files_and_folders.return_value = [
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
             dropbox.files.FolderMetadata(name='Folder 1', path_display='/Folder 1'),
             dropbox.files.FileMetadata(name='file1.txt', path_display='/Folder 1/file1.txt', size=100),
             dropbox.files.FolderMetadata(name='Folder 2', path_display='/Folder 2'),
             dropbox.files.FolderMetadata(name='Folder 3', path_display='/Folder 3'),
-        ]
+        ])
         mock_gdrive_client = MockGoogleDriveClient.return_value
         mock_gdrive_client.find_file.return_value = []
         mock_gdrive_client.create_folder.return_value = 'folder_id'
@@ -344,9 +363,9 @@ class TestMigration(unittest.TestCase):
     def test_migration_with_limit(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, mock_tqdm, mock_input):
         mock_load_state.return_value = self.mock_state
         mock_dbx_client = MockDropboxClient.return_value
-        mock_dbx_client.list_files_and_folders.return_value = [
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
             dropbox.files.FileMetadata(name=f'file_{i}.txt', path_display=f'/file_{i}.txt', size=100) for i in range(20)
-        ]
+        ])
         mock_dbx_client.download_file.return_value = True
         mock_gdrive_client = MockGoogleDriveClient.return_value
         mock_gdrive_client.find_file.return_value = []
@@ -382,10 +401,10 @@ class TestMigrationWithSrcDestFlags(unittest.TestCase):
     def test_migration_with_src_flag(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, mock_tqdm, mock_input):
         mock_load_state.return_value = self.mock_state
         mock_dbx_client = MockDropboxClient.return_value
-        mock_dbx_client.list_files_and_folders.return_value = [
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
             dropbox.files.FolderMetadata(name='Photos', path_display='/Apps/MyApp/Photos'),
             dropbox.files.FileMetadata(name='image.jpg', path_display='/Apps/MyApp/Photos/image.jpg', size=100),
-        ]
+        ])
         mock_dbx_client.download_file.return_value = True
         mock_gdrive_client = MockGoogleDriveClient.return_value
         mock_gdrive_client.find_file.return_value = []
@@ -395,9 +414,9 @@ class TestMigrationWithSrcDestFlags(unittest.TestCase):
         migration = Migration('fake_dbx_token', 'fake_gdrive_creds', src_path='/Apps/MyApp', state_file=TEST_STATE_FILE)
         migration.start()
 
-        mock_dbx_client.list_files_and_folders.assert_called_once_with(path='/Apps/MyApp', team_folder_id=None)
+        mock_dbx_client.iter_list_folder_pages.assert_called_once_with(path='/Apps/MyApp', team_folder_id=None)
         mock_gdrive_client.create_folder.assert_called_once_with('Photos', parent_id=None)
-        mock_gdrive_client.upload_file.assert_called_once_with('/tmp/image.jpg', 'image.jpg', folder_id='folder_id_123')
+        mock_gdrive_client.upload_file.assert_called_once_with(tmp_path('/Apps/MyApp/Photos/image.jpg'), 'image.jpg', folder_id='folder_id_123')
 
     @patch('builtins.input', return_value='y')
     @patch('src.migration.tqdm')
@@ -409,10 +428,10 @@ class TestMigrationWithSrcDestFlags(unittest.TestCase):
     def test_migration_with_dest_flag(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, mock_tqdm, mock_input):
         mock_load_state.return_value = self.mock_state
         mock_dbx_client = MockDropboxClient.return_value
-        mock_dbx_client.list_files_and_folders.return_value = [
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
             dropbox.files.FolderMetadata(name='Photos', path_display='/Photos'),
             dropbox.files.FileMetadata(name='image.jpg', path_display='/Photos/image.jpg', size=100),
-        ]
+        ])
         mock_dbx_client.download_file.return_value = True
         mock_gdrive_client = MockGoogleDriveClient.return_value
         mock_gdrive_client.find_or_create_folder_path.return_value = 'dest_folder_id'
@@ -425,7 +444,7 @@ class TestMigrationWithSrcDestFlags(unittest.TestCase):
 
         mock_gdrive_client.find_or_create_folder_path.assert_called_once_with('MyCoolFolder/Backup')
         mock_gdrive_client.create_folder.assert_called_once_with('Photos', parent_id='dest_folder_id')
-        mock_gdrive_client.upload_file.assert_called_once_with('/tmp/image.jpg', 'image.jpg', folder_id='folder_id_123')
+        mock_gdrive_client.upload_file.assert_called_once_with(tmp_path('/Photos/image.jpg'), 'image.jpg', folder_id='folder_id_123')
 
     @patch('builtins.input', return_value='y')
     @patch('src.migration.tqdm')
@@ -437,10 +456,10 @@ class TestMigrationWithSrcDestFlags(unittest.TestCase):
     def test_migration_with_src_and_dest_flags(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, mock_tqdm, mock_input):
         mock_load_state.return_value = self.mock_state
         mock_dbx_client = MockDropboxClient.return_value
-        mock_dbx_client.list_files_and_folders.return_value = [
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
             dropbox.files.FolderMetadata(name='Photos', path_display='/Apps/MyApp/Photos'),
             dropbox.files.FileMetadata(name='image.jpg', path_display='/Apps/MyApp/Photos/image.jpg', size=100),
-        ]
+        ])
         mock_dbx_client.download_file.return_value = True
         mock_gdrive_client = MockGoogleDriveClient.return_value
         mock_gdrive_client.find_or_create_folder_path.return_value = 'dest_folder_id'
@@ -451,10 +470,10 @@ class TestMigrationWithSrcDestFlags(unittest.TestCase):
         migration = Migration('fake_dbx_token', 'fake_gdrive_creds', src_path='/Apps/MyApp', dest_path='MyCoolFolder/Backup', state_file=TEST_STATE_FILE)
         migration.start()
 
-        mock_dbx_client.list_files_and_folders.assert_called_once_with(path='/Apps/MyApp', team_folder_id=None)
+        mock_dbx_client.iter_list_folder_pages.assert_called_once_with(path='/Apps/MyApp', team_folder_id=None)
         mock_gdrive_client.find_or_create_folder_path.assert_called_once_with('MyCoolFolder/Backup')
         mock_gdrive_client.create_folder.assert_called_once_with('Photos', parent_id='dest_folder_id')
-        mock_gdrive_client.upload_file.assert_called_once_with('/tmp/image.jpg', 'image.jpg', folder_id='folder_id_123')
+        mock_gdrive_client.upload_file.assert_called_once_with(tmp_path('/Apps/MyApp/Photos/image.jpg'), 'image.jpg', folder_id='folder_id_123')
 
 class TestMigrationWithTeamFlag(unittest.TestCase):
 
@@ -480,9 +499,9 @@ class TestMigrationWithTeamFlag(unittest.TestCase):
     def test_migration_with_team_flag(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, mock_tqdm, mock_input):
         mock_load_state.return_value = self.mock_state
         mock_dbx_client = MockDropboxClient.return_value
-        mock_dbx_client.list_files_and_folders.return_value = [
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
             dropbox.files.FileMetadata(name='team_file.txt', path_display='/team_file.txt', size=100),
-        ]
+        ])
         mock_dbx_client.download_file.return_value = True
         mock_gdrive_client = MockGoogleDriveClient.return_value
         mock_gdrive_client.find_file.return_value = []
@@ -491,9 +510,9 @@ class TestMigrationWithTeamFlag(unittest.TestCase):
         migration = Migration('fake_dbx_token', 'fake_gdrive_creds', team_folder_id='12345', state_file=TEST_STATE_FILE)
         migration.start()
 
-        mock_dbx_client.list_files_and_folders.assert_called_once_with(path='', team_folder_id='12345')
-        mock_dbx_client.download_file.assert_called_once_with('/team_file.txt', '/tmp/team_file.txt', team_folder_id='12345')
-        mock_gdrive_client.upload_file.assert_called_once_with('/tmp/team_file.txt', 'team_file.txt', folder_id=None)
+        mock_dbx_client.iter_list_folder_pages.assert_called_once_with(path='', team_folder_id='12345')
+        mock_dbx_client.download_file.assert_called_once_with('/team_file.txt', tmp_path('/team_file.txt'), team_folder_id='12345')
+        mock_gdrive_client.upload_file.assert_called_once_with(tmp_path('/team_file.txt'), 'team_file.txt', folder_id=None)
 
     @patch('builtins.print')
     @patch('src.migration.Migration._load_state')
@@ -517,3 +536,1667 @@ class TestMigrationWithTeamFlag(unittest.TestCase):
         mock_print.assert_any_call("- Folder 1 (ID: 123)")
         mock_print.assert_any_call("- Folder 2 (ID: 456)")
 
+
+class TestMigrationStateIndexBenchmark(unittest.TestCase):
+
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_pending_files_with_one_million_entries(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state):
+        entry_count = 1000000
+        paths = [f'/folder_{i % 1000}/file_{i}.txt' for i in range(entry_count)]
+        mock_load_state.return_value = {
+            'migrated_files': paths[:entry_count // 2],
+            'skipped_files': paths[entry_count // 2:entry_count // 2 + 1000],
+            'migrated_folders': {'/': None},
+            'skipped_folders': []
+        }
+        items = [ListingEntry(FILE, p, os.path.basename(p), 1) for p in paths]
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE)
+        started = time.perf_counter()
+        pending = migration._pending_files(items)
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(len(pending), entry_count // 2 - 1000)
+        # A list-based membership check takes hours at this size; hashed lookups take well under a second.
+        self.assertLess(elapsed, 5)
+
+class TestStreamingMigration(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        self.mock_state = {
+            'migrated_files': [],
+            'skipped_files': [],
+            'migrated_folders': {'/': None},
+            'skipped_folders': []
+        }
+
+    @patch('builtins.input', return_value='y')
+    @patch('src.migration.tqdm')
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_streaming_migrates_pages_as_they_arrive(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, mock_tqdm, mock_input):
+        mock_load_state.return_value = self.mock_state
+        mock_dbx_client = MockDropboxClient.return_value
+        mock_dbx_client.iter_list_folder_pages.return_value = iter([
+            MagicMock(entries=[
+                dropbox.files.FileMetadata(name='document.txt', path_display='/document.txt', size=100),
+                dropbox.files.FileMetadata(name='image.jpg', path_display='/Photos/image.jpg', size=200),
+            ]),
+            MagicMock(entries=[
+                dropbox.files.FolderMetadata(name='Photos', path_display='/Photos'),
+            ]),
+        ])
+        mock_dbx_client.download_file.return_value = True
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+        mock_gdrive_client.create_folder.return_value = 'folder_id_123'
+        mock_gdrive_client.upload_file.return_value = 'file_id_456'
+        pbar = mock_tqdm.return_value.__enter__.return_value
+        pbar.total = 0
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, streaming=True)
+        migration.start()
+
+        mock_dbx_client.list_files_and_folders.assert_not_called()
+        mock_dbx_client.iter_list_folder_pages.assert_called_once_with(path='', recursive=True, team_folder_id=None)
+        # The file listed before its folder waits until the folder has been created.
+        self.assertEqual(mock_gdrive_client.upload_file.call_args_list, [
+            unittest.mock.call(tmp_path('/document.txt'), 'document.txt', folder_id=None),
+            unittest.mock.call(tmp_path('/Photos/image.jpg'), 'image.jpg', folder_id='folder_id_123'),
+        ])
+        self.assertEqual(migration.migrated_in_session, 2)
+        self.assertEqual(migration.total_files_to_migrate, 2)
+        self.assertEqual(pbar.total, 300)
+
+    @patch('builtins.input', return_value='y')
+    @patch('src.migration.tqdm')
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_streaming_with_limit(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, mock_tqdm, mock_input):
+        mock_load_state.return_value = self.mock_state
+        mock_dbx_client = MockDropboxClient.return_value
+        mock_dbx_client.iter_list_folder_pages.return_value = iter([
+            MagicMock(entries=[dropbox.files.FileMetadata(name=f'file_{i}.txt', path_display=f'/file_{i}.txt', size=100) for i in range(page * 5, page * 5 + 5)])
+            for page in range(4)
+        ])
+        mock_dbx_client.download_file.return_value = True
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+        mock_gdrive_client.upload_file.return_value = 'file_id'
+        mock_tqdm.return_value.__enter__.return_value.total = 0
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, streaming=True, stream_buffer_pages=1)
+        migration.start(limit=7)
+
+        self.assertEqual(mock_gdrive_client.upload_file.call_count, 7)
+        self.assertEqual(migration.migrated_in_session, 7)
+
+    @patch('builtins.input', return_value='y')
+    @patch('src.migration.tqdm')
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_streaming_listing_error_is_raised(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_save_state, mock_tqdm, mock_input):
+        mock_load_state.return_value = self.mock_state
+        mock_dbx_client = MockDropboxClient.return_value
+        auth_error = dropbox.exceptions.AuthError('request_id', 'expired_access_token')
+        mock_dbx_client.iter_list_folder_pages.side_effect = auth_error
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, streaming=True)
+        with self.assertRaises(dropbox.exceptions.AuthError):
+            migration.start()
+
+    @patch('builtins.print')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_dry_run_with_parallel_listing(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_print):
+        mock_load_state.return_value = self.mock_state
+        mock_dbx_client = MockDropboxClient.return_value
+        mock_dbx_client.iter_list_folder_pages_parallel.return_value = iter([
+            [dropbox.files.FolderMetadata(name='A', path_display='/A')],
+            [dropbox.files.FileMetadata(name='file1.txt', path_display='/A/file1.txt', size=100)],
+        ])
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, list_workers=4)
+        migration.start(dry_run=True)
+
+        mock_dbx_client.list_files_and_folders.assert_not_called()
+        mock_dbx_client.iter_list_folder_pages_parallel.assert_called_once_with(path='', team_folder_id=None, max_workers=4)
+        mock_print.assert_any_call("dropbox:/A/file1.txt -> gdrive:A/file1.txt")
+
+class TestDeltaMigration(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        self.mock_state = {
+            'migrated_files': ['/changed.txt', '/Old/gone.txt', '/gone.txt'],
+            'skipped_files': [],
+            'migrated_folders': {'/': None, '/Old': 'old_folder_id'},
+            'skipped_folders': [],
+            'list_cursors': {':': 'saved_cursor'},
+            'file_ids': {'/changed.txt': 'changed_file_id', '/Old/gone.txt': 'old_gone_id', '/gone.txt': 'gone_file_id'}
+        }
+
+    @patch('builtins.input', return_value='y')
+    @patch('src.migration.tqdm')
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_full_migration_saves_cursor(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, mock_tqdm, mock_input):
+        mock_load_state.return_value = {'migrated_files': [], 'skipped_files': [], 'migrated_folders': {'/': None}, 'skipped_folders': []}
+        mock_dbx_client = MockDropboxClient.return_value
+        mock_dbx_client.get_latest_cursor.return_value = 'cursor_before_listing'
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
+            dropbox.files.FileMetadata(name='document.txt', path_display='/document.txt', size=100),
+        ])
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE)
+        migration.start()
+
+        mock_dbx_client.get_latest_cursor.assert_called_once_with(path='', team_folder_id=None)
+        self.assertEqual(migration.state['list_cursors'], {':': 'cursor_before_listing'})
+
+    @patch('builtins.input', return_value='y')
+    @patch('src.migration.tqdm')
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_cursor_not_saved_after_failures(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, mock_tqdm, mock_input):
+        mock_load_state.return_value = {'migrated_files': [], 'skipped_files': [], 'migrated_folders': {'/': None}, 'skipped_folders': []}
+        mock_dbx_client = MockDropboxClient.return_value
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing_pages([
+            dropbox.files.FileMetadata(name='document.txt', path_display='/document.txt', size=100),
+        ])
+        mock_dbx_client.download_file.side_effect = Exception("Download failed")
+        MockGoogleDriveClient.return_value.find_file.return_value = []
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE)
+        migration.start()
+
+        self.assertNotIn('list_cursors', migration.state)
+
+    @patch('src.migration.tqdm')
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_delta_migration(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, mock_tqdm):
+        mock_load_state.return_value = self.mock_state
+        mock_dbx_client = MockDropboxClient.return_value
+        mock_dbx_client.iter_list_folder_pages.return_value = iter([
+            MagicMock(entries=[
+                dropbox.files.FileMetadata(name='changed.txt', path_display='/changed.txt', size=100),
+                dropbox.files.FileMetadata(name='new.txt', path_display='/new.txt', size=50),
+            ], cursor='cursor_2'),
+            MagicMock(entries=[
+                dropbox.files.DeletedMetadata(name='Old', path_display='/Old'),
+                dropbox.files.DeletedMetadata(name='gone.txt', path_display='/gone.txt'),
+            ], cursor='cursor_3'),
+        ])
+        mock_dbx_client.download_file.return_value = True
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        # Files of the user's own that share the names must be left alone.
+        mock_gdrive_client.find_file.side_effect = lambda name, parent_id=None: {
+            'changed.txt': [{'id': 'users_changed_id'}],
+            'gone.txt': [{'id': 'users_gone_id'}],
+        }.get(name, [])
+        mock_gdrive_client.update_file.return_value = 'changed_file_id'
+        mock_gdrive_client.upload_file.return_value = 'new_file_id'
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE)
+        migration.start(delta=True, trash_deleted=True)
+
+        mock_dbx_client.list_files_and_folders.assert_not_called()
+        mock_dbx_client.iter_list_folder_pages.assert_called_once_with(team_folder_id=None, cursor='saved_cursor')
+        mock_gdrive_client.update_file.assert_called_once_with('changed_file_id', tmp_path('/changed.txt'))
+        mock_gdrive_client.upload_file.assert_called_once_with(tmp_path('/new.txt'), 'new.txt', folder_id=None)
+        self.assertEqual(mock_gdrive_client.trash_file.call_args_list, [call('old_folder_id'), call('gone_file_id')])
+        self.assertEqual(sorted(migration.state['migrated_files']), ['/changed.txt', '/new.txt'])
+        self.assertEqual(migration.state['file_ids'], {'/changed.txt': 'changed_file_id', '/new.txt': 'new_file_id'})
+        self.assertNotIn('/Old', migration.state['migrated_folders'])
+        self.assertEqual(migration.state['list_cursors'][':'], 'cursor_3')
+
+    @patch('src.migration.tqdm')
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_delta_keeps_deleted_entries_without_trash(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, mock_tqdm):
+        mock_load_state.return_value = self.mock_state
+        mock_dbx_client = MockDropboxClient.return_value
+        mock_dbx_client.iter_list_folder_pages.return_value = iter([
+            MagicMock(entries=[dropbox.files.DeletedMetadata(name='gone.txt', path_display='/gone.txt')], cursor='cursor_2'),
+        ])
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE)
+        migration.start(delta=True)
+
+        MockGoogleDriveClient.return_value.trash_file.assert_not_called()
+        self.assertIn('/gone.txt', migration.state['migrated_files'])
+
+    @patch('builtins.print')
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_delta_dry_run_changes_nothing(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_save_state, mock_print):
+        mock_load_state.return_value = self.mock_state
+        mock_dbx_client = MockDropboxClient.return_value
+        mock_dbx_client.iter_list_folder_pages.return_value = iter([
+            MagicMock(entries=[
+                dropbox.files.FileMetadata(name='changed.txt', path_display='/changed.txt', size=100),
+                dropbox.files.FileMetadata(name='new.txt', path_display='/new.txt', size=50),
+                dropbox.files.DeletedMetadata(name='gone.txt', path_display='/gone.txt'),
+            ], cursor='cursor_2'),
+        ])
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE)
+        migration.start(delta=True, trash_deleted=True, dry_run=True)
+
+        mock_dbx_client.download_file.assert_not_called()
+        MockGoogleDriveClient.return_value.trash_file.assert_not_called()
+        MockGoogleDriveClient.return_value.update_file.assert_not_called()
+        MockGoogleDriveClient.return_value.upload_file.assert_not_called()
+        mock_print.assert_any_call("modified: dropbox:/changed.txt -> gdrive:changed.txt")
+        mock_print.assert_any_call("new: dropbox:/new.txt -> gdrive:new.txt")
+        mock_print.assert_any_call("deleted: dropbox:/gone.txt (moved to the Google Drive trash)")
+        self.assertEqual(migration.state['migrated_files'], ['/changed.txt', '/Old/gone.txt', '/gone.txt'])
+        self.assertEqual(migration.state['list_cursors'][':'], 'saved_cursor')
+
+    @patch('src.migration.tqdm')
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_modified_file_stays_migrated_until_replaced(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_save_state, mock_tqdm):
+        mock_load_state.return_value = self.mock_state
+        mock_dbx_client = MockDropboxClient.return_value
+        mock_dbx_client.iter_list_folder_pages.return_value = iter([
+            MagicMock(entries=[dropbox.files.FileMetadata(name='changed.txt', path_display='/changed.txt', size=100)], cursor='cursor_2'),
+        ])
+        mock_dbx_client.download_file.side_effect = Exception("Download failed")
+        MockGoogleDriveClient.return_value.find_file.return_value = [{'id': 'changed_file_id'}]
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE)
+        migration.start(delta=True)
+
+        mock_dbx_client.download_file.assert_called_once()
+        self.assertIn('/changed.txt', migration.state['migrated_files'])
+        self.assertIn('/changed.txt', migration.state['failed_files'])
+        self.assertEqual(migration.state['list_cursors'][':'], 'saved_cursor')
+
+    @patch('src.migration.tqdm')
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_files_without_a_recorded_id_are_not_matched_by_name(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, mock_tqdm):
+        del self.mock_state['file_ids']
+        mock_load_state.return_value = self.mock_state
+        mock_dbx_client = MockDropboxClient.return_value
+        mock_dbx_client.iter_list_folder_pages.return_value = iter([
+            MagicMock(entries=[
+                dropbox.files.FileMetadata(name='changed.txt', path_display='/changed.txt', size=100),
+                dropbox.files.DeletedMetadata(name='gone.txt', path_display='/gone.txt'),
+            ], cursor='cursor_2'),
+        ])
+        mock_dbx_client.download_file.return_value = True
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.side_effect = lambda name, parent_id=None: [{'id': 'users_own_id'}] if name in ('changed.txt', 'gone.txt') else []
+        mock_gdrive_client.upload_file.return_value = 'changed_copy_id'
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE)
+        migration.start(delta=True, trash_deleted=True)
+
+        mock_gdrive_client.trash_file.assert_not_called()
+        mock_gdrive_client.update_file.assert_not_called()
+        mock_gdrive_client.upload_file.assert_called_once_with(tmp_path('/changed.txt'), 'changed (1).txt', folder_id=None)
+        self.assertNotIn('/gone.txt', migration.state['migrated_files'])
+
+    @patch('builtins.print')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_delta_without_cursor(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_print):
+        mock_load_state.return_value = {'migrated_files': [], 'skipped_files': [], 'migrated_folders': {'/': None}, 'skipped_folders': []}
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE)
+        migration.start(delta=True)
+
+        mock_print.assert_any_call("No saved listing cursor for this source. Run a full migration first.")
+        MockDropboxClient.return_value.iter_list_folder_pages.assert_not_called()
+
+class TestListingCacheMigration(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmpdir.name, 'listing_cache')
+        self.mock_state = {
+            'migrated_files': [],
+            'skipped_files': [],
+            'migrated_folders': {'/': None},
+            'skipped_folders': []
+        }
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    @patch('builtins.print')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_snapshot_is_reused_and_refreshed(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_print):
+        mock_load_state.return_value = self.mock_state
+        mock_dbx_client = MockDropboxClient.return_value
+        mock_dbx_client.get_latest_cursor.return_value = 'cursor_1'
+        mock_dbx_client.iter_list_folder_pages.return_value = iter([
+            MagicMock(entries=[
+                dropbox.files.FolderMetadata(name='A', path_display='/A'),
+                dropbox.files.FileMetadata(name='file1.txt', path_display='/A/file1.txt', size=100),
+            ]),
+        ])
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, listing_cache_dir=self.cache_dir, listing_max_age=3600)
+        migration.start(dry_run=True)
+        mock_dbx_client.iter_list_folder_pages.assert_called_once_with(path='', recursive=True, team_folder_id=None)
+
+        mock_dbx_client.iter_list_folder_pages.reset_mock()
+        mock_dbx_client.iter_list_folder_pages.return_value = iter([
+            MagicMock(entries=[dropbox.files.FileMetadata(name='file2.txt', path_display='/file2.txt', size=100)], cursor='cursor_2'),
+        ])
+        mock_print.reset_mock()
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, listing_cache_dir=self.cache_dir, listing_max_age=3600)
+        migration.start(dry_run=True)
+
+        mock_dbx_client.iter_list_folder_pages.assert_called_once_with(team_folder_id=None, cursor='cursor_1')
+        mock_dbx_client.list_files_and_folders.assert_not_called()
+        mock_print.assert_any_call("dropbox:/A/file1.txt -> gdrive:A/file1.txt")
+        mock_print.assert_any_call("dropbox:/file2.txt -> gdrive:file2.txt")
+        self.assertEqual(ListingCache(self.cache_dir).load(None, None).cursor, 'cursor_2')
+
+    @patch('builtins.print')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_ls_is_served_from_fresh_snapshot(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_print):
+        mock_load_state.return_value = self.mock_state
+        ListingCache(self.cache_dir).save(None, '/Docs', ListingSnapshot([
+            ListingEntry(FOLDER, '/Docs/A', 'A'),
+            ListingEntry(FILE, '/Docs/A/nested.txt', 'nested.txt', 1),
+            ListingEntry(FILE, '/Docs/top.txt', 'top.txt', 1),
+        ], 'cursor_1', time.time()))
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', src_path='/Docs', state_file=TEST_STATE_FILE, listing_cache_dir=self.cache_dir, listing_max_age=3600)
+        migration.list_source_directory()
+
+        MockDropboxClient.return_value.list_files_and_folders.assert_not_called()
+        self.assertEqual([call.args[0] for call in mock_print.call_args_list], ['./A/', './top.txt'])
+
+    @patch('builtins.print')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_stale_snapshot_is_relisted(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_print):
+        mock_load_state.return_value = self.mock_state
+        ListingCache(self.cache_dir).save(None, None, ListingSnapshot([ListingEntry(FILE, '/old.txt', 'old.txt', 1)], 'cursor_1', time.time() - 7200))
+        mock_dbx_client = MockDropboxClient.return_value
+        mock_dbx_client.get_latest_cursor.return_value = 'cursor_2'
+        mock_dbx_client.iter_list_folder_pages.return_value = iter([
+            MagicMock(entries=[dropbox.files.FileMetadata(name='new.txt', path_display='/new.txt', size=1)]),
+        ])
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, listing_cache_dir=self.cache_dir, listing_max_age=3600)
+        migration.start(dry_run=True)
+
+        mock_dbx_client.iter_list_folder_pages.assert_called_once_with(path='', recursive=True, team_folder_id=None)
+        mock_print.assert_any_call("dropbox:/new.txt -> gdrive:new.txt")
+        snapshot = ListingCache(self.cache_dir).load(None, None)
+        self.assertEqual([entry.path_display for entry in snapshot.entries], ['/new.txt'])
+
+class TestCheckpointedListing(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.checkpoint_dir = os.path.join(self.tmpdir.name, 'listing_cache')
+        self.mock_state = {
+            'migrated_files': [],
+            'skipped_files': [],
+            'migrated_folders': {'/': None},
+            'skipped_folders': []
+        }
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    @patch('src.listing.tqdm')
+    @patch('builtins.print')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_interrupted_listing_resumes_from_checkpoint(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_print, mock_tqdm):
+        mock_load_state.return_value = self.mock_state
+        mock_dbx_client = MockDropboxClient.return_value
+
+        def interrupted_listing(**kwargs):
+            yield MagicMock(entries=[dropbox.files.FileMetadata(name='file1.txt', path_display='/file1.txt', size=1)], cursor='cursor_1')
+            raise dropbox.exceptions.AuthError('request_id', 'expired_access_token')
+        mock_dbx_client.iter_list_folder_pages.side_effect = interrupted_listing
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, listing_checkpoint_dir=self.checkpoint_dir)
+        with self.assertRaises(dropbox.exceptions.AuthError):
+            migration.start(dry_run=True)
+
+        mock_dbx_client.iter_list_folder_pages.reset_mock(side_effect=True)
+        mock_dbx_client.iter_list_folder_pages.return_value = iter([
+            MagicMock(entries=[dropbox.files.FileMetadata(name='file2.txt', path_display='/file2.txt', size=1)], cursor='cursor_2'),
+        ])
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, listing_checkpoint_dir=self.checkpoint_dir)
+        migration.start(dry_run=True)
+
+        mock_dbx_client.iter_list_folder_pages.assert_called_once_with(path='', recursive=True, team_folder_id=None, cursor='cursor_1')
+        mock_print.assert_any_call("dropbox:/file1.txt -> gdrive:file1.txt")
+        mock_print.assert_any_call("dropbox:/file2.txt -> gdrive:file2.txt")
+        self.assertEqual(ListingCache(self.checkpoint_dir).checkpoint(None, None).load(), [])
+        self.assertTrue(any('2 entries in 2 pages' in call.args[0] for call in mock_tqdm.write.call_args_list))
+
+    @patch('src.listing.tqdm')
+    @patch('builtins.print')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_reset_checkpoint_cursor_relists_from_the_start(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_print, mock_tqdm):
+        mock_load_state.return_value = self.mock_state
+        checkpoint = ListingCache(self.checkpoint_dir).checkpoint(None, None)
+        checkpoint.append(to_entries([dropbox.files.FileMetadata(name='stale.txt', path_display='/stale.txt', size=1)]), 'expired_cursor')
+        checkpoint.file.close()
+
+        def listing(cursor=None, **kwargs):
+            if cursor:
+                raise dropbox.exceptions.ApiError('request_id', dropbox.files.ListFolderContinueError.reset, None, None)
+            yield MagicMock(entries=[dropbox.files.FileMetadata(name='file1.txt', path_display='/file1.txt', size=1)], cursor='cursor_1')
+        mock_dbx_client = MockDropboxClient.return_value
+        mock_dbx_client.iter_list_folder_pages.side_effect = listing
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, listing_checkpoint_dir=self.checkpoint_dir)
+        migration.start(dry_run=True)
+
+        mock_dbx_client.iter_list_folder_pages.assert_called_with(path='', recursive=True, team_folder_id=None)
+        mock_print.assert_any_call("dropbox:/file1.txt -> gdrive:file1.txt")
+        self.assertNotIn(call("dropbox:/stale.txt -> gdrive:stale.txt"), mock_print.call_args_list)
+        self.assertEqual(ListingCache(self.checkpoint_dir).checkpoint(None, None).load(), [])
+
+class TestBoundedMemoryMigration(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        self.mock_state = {
+            'migrated_files': ['/Photos/old.jpg'],
+            'skipped_files': [],
+            'migrated_folders': {'/': None},
+            'skipped_folders': []
+        }
+
+    @patch('builtins.input', return_value='y')
+    @patch('src.migration.tqdm')
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_spilled_listing_is_migrated_in_depth_order(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, mock_tqdm, mock_input):
+        mock_load_state.return_value = self.mock_state
+        mock_dbx_client = MockDropboxClient.return_value
+        mock_dbx_client.iter_list_folder_pages.return_value = iter([
+            MagicMock(entries=[
+                dropbox.files.FileMetadata(name='image.jpg', path_display='/Photos/2020/image.jpg', size=200),
+                dropbox.files.FolderMetadata(name='2020', path_display='/Photos/2020'),
+                dropbox.files.FileMetadata(name='old.jpg', path_display='/Photos/old.jpg', size=50),
+            ]),
+            MagicMock(entries=[
+                dropbox.files.FolderMetadata(name='Photos', path_display='/Photos'),
+                dropbox.files.FileMetadata(name='document.txt', path_display='/document.txt', size=100),
+            ]),
+        ])
+        mock_dbx_client.download_file.return_value = True
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+        mock_gdrive_client.create_folder.side_effect = ['photos_id', '2020_id']
+        mock_gdrive_client.upload_file.return_value = 'file_id'
+
+        # A tiny budget makes every entry spill to its own run.
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, memory_budget=2)
+        migration.start()
+
+        mock_dbx_client.list_files_and_folders.assert_not_called()
+        self.assertEqual(mock_gdrive_client.create_folder.call_args_list, [
+            unittest.mock.call('Photos', parent_id=None),
+            unittest.mock.call('2020', parent_id='photos_id'),
+        ])
+        self.assertEqual(mock_gdrive_client.upload_file.call_args_list, [
+            unittest.mock.call(tmp_path('/document.txt'), 'document.txt', folder_id=None),
+            unittest.mock.call(tmp_path('/Photos/2020/image.jpg'), 'image.jpg', folder_id='2020_id'),
+        ])
+        self.assertEqual(migration.total_files_to_migrate, 2)
+        self.assertEqual(migration.migrated_in_session, 2)
+        mock_tqdm.assert_called_once_with(total=300, unit='B', unit_scale=True, desc="Migrating files")
+
+class TestConcurrentTransfers(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        self.mock_state = {
+            'migrated_files': ['/done.txt'],
+            'skipped_files': [],
+            'migrated_folders': {'/': None},
+            'skipped_folders': []
+        }
+        self.files = [ListingEntry(FILE, f"/file{i}.txt", 'same name.txt' if i < 2 else f"file{i}.txt", 10) for i in range(20)]
+        self.files.append(ListingEntry(FILE, '/done.txt', 'done.txt', 10))
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_workers_transfer_files_concurrently(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_save_state):
+        mock_load_state.return_value = self.mock_state
+        mock_dbx_client = MockDropboxClient.return_value
+        local_paths = []
+        threads = set()
+
+        def download(path, local_path, team_folder_id=None):
+            local_paths.append(local_path)
+            threads.add(threading.current_thread().name)
+            with open(local_path, 'w') as f:
+                f.write(path)
+            time.sleep(0.01)
+            return True
+        mock_dbx_client.download_file.side_effect = download
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+        mock_gdrive_client.upload_file.side_effect = lambda local_path, name, folder_id=None: None if name == 'file7.txt' else 'file_id'
+        pbar = MagicMock()
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, transfer_workers=4)
+        migrated = migration._migrate_files(self.files, pbar)
+
+        self.assertEqual(migrated, 19)
+        # Files are downloaded to the same paths as in a sequential run, one per Dropbox path.
+        self.assertEqual(sorted(local_paths), sorted(tmp_path(file.path_display, file.name) for file in self.files[:20]))
+        self.assertGreater(len(threads), 1)
+        self.assertEqual(len(migration.state['migrated_files']), 20)
+        self.assertNotIn('/file7.txt', migration.state['migrated_files'])
+        self.assertFalse(any(os.path.exists(path) for path in local_paths))
+        self.assertEqual(sum(call.args[0] for call in pbar.update.call_args_list), 190)
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_failures_are_recorded_and_limit_is_kept(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_save_state):
+        mock_load_state.return_value = self.mock_state
+        mock_dbx_client = MockDropboxClient.return_value
+
+        def download(path, local_path, team_folder_id=None):
+            if path == '/file0.txt':
+                raise Exception('Download failed')
+            open(local_path, 'w').close()
+            return True
+        mock_dbx_client.download_file.side_effect = download
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+        mock_gdrive_client.upload_file.return_value = 'file_id'
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, transfer_workers=3)
+        migrated = migration._migrate_files(self.files, MagicMock(), limit=5)
+
+        self.assertEqual(migrated, 5)
+        self.assertEqual(mock_gdrive_client.upload_file.call_count, 5)
+        self.assertEqual(migration.failed_files, ['/file0.txt'])
+        self.assertEqual(migration.state['failed_files'], ['/file0.txt'])
+
+class TestAsyncTransfers(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.AsyncTransferEngine')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_small_files_go_through_the_engine(self, MockDropboxClient, MockGoogleDriveClient, MockAsyncTransferEngine, mock_os_remove, mock_load_state, mock_save_state):
+        mock_load_state.return_value = {'migrated_files': [], 'skipped_files': [], 'migrated_folders': {'/': None}, 'skipped_folders': []}
+        MockDropboxClient.return_value.download_file.return_value = True
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.side_effect = lambda name, parent_id=None: [{'id': 'existing'}] if name == 'taken.txt' else []
+        mock_gdrive_client.upload_file.return_value = 'big_id'
+        engine = MockAsyncTransferEngine.return_value
+        engine.concurrency = 2
+        engine.max_file_size = 1000
+        batches = []
+
+        def run(jobs, on_done, read_local=None):
+            batches.append([(file.path_display, plan) for file, plan in jobs])
+            for file, plan in jobs:
+                if file.path_display == '/bad.txt':
+                    on_done(file, None, Exception('HTTP 409'))
+                else:
+                    on_done(file, 'id', None)
+        engine.run.side_effect = run
+
+        files = [
+            ListingEntry(FILE, '/a.txt', 'a.txt', 10),
+            ListingEntry(FILE, '/big.bin', 'big.bin', 5000),
+            ListingEntry(FILE, '/taken.txt', 'taken.txt', 10),
+            ListingEntry(FILE, '/bad.txt', 'bad.txt', 10),
+        ]
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, async_concurrency=2)
+        migration.conflict_resolution_strategy = 'overwrite'
+        migrated = migration._migrate_files(files, MagicMock())
+
+        MockAsyncTransferEngine.assert_called_once_with('fake_dbx_token', 'fake_gdrive_creds', team_folder_id=None, concurrency=2, verify_integrity=False)
+        self.assertEqual(batches, [[('/a.txt', (None, 'a.txt', None)), ('/taken.txt', (None, 'taken.txt', 'existing')), ('/bad.txt', (None, 'bad.txt', None))]])
+        mock_gdrive_client.upload_file.assert_called_once_with(tmp_path('/big.bin'), 'big.bin', folder_id=None)
+        self.assertEqual(migrated, 3)
+        self.assertEqual(migration.state['migrated_files'], ['/big.bin', '/a.txt', '/taken.txt'])
+        self.assertEqual(migration.failed_files, ['/bad.txt'])
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.AsyncTransferEngine')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_next_batch_is_prepared_while_one_transfers(self, MockDropboxClient, MockGoogleDriveClient, MockAsyncTransferEngine, mock_load_state, mock_save_state):
+        mock_load_state.return_value = {'migrated_files': [], 'skipped_files': [], 'migrated_folders': {'/': None}, 'skipped_folders': []}
+        next_batch_checked = threading.Event()
+
+        def find_file(name, parent_id=None):
+            if name == 'file10.txt':
+                next_batch_checked.set()
+            return []
+        MockGoogleDriveClient.return_value.find_file.side_effect = find_file
+        engine = MockAsyncTransferEngine.return_value
+        engine.concurrency = 1
+        engine.max_file_size = 1000
+        overlapped = []
+
+        def run(jobs, on_done, read_local=None):
+            if jobs[0][0].path_display == '/file0.txt':
+                overlapped.append(next_batch_checked.wait(5))
+            for file, plan in jobs:
+                on_done(file, 'id', None)
+        engine.run.side_effect = run
+
+        files = [ListingEntry(FILE, f"/file{i}.txt", f"file{i}.txt", 10) for i in range(11)]
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, async_concurrency=1)
+
+        self.assertEqual(migration._migrate_files(files, MagicMock()), 11)
+        self.assertEqual(overlapped, [True])
+        self.assertEqual(engine.run.call_count, 2)
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.AsyncTransferEngine')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_checksums_verified_by_the_engine_are_recorded(self, MockDropboxClient, MockGoogleDriveClient, MockAsyncTransferEngine, mock_load_state, mock_save_state):
+        mock_load_state.return_value = {'migrated_files': [], 'skipped_files': [], 'migrated_folders': {'/': None}, 'skipped_folders': []}
+        MockGoogleDriveClient.return_value.find_file.return_value = []
+        engine = MockAsyncTransferEngine.return_value
+        engine.concurrency = 1
+        engine.max_file_size = 1000
+        checksums = {'content_hash': 'hash_a', 'md5': 'md5_a'}
+        engine.run.side_effect = lambda jobs, on_done, read_local=None: [on_done(file, 'id', None, checksums) for file, plan in jobs]
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, async_concurrency=1, verify_integrity=True)
+        self.assertEqual(migration._migrate_files([ListingEntry(FILE, '/a.txt', 'a.txt', 10, 'hash_a')], MagicMock()), 1)
+
+        self.assertTrue(MockAsyncTransferEngine.call_args.kwargs['verify_integrity'])
+        self.assertEqual(migration.state['checksums'], {'/a.txt': checksums})
+        self.assertEqual(migration.state['migrated_files'], ['/a.txt'])
+
+class TestStreamTransfers(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_download_is_piped_into_upload(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state):
+        mock_load_state.return_value = {'migrated_files': [], 'skipped_files': [], 'migrated_folders': {'/': None}, 'skipped_folders': []}
+        mock_dbx_client = MockDropboxClient.return_value
+        response = MagicMock()
+        response.iter_content.return_value = iter([b'hello ', b'world'])
+        mock_dbx_client.open_download.return_value = (MagicMock(size=11), response)
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+        uploaded = []
+
+        def upload_media(media, name, folder_id=None, replace_file_id=None, **kwargs):
+            uploaded.append((media.getbytes(0, media.chunksize()), name, folder_id, replace_file_id))
+            return 'file_id'
+        mock_gdrive_client.upload_media.side_effect = upload_media
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, stream_transfers=True)
+        migrated = migration._migrate_files([ListingEntry(FILE, '/hello.txt', 'hello.txt', 11)], MagicMock())
+
+        self.assertEqual(migrated, 1)
+        self.assertEqual(uploaded, [(b'hello world', 'hello.txt', None, None)])
+        mock_dbx_client.open_download.assert_called_once_with('/hello.txt', team_folder_id=None, offset=0)
+        mock_dbx_client.download_file.assert_not_called()
+        mock_os_remove.assert_not_called()
+        response.close.assert_called_once()
+        self.assertEqual(migration.state['migrated_files'], ['/hello.txt'])
+
+class TestSmallFileTransfers(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_files_below_threshold_are_uploaded_from_memory(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state):
+        mock_load_state.return_value = {'migrated_files': [], 'skipped_files': [], 'migrated_folders': {'/': None}, 'skipped_folders': []}
+        mock_dbx_client = MockDropboxClient.return_value
+        mock_dbx_client.download_bytes.return_value = b'tiny'
+        mock_dbx_client.download_file.return_value = True
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+        mock_gdrive_client.upload_bytes.return_value = 'small_id'
+        mock_gdrive_client.upload_file.return_value = 'large_id'
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, small_file_threshold=1000)
+        migrated = migration._migrate_files([
+            ListingEntry(FILE, '/tiny.txt', 'tiny.txt', 4),
+            ListingEntry(FILE, '/large.bin', 'large.bin', 1000),
+        ], MagicMock())
+
+        self.assertEqual(migrated, 2)
+        mock_dbx_client.download_bytes.assert_called_once_with('/tiny.txt', team_folder_id=None)
+        mock_gdrive_client.upload_bytes.assert_called_once_with(b'tiny', 'tiny.txt', folder_id=None, replace_file_id=None)
+        mock_dbx_client.download_file.assert_called_once_with('/large.bin', tmp_path('/large.bin'), team_folder_id=None)
+        mock_gdrive_client.upload_file.assert_called_once_with(tmp_path('/large.bin'), 'large.bin', folder_id=None)
+        mock_os_remove.assert_called_once_with(tmp_path('/large.bin'))
+        self.assertEqual(migration.state['migrated_files'], ['/tiny.txt', '/large.bin'])
+
+class TestResumableUploadSessions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.local_path = os.path.join(self.tmpdir.name, 'big.bin')
+        self.file = ListingEntry(FILE, '/big.bin', 'big.bin', 10, 'hash')
+        self.session = {'uri': 'https://upload/session', 'offset': 4, 'size': 10, 'content_hash': 'hash'}
+        self.mock_state = {'migrated_files': [], 'skipped_files': [], 'migrated_folders': {'/': None}, 'skipped_folders': [],
+                           'upload_sessions': {'/big.bin': dict(self.session)}}
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _migration(self):
+        return Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, resumable_session_threshold=5)
+
+    @patch('src.migration.MediaFileUpload')
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_upload_continues_from_confirmed_offset(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_save_state, MockMediaFileUpload):
+        mock_load_state.return_value = self.mock_state
+        mock_dbx_client = MockDropboxClient.return_value
+        response = MagicMock()
+        response.iter_content.return_value = iter([b'456', b'789'])
+        mock_dbx_client.open_download.return_value = (MagicMock(size=10), response)
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.query_upload_session.return_value = (6, None)
+        sessions = []
+
+        def upload_media(media, name, folder_id=None, replace_file_id=None, session_uri=None, offset=0, on_progress=None):
+            with open(self.local_path, 'rb') as f:
+                f.seek(offset)
+                sessions.append((session_uri, offset, f.read()))
+            on_progress(session_uri, 8)
+            sessions.append(dict(migration.state['upload_sessions']['/big.bin']))
+            return 'file_id'
+        mock_gdrive_client.upload_media.side_effect = upload_media
+
+        migration = self._migration()
+        self.assertTrue(migration._transfer_file(self.file, (None, 'big.bin', None), self.local_path, mock_gdrive_client))
+
+        # Only the part Drive has not confirmed yet is downloaded again.
+        mock_gdrive_client.query_upload_session.assert_called_once_with('https://upload/session', 10)
+        mock_dbx_client.open_download.assert_called_once_with('/big.bin', team_folder_id=None, offset=6)
+        mock_dbx_client.download_file.assert_not_called()
+        MockMediaFileUpload.assert_called_once_with(self.local_path, resumable=True)
+        self.assertEqual(sessions, [('https://upload/session', 6, b'456789'), dict(self.session, offset=8)])
+        self.assertEqual(migration.state['upload_sessions'], {})
+        self.assertEqual(migration.state['migrated_files'], ['/big.bin'])
+        self.assertFalse(os.path.exists(self.local_path))
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_completed_upload_is_not_transferred_again(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_save_state):
+        mock_load_state.return_value = self.mock_state
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.query_upload_session.return_value = (10, 'file_id')
+
+        migration = self._migration()
+        self.assertTrue(migration._transfer_file(self.file, (None, 'big.bin', None), self.local_path, mock_gdrive_client))
+
+        MockDropboxClient.return_value.download_file.assert_not_called()
+        mock_gdrive_client.upload_media.assert_not_called()
+        self.assertEqual(migration.state['upload_sessions'], {})
+        self.assertEqual(migration.state['migrated_files'], ['/big.bin'])
+
+    @patch('src.migration.MediaFileUpload')
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_session_of_changed_file_is_dropped(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, MockMediaFileUpload):
+        mock_load_state.return_value = self.mock_state
+        MockDropboxClient.return_value.download_file.return_value = True
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.upload_media.return_value = 'file_id'
+
+        migration = self._migration()
+        changed = ListingEntry(FILE, '/big.bin', 'big.bin', 10, 'other_hash')
+        self.assertTrue(migration._transfer_file(changed, (None, 'big.bin', None), self.local_path, mock_gdrive_client))
+
+        mock_gdrive_client.query_upload_session.assert_not_called()
+        MockDropboxClient.return_value.download_file.assert_called_once_with('/big.bin', self.local_path, team_folder_id=None)
+        self.assertEqual(mock_gdrive_client.upload_media.call_args.kwargs['session_uri'], None)
+        self.assertEqual(mock_gdrive_client.upload_media.call_args.kwargs['offset'], 0)
+        self.assertEqual(migration.state['upload_sessions'], {})
+
+    @patch('src.migration.MediaFileUpload')
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_upload_starts_over_if_the_rest_of_the_file_is_not_sent_alone(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state, MockMediaFileUpload):
+        mock_load_state.return_value = self.mock_state
+        mock_dbx_client = MockDropboxClient.return_value
+        mock_dbx_client.open_download.side_effect = RangeIgnoredError("Dropbox returned all of /big.bin when asked for it from byte 6.")
+        mock_dbx_client.download_file.return_value = True
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.query_upload_session.return_value = (6, None)
+        mock_gdrive_client.upload_media.return_value = 'file_id'
+
+        migration = self._migration()
+        self.assertTrue(migration._transfer_file(self.file, (None, 'big.bin', None), self.local_path, mock_gdrive_client))
+
+        mock_dbx_client.download_file.assert_called_once_with('/big.bin', self.local_path, team_folder_id=None)
+        mock_gdrive_client.upload_media.assert_called_once()
+        self.assertEqual(mock_gdrive_client.upload_media.call_args.kwargs['session_uri'], None)
+        self.assertEqual(mock_gdrive_client.upload_media.call_args.kwargs['offset'], 0)
+        self.assertEqual(migration.state['migrated_files'], ['/big.bin'])
+
+    @patch('src.migration.MediaFileUpload')
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_leftover_copy_is_only_reused_if_its_content_hash_matches(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_save_state, MockMediaFileUpload):
+        hasher = ContentHasher()
+        hasher.update(b'0123456789')
+        file = ListingEntry(FILE, '/big.bin', 'big.bin', 10, hasher.hexdigest())
+        session = dict(self.session, content_hash=file.content_hash)
+        mock_dbx_client = MockDropboxClient.return_value
+        response = MagicMock()
+        response.iter_content.return_value = iter([b'6789'])
+        mock_dbx_client.open_download.return_value = (MagicMock(size=10), response)
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.query_upload_session.return_value = (6, None)
+        mock_gdrive_client.upload_media.return_value = 'file_id'
+
+        for leftover, downloads in ((b'0123456789', 0), (b'abcdefghij', 1)):
+            mock_load_state.return_value = dict(self.mock_state, upload_sessions={'/big.bin': dict(session)})
+            mock_dbx_client.open_download.reset_mock()
+            with open(self.local_path, 'wb') as f:
+                f.write(leftover)
+
+            migration = self._migration()
+            self.assertTrue(migration._transfer_file(file, (None, 'big.bin', None), self.local_path, mock_gdrive_client))
+
+            self.assertEqual(mock_dbx_client.open_download.call_count, downloads)
+
+    def test_files_with_the_same_name_get_their_own_download_path(self):
+        migration = Migration.__new__(Migration)
+        first = migration._local_path(ListingEntry(FILE, '/A/report.pdf', 'report.pdf', 10))
+        second = migration._local_path(ListingEntry(FILE, '/B/report.pdf', 'report.pdf', 10))
+
+        self.assertNotEqual(first, second)
+        self.assertTrue(first.endswith('_report.pdf'))
+
+class TestRangedDownloads(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_large_files_are_downloaded_in_ranges(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state):
+        mock_load_state.return_value = {'migrated_files': [], 'skipped_files': [], 'migrated_folders': {'/': None}, 'skipped_folders': []}
+        mock_dbx_client = MockDropboxClient.return_value
+        mock_dbx_client.download_file.return_value = True
+        mock_dbx_client.download_file_ranged.return_value = True
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+        mock_gdrive_client.upload_file.return_value = 'file_id'
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, ranged_download_threshold=1000, download_ranges=8)
+        migration._migrate_files([ListingEntry(FILE, '/small.txt', 'small.txt', 10), ListingEntry(FILE, '/video.mp4', 'video.mp4', 5000)], MagicMock())
+
+        mock_dbx_client.download_file.assert_called_once_with('/small.txt', tmp_path('/small.txt'), team_folder_id=None)
+        mock_dbx_client.download_file_ranged.assert_called_once_with('/video.mp4', tmp_path('/video.mp4'), team_folder_id=None, max_workers=8)
+        self.assertEqual(migration.state['migrated_files'], ['/small.txt', '/video.mp4'])
+
+class TestTransferOrder(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        self.mock_state = {'migrated_files': [], 'skipped_files': [], 'migrated_folders': {'/': None}, 'skipped_folders': []}
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_recent_files_are_transferred_first(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state):
+        mock_load_state.return_value = self.mock_state
+        MockDropboxClient.return_value.download_file.return_value = True
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+        mock_gdrive_client.upload_file.return_value = 'file_id'
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, transfer_policy='recent-first')
+        migration._migrate_files([
+            ListingEntry(FILE, '/old.txt', 'old.txt', 10, None, 100.0),
+            ListingEntry(FILE, '/new.txt', 'new.txt', 10, None, 300.0),
+        ], MagicMock())
+
+        self.assertEqual(migration.state['migrated_files'], ['/new.txt', '/old.txt'])
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_small_files_are_not_blocked_by_large_ones(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_save_state):
+        mock_load_state.return_value = self.mock_state
+        small_files = [ListingEntry(FILE, f"/small{i}.txt", f"small{i}.txt", 10) for i in range(10)]
+        large_files = [ListingEntry(FILE, f"/large{i}.bin", f"large{i}.bin", 10 ** 9) for i in range(4)]
+        small_done = threading.Event()
+        finished_small = []
+
+        def download(path, local_path, team_folder_id=None):
+            if path.startswith('/large'):
+                # Large transfers only finish once every small file is through.
+                self.assertTrue(small_done.wait(5))
+            else:
+                finished_small.append(path)
+                if len(finished_small) == len(small_files):
+                    small_done.set()
+            open(local_path, 'w').close()
+            return True
+        MockDropboxClient.return_value.download_file.side_effect = download
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+        mock_gdrive_client.upload_file.return_value = 'file_id'
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, transfer_workers=4, transfer_policy='small-files-lane')
+        migrated = migration._migrate_files(large_files + small_files, MagicMock())
+
+        self.assertEqual(migrated, 14)
+        self.assertEqual(migration.failed_files, [])
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_drained_lane_hands_its_workers_to_the_other(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_save_state):
+        mock_load_state.return_value = self.mock_state
+        small_files = [ListingEntry(FILE, '/small.txt', 'small.txt', 10)]
+        large_files = [ListingEntry(FILE, f"/large{i}.bin", f"large{i}.bin", 10 ** 9) for i in range(6)]
+        # The first four large transfers only finish once all four run at the same time.
+        all_workers_busy = threading.Barrier(4, timeout=5)
+        lock = threading.Lock()
+        started = []
+
+        def download(path, local_path, team_folder_id=None):
+            if path.startswith('/large'):
+                with lock:
+                    started.append(path)
+                    waits = len(started) <= 4
+                if waits:
+                    all_workers_busy.wait()
+            open(local_path, 'w').close()
+            return True
+        MockDropboxClient.return_value.download_file.side_effect = download
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+        mock_gdrive_client.upload_file.return_value = 'file_id'
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, transfer_workers=4, transfer_policy='small-files-lane')
+        migrated = migration._migrate_files(small_files + large_files, MagicMock())
+
+        self.assertEqual(migrated, 7)
+        self.assertEqual(migration.failed_files, [])
+
+
+class TestBatchedFolderRequests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        self.mock_state = {'migrated_files': [], 'skipped_files': [], 'migrated_folders': {'/': None}, 'skipped_folders': []}
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_folders_are_created_one_level_per_batch(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_save_state):
+        mock_load_state.return_value = self.mock_state
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_files_batch.side_effect = lambda lookups: [[{'id': 'existing_a'}] if name == 'A' else [] for name, _ in lookups]
+        mock_gdrive_client.create_folders_batch.side_effect = lambda folders: [f"id_{name}" for name, _ in folders]
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, batch_requests=True)
+        migration._migrate_folders([
+            ListingEntry(FOLDER, '/A/C', 'C'),
+            ListingEntry(FOLDER, '/A', 'A'),
+            ListingEntry(FOLDER, '/B', 'B'),
+            ListingEntry(FOLDER, '/B/D', 'D'),
+        ])
+
+        self.assertEqual([call.args[0] for call in mock_gdrive_client.find_files_batch.call_args_list], [
+            [('A', None), ('B', None)],
+            [('C', 'existing_a'), ('D', 'id_B')],
+        ])
+        self.assertEqual([call.args[0] for call in mock_gdrive_client.create_folders_batch.call_args_list], [
+            [('B', None)],
+            [('C', 'existing_a'), ('D', 'id_B')],
+        ])
+        self.assertEqual(migration.state['migrated_folders'], {'/': None, '/A': 'existing_a', '/B': 'id_B', '/A/C': 'id_C', '/B/D': 'id_D'})
+        mock_gdrive_client.find_file.assert_not_called()
+        mock_gdrive_client.create_folder.assert_not_called()
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_failed_folder_is_raised_after_the_others_are_recorded(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_save_state):
+        mock_load_state.return_value = self.mock_state
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        error = Exception('Forbidden')
+        mock_gdrive_client.find_files_batch.return_value = [[], []]
+        mock_gdrive_client.create_folders_batch.return_value = [error, 'id_B']
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, batch_requests=True)
+        with self.assertRaises(Exception) as raised:
+            migration._migrate_folders([ListingEntry(FOLDER, '/A', 'A'), ListingEntry(FOLDER, '/B', 'B')])
+
+        self.assertIs(raised.exception, error)
+        self.assertEqual(migration.state['migrated_folders'], {'/': None, '/B': 'id_B'})
+        mock_save_state.assert_called()
+
+
+class TestSpooledTransfers(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        self.mock_state = {'migrated_files': [], 'skipped_files': [], 'migrated_folders': {'/': None}, 'skipped_folders': []}
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_failed_upload_is_retried_from_the_spooled_copy(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_save_state):
+        mock_load_state.return_value = self.mock_state
+        mock_dropbox_client = MockDropboxClient.return_value
+
+        def download(path, local_path, team_folder_id=None):
+            with open(local_path, 'wb') as f:
+                f.write(b'x' * 100)
+            return True
+        mock_dropbox_client.download_file.side_effect = download
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+        mock_gdrive_client.upload_file.side_effect = [Exception('Upload failed'), 'file_id']
+
+        spool_dir = os.path.join(self.tmpdir.name, 'spool')
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, spool_dir=spool_dir, spool_budget=1000)
+        hasher = ContentHasher()
+        hasher.update(b'x' * 100)
+        file = ListingEntry(FILE, '/a.txt', 'a.txt', 100, hasher.hexdigest())
+        migration._migrate_files([file], MagicMock())
+        self.assertTrue(os.path.exists(os.path.join(spool_dir, file.content_hash)))
+
+        migration._migrate_files([file], MagicMock())
+
+        self.assertEqual(mock_dropbox_client.download_file.call_count, 1)
+        mock_gdrive_client.upload_file.assert_called_with(os.path.join(spool_dir, file.content_hash), 'a.txt', folder_id=None)
+        self.assertEqual(migration.state['migrated_files'], ['/a.txt'])
+        self.assertEqual(os.listdir(spool_dir), [])
+
+
+class TestZipFolderTransfers(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        self.mock_state = {'migrated_files': [], 'skipped_files': [], 'migrated_folders': {'/': None, '/Notes': 'notes_id'}, 'skipped_folders': []}
+        self.files = [ListingEntry(FILE, f"/Notes/note{i}.txt", f"note{i}.txt", 5) for i in range(3)]
+
+    def _write_archive(self, path, local_path, team_folder_id=None):
+        with zipfile.ZipFile(local_path, 'w') as archive:
+            for i in range(2):
+                archive.writestr(f"Notes/note{i}.txt", f"note {i}")
+        return True
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_folder_is_downloaded_as_one_archive(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state):
+        mock_load_state.return_value = self.mock_state
+        mock_dropbox_client = MockDropboxClient.return_value
+        mock_dropbox_client.download_zip.side_effect = self._write_archive
+        mock_dropbox_client.download_file.return_value = True
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+        mock_gdrive_client.upload_bytes.return_value = 'file_id'
+        mock_gdrive_client.upload_file.return_value = 'file_id'
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, zip_min_files=3)
+        self.assertEqual(migration._migrate_files(self.files, MagicMock(), listing=self.files), 3)
+
+        mock_dropbox_client.download_zip.assert_called_once()
+        self.assertEqual(mock_dropbox_client.download_zip.call_args.args[0], '/Notes')
+        mock_gdrive_client.upload_bytes.assert_any_call(b'note 0', 'note0.txt', folder_id='notes_id', replace_file_id=None)
+        self.assertEqual(mock_gdrive_client.upload_bytes.call_count, 2)
+        # The file missing from the archive is transferred on its own.
+        mock_dropbox_client.download_file.assert_called_once_with('/Notes/note2.txt', tmp_path('/Notes/note2.txt'), team_folder_id=None)
+        self.assertEqual(migration.state['migrated_files'], ['/Notes/note0.txt', '/Notes/note1.txt', '/Notes/note2.txt'])
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_files_are_transferred_one_by_one_if_the_archive_fails(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state):
+        mock_load_state.return_value = self.mock_state
+        mock_dropbox_client = MockDropboxClient.return_value
+        mock_dropbox_client.download_zip.side_effect = Exception('too_many_files')
+        mock_dropbox_client.download_file.return_value = True
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+        mock_gdrive_client.upload_file.return_value = 'file_id'
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, zip_min_files=3)
+        self.assertEqual(migration._migrate_files(self.files, MagicMock(), limit=2, listing=self.files), 2)
+
+        self.assertEqual(mock_dropbox_client.download_file.call_count, 2)
+        self.assertEqual(migration.state['migrated_files'], ['/Notes/note0.txt', '/Notes/note1.txt'])
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_archived_files_go_through_the_workers(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_save_state):
+        mock_load_state.return_value = self.mock_state
+        mock_dropbox_client = MockDropboxClient.return_value
+        mock_dropbox_client.download_zip.side_effect = self._write_archive
+        mock_dropbox_client.download_bytes.return_value = b'note 2'
+        thread_client = MagicMock()
+        thread_client.upload_bytes.return_value = 'file_id'
+        MockGoogleDriveClient.side_effect = [MagicMock(), thread_client, thread_client]
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, zip_min_files=3, transfer_workers=2, small_file_threshold=1024)
+        migration.google_drive_client.find_file.return_value = []
+        self.assertEqual(migration._migrate_files(self.files, MagicMock(), listing=self.files), 3)
+
+        mock_dropbox_client.download_zip.assert_called_once()
+        # Files in the archive are not downloaded again; the one missing from it is.
+        mock_dropbox_client.download_bytes.assert_called_once_with('/Notes/note2.txt', team_folder_id=None)
+        self.assertEqual(sorted(c.args[0] for c in thread_client.upload_bytes.call_args_list), [b'note 0', b'note 1', b'note 2'])
+        self.assertEqual(migration.local_copies, {})
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_archived_duplicates_are_copied(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_save_state):
+        mock_load_state.return_value = self.mock_state
+        MockDropboxClient.return_value.download_zip.side_effect = self._write_archive
+        MockDropboxClient.return_value.download_bytes.return_value = b'note 2'
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+        mock_gdrive_client.upload_bytes.return_value = 'file_id'
+        mock_gdrive_client.copy_file.return_value = 'copy_id'
+        files = [ListingEntry(FILE, f"/Notes/note{i}.txt", f"note{i}.txt", 5, 'same_hash' if i else 'other_hash') for i in range(3)]
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, zip_min_files=3, dedup=True)
+        self.assertEqual(migration._migrate_files(files, MagicMock(), listing=files), 3)
+
+        mock_gdrive_client.copy_file.assert_called_once_with('file_id', 'note2.txt', folder_id='notes_id')
+        MockDropboxClient.return_value.download_bytes.assert_not_called()
+        self.assertEqual(migration.local_copies, {})
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.AsyncTransferEngine')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_archived_files_go_through_the_async_engine(self, MockDropboxClient, MockGoogleDriveClient, MockAsyncTransferEngine, mock_load_state, mock_save_state):
+        mock_load_state.return_value = self.mock_state
+        MockDropboxClient.return_value.download_zip.side_effect = self._write_archive
+        MockGoogleDriveClient.return_value.find_file.return_value = []
+        engine = MockAsyncTransferEngine.return_value
+        engine.concurrency = 10
+        engine.max_file_size = 1000
+        read = {}
+
+        def run(jobs, on_done, read_local=None):
+            for file, plan in jobs:
+                read[file.path_display] = read_local(file)
+                on_done(file, 'id', None)
+        engine.run.side_effect = run
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, zip_min_files=3, async_concurrency=10)
+        self.assertEqual(migration._migrate_files(self.files, MagicMock(), listing=self.files), 3)
+
+        self.assertEqual(read, {'/Notes/note0.txt': b'note 0', '/Notes/note1.txt': b'note 1', '/Notes/note2.txt': None})
+        self.assertEqual(engine.run.call_count, 1)
+
+
+class TestIntegrityVerification(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        self.mock_state = {'migrated_files': [], 'skipped_files': [], 'migrated_folders': {'/': None}, 'skipped_folders': []}
+        self.content_hash = hashlib.sha256(hashlib.sha256(b'hello').digest()).hexdigest()
+        self.md5 = hashlib.md5(b'hello').hexdigest()
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_checksums_are_verified_while_downloading(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state):
+        mock_load_state.return_value = self.mock_state
+
+        def download(path, local_path, team_folder_id=None, hasher=None):
+            hasher.reset()
+            hasher.update(b'hello')
+            return True
+        MockDropboxClient.return_value.download_file.side_effect = download
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+        mock_gdrive_client.upload_file.return_value = ('file_id', 'corrupted')
+        mock_gdrive_client.update_file.return_value = ('file_id', self.md5)
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, verify_integrity=True)
+        migration._migrate_files([ListingEntry(FILE, '/a.txt', 'a.txt', 5, self.content_hash)], MagicMock())
+
+        mock_gdrive_client.upload_file.assert_called_once_with(tmp_path('/a.txt'), 'a.txt', folder_id=None, with_md5=True)
+        # The second attempt replaces the content of the corrupted upload.
+        mock_gdrive_client.update_file.assert_called_once_with('file_id', tmp_path('/a.txt'), with_md5=True)
+        self.assertEqual(migration.state['migrated_files'], ['/a.txt'])
+        self.assertEqual(migration.state['checksums'], {'/a.txt': {'content_hash': self.content_hash, 'md5': self.md5}})
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_file_whose_download_keeps_mismatching_fails(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_save_state):
+        mock_load_state.return_value = self.mock_state
+        MockDropboxClient.return_value.download_bytes.return_value = b'changed'
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, verify_integrity=True, small_file_threshold=1024)
+        migration._migrate_files([ListingEntry(FILE, '/a.txt', 'a.txt', 5, self.content_hash)], MagicMock())
+
+        self.assertEqual(MockDropboxClient.return_value.download_bytes.call_count, 3)
+        mock_gdrive_client.upload_bytes.assert_not_called()
+        self.assertEqual(migration.state['failed_files'], ['/a.txt'])
+        self.assertEqual(migration.state['migrated_files'], [])
+
+
+class TestContentDeduplication(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        self.mock_state = {'migrated_files': [], 'skipped_files': [], 'migrated_folders': {'/': None, '/A': 'folder_a', '/B': 'folder_b'}, 'skipped_folders': []}
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_duplicate_content_is_copied_on_drive(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state):
+        mock_load_state.return_value = self.mock_state
+        MockDropboxClient.return_value.download_file.return_value = True
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+        mock_gdrive_client.upload_file.return_value = 'uploaded_id'
+        mock_gdrive_client.copy_file.return_value = 'copy_id'
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, dedup=True)
+        migration._migrate_files([
+            ListingEntry(FILE, '/A/setup.exe', 'setup.exe', 100, 'hash_setup'),
+            ListingEntry(FILE, '/B/setup.exe', 'setup.exe', 100, 'hash_setup'),
+        ], MagicMock())
+
+        MockDropboxClient.return_value.download_file.assert_called_once()
+        mock_gdrive_client.copy_file.assert_called_once_with('uploaded_id', 'setup.exe', folder_id='folder_b')
+        self.assertEqual(migration.state['migrated_files'], ['/A/setup.exe', '/B/setup.exe'])
+        self.assertEqual(migration.state['content_files'], {'hash_setup': 'uploaded_id'})
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_file_is_transferred_if_the_indexed_copy_is_gone(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state):
+        self.mock_state['content_files'] = {'hash_setup': 'deleted_id'}
+        mock_load_state.return_value = self.mock_state
+        MockDropboxClient.return_value.download_file.return_value = True
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.find_file.return_value = []
+        mock_gdrive_client.upload_file.return_value = 'uploaded_id'
+        mock_gdrive_client.copy_file.side_effect = HttpError(MagicMock(status=404), b'File not found')
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, dedup=True)
+        migration._migrate_files([ListingEntry(FILE, '/A/setup.exe', 'setup.exe', 100, 'hash_setup')], MagicMock())
+
+        mock_gdrive_client.upload_file.assert_called_once()
+        self.assertEqual(migration.state['content_files'], {'hash_setup': 'uploaded_id'})
+        self.assertEqual(migration.content_file_index, {'uploaded_id': 'hash_setup'})
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_clients_share_a_limiter_per_service(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state):
+        mock_load_state.return_value = {'migrated_files': [], 'skipped_files': [], 'migrated_folders': {'/': None}, 'skipped_folders': []}
+        thread_client = MagicMock()
+        MockGoogleDriveClient.side_effect = [MagicMock(), thread_client]
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, adaptive_concurrency=16)
+        migration._transfer_file = MagicMock(return_value=True)
+        migration._run_transfer(ListingEntry(FILE, '/a.txt', 'a.txt', 5), (None, 'a.txt', None), '/tmp/a.txt')
+
+        self.assertEqual(migration.dropbox_limiter.name, 'Dropbox')
+        self.assertIs(MockDropboxClient.return_value.limiter, migration.dropbox_limiter)
+        self.assertIs(migration.google_drive_client.limiter, migration.drive_limiter)
+        self.assertIs(thread_client.limiter, migration.drive_limiter)
+        self.assertEqual(migration.drive_limiter.limit, 4)
+
+
+class TestDriveIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_conflicts_are_checked_from_the_folder_listing(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state):
+        mock_load_state.return_value = {'migrated_files': [], 'skipped_files': [], 'migrated_folders': {'/': None, '/Docs': 'docs_id'}, 'skipped_folders': []}
+        MockDropboxClient.return_value.download_file.return_value = True
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.list_children.return_value = iter([{'id': 'existing_id', 'name': 'taken.txt'}])
+        mock_gdrive_client.upload_file.side_effect = ['id_1', 'id_2']
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, drive_index_folders=10)
+        migration.conflict_resolution_strategy = 'skip'
+        migration._migrate_files([
+            ListingEntry(FILE, '/Docs/new.txt', 'new.txt', 10),
+            ListingEntry(FILE, '/Docs/taken.txt', 'taken.txt', 10),
+            ListingEntry(FILE, '/Docs/other.txt', 'other.txt', 10),
+        ], MagicMock())
+
+        mock_gdrive_client.find_file.assert_not_called()
+        mock_gdrive_client.list_children.assert_called_once_with('docs_id')
+        self.assertEqual(migration.state['migrated_files'], ['/Docs/new.txt', '/Docs/other.txt'])
+        self.assertEqual(migration.state['skipped_files'], ['/Docs/taken.txt'])
+        self.assertEqual(migration.drive_index.find('new.txt', 'docs_id'), [{'id': 'id_1', 'name': 'new.txt'}])
+
+
+class TestUniqueNameReservation(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        self.mock_state = {'migrated_files': [], 'skipped_files': [], 'migrated_folders': {'/': None}, 'skipped_folders': []}
+
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_renamed_files_do_not_get_the_same_name_before_upload(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state):
+        mock_load_state.return_value = self.mock_state
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        # Nothing is uploaded yet, so Drive only knows about the original.
+        mock_gdrive_client.find_file.side_effect = lambda name, parent_id=None: [{'id': 'existing_id'}] if name == 'a.txt' else []
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE)
+
+        self.assertEqual(migration._get_unique_name('a.txt', 'folder'), 'a (1).txt')
+        self.assertEqual(migration._get_unique_name('a.txt', 'folder'), 'a (2).txt')
+        self.assertEqual(migration._get_unique_name('a.txt', 'other_folder'), 'a (1).txt')
+
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_renames_need_no_requests_with_the_drive_index(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state):
+        mock_load_state.return_value = self.mock_state
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.list_children.return_value = iter([{'id': f"id_{i}", 'name': f"a ({i}).txt" if i else 'a.txt'} for i in range(50)])
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, drive_index_folders=10)
+        migration.conflict_resolution_strategy = 'rename'
+        plans = [migration._prepare_file(ListingEntry(FILE, '/a.txt', 'a.txt', 10)) for _ in range(3)]
+
+        self.assertEqual([upload_name for _, upload_name, _ in plans], ['a (50).txt', 'a (51).txt', 'a (52).txt'])
+        mock_gdrive_client.find_file.assert_not_called()
+        mock_gdrive_client.list_children.assert_called_once()
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('os.remove')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_file_named_like_a_reservation_is_not_overwritten_onto_it(self, MockDropboxClient, MockGoogleDriveClient, mock_os_remove, mock_load_state, mock_save_state):
+        mock_load_state.return_value = self.mock_state
+        MockDropboxClient.return_value.download_file.return_value = True
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.list_children.return_value = iter([{'id': 'existing_id', 'name': 'a.txt'}])
+        mock_gdrive_client.upload_file.return_value = 'new_id'
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, drive_index_folders=10)
+        migration.conflict_resolution_strategy = 'rename'
+        self.assertEqual(migration._prepare_file(ListingEntry(FILE, '/a.txt', 'a.txt', 10)), (None, 'a (1).txt', None))
+
+        migration.conflict_resolution_strategy = 'overwrite'
+        plan = migration._prepare_file(ListingEntry(FILE, '/a (1).txt', 'a (1).txt', 10))
+
+        self.assertEqual(plan, (None, 'a (1).txt', None))
+        mock_gdrive_client.update_file.assert_not_called()
+
+    @patch('src.migration.Migration._save_state')
+    @patch('src.migration.Migration._load_state')
+    @patch('src.migration.GoogleDriveClient')
+    @patch('src.migration.DropboxClient')
+    def test_failed_upload_gives_back_its_name(self, MockDropboxClient, MockGoogleDriveClient, mock_load_state, mock_save_state):
+        mock_load_state.return_value = self.mock_state
+        MockDropboxClient.return_value.download_file.side_effect = Exception("Download failed")
+        mock_gdrive_client = MockGoogleDriveClient.return_value
+        mock_gdrive_client.list_children.return_value = iter([{'id': 'existing_id', 'name': 'a.txt'}])
+
+        migration = Migration('fake_dbx_token', 'fake_gdrive_creds', state_file=TEST_STATE_FILE, drive_index_folders=10)
+        migration.conflict_resolution_strategy = 'rename'
+        migration._migrate_files([ListingEntry(FILE, '/a.txt', 'a.txt', 10)], MagicMock())
+
+        self.assertEqual(migration.state['failed_files'], ['/a.txt'])
+        self.assertEqual(migration.drive_index._reserved, {})
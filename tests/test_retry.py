@@ -1,6 +1,7 @@
 import unittest
 from unittest.mock import patch, MagicMock
 from src.retry import retry_on_exception
+from src.concurrency import AIMDLimiter
 import logging
 
 class TestRetryDecorator(unittest.TestCase):
@@ -54,5 +55,26 @@ class TestRetryDecorator(unittest.TestCase):
         self.assertEqual(mock_func.call_count, 2)
         self.assertEqual(mock_sleep.call_count, 1)
 
+    @patch('time.sleep')
+    def test_attempts_run_in_the_limiter_of_the_object(self, mock_sleep):
+        class Client:
+            def __init__(self):
+                self.limiter = AIMDLimiter('Test', 4, initial=2, is_throttle=lambda e: isinstance(e, ValueError))
+                self.calls = 0
+
+            @retry_on_exception(ValueError, max_retries=3)
+            def call(self):
+                self.calls += 1
+                self.in_flight = self.limiter.in_flight
+                if self.calls == 1:
+                    raise ValueError("Too many requests")
+                return "success"
+
+        client = Client()
+        self.assertEqual(client.call(), "success")
+        self.assertEqual(client.in_flight, 1)
+        self.assertEqual(client.limiter.in_flight, 0)
+        self.assertEqual(client.limiter.limit, 1.0 + 1.0)
+
 if __name__ == '__main__':
     unittest.main()
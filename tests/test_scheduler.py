@@ -0,0 +1,38 @@
+import unittest
+from src.listing import ListingEntry, FILE
+from src.scheduler import TransferScheduler
+
+def entry(name, size, server_modified=None):
+    return ListingEntry(FILE, f"/{name}", name, size, None, server_modified)
+
+class TestTransferScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.files = [entry('a', 10, 300.0), entry('huge', 5000, 100.0), entry('b', 20, None), entry('big', 3000, 400.0), entry('c', 30, 200.0)]
+
+    def names(self, files):
+        return [f.name for f in files]
+
+    def test_listing_order_is_kept(self):
+        self.assertIs(TransferScheduler().order(self.files), self.files)
+
+    def test_size_balanced_alternates_large_and_small(self):
+        self.assertEqual(self.names(TransferScheduler('size-balanced').order(self.files)), ['huge', 'a', 'big', 'b', 'c'])
+
+    def test_recent_first(self):
+        self.assertEqual(self.names(TransferScheduler('recent-first').order(iter(self.files))), ['big', 'a', 'c', 'huge', 'b'])
+
+    def test_small_files_lane(self):
+        scheduler = TransferScheduler('small-files-lane', small_file_size=1000)
+        small, large = scheduler.lanes(self.files)
+        self.assertEqual((self.names(small), self.names(large)), (['a', 'b', 'c'], ['huge', 'big']))
+        self.assertEqual(self.names(scheduler.order(self.files)), ['a', 'b', 'c', 'huge', 'big'])
+        self.assertEqual(scheduler.lane_slots(2), (1, 1))
+        self.assertEqual(scheduler.lane_slots(5), (2, 3))
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            TransferScheduler('random')
+
+if __name__ == '__main__':
+    unittest.main()
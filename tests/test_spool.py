@@ -0,0 +1,85 @@
+import unittest
+import os
+import tempfile
+import threading
+from unittest.mock import patch
+from src.listing import ListingEntry, FILE
+from src.spool import Spool, SpoolFullError
+
+class TestSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmpdir.name, 'spool')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write(self, path, size):
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+
+    def test_copy_is_kept_for_the_next_attempt_and_evicted_once_migrated(self):
+        spool = Spool(self.directory, budget=1000)
+        file = ListingEntry(FILE, '/a.txt', 'a.txt', 100, 'hash_a')
+
+        path = spool.acquire(file)
+        self.assertEqual(path, os.path.join(self.directory, 'hash_a'))
+        self._write(path, 100)
+        spool.release(file, keep=True)
+        self.assertTrue(os.path.exists(path))
+
+        # A new run finds the copy left by the earlier one.
+        spool = Spool(self.directory, budget=1000)
+        self.assertEqual(spool.acquire(file), path)
+        spool.release(file)
+        self.assertFalse(os.path.exists(path))
+
+    def test_idle_copies_are_evicted_to_make_room(self):
+        spool = Spool(self.directory, budget=250)
+        old = ListingEntry(FILE, '/old.txt', 'old.txt', 100, 'hash_old')
+        kept = ListingEntry(FILE, '/kept.txt', 'kept.txt', 100, 'hash_kept')
+        new = ListingEntry(FILE, '/new.txt', 'new.txt', 100, 'hash_new')
+        for file in (old, kept):
+            self._write(spool.acquire(file), 100)
+            spool.release(file, keep=True)
+
+        spool.acquire(new)
+
+        self.assertFalse(os.path.exists(spool.path(old)))
+        self.assertTrue(os.path.exists(spool.path(kept)))
+
+    def test_download_waits_until_it_fits_in_the_budget(self):
+        spool = Spool(self.directory, budget=150)
+        first = ListingEntry(FILE, '/first.txt', 'first.txt', 100, 'hash_first')
+        second = ListingEntry(FILE, '/second.txt', 'second.txt', 100, 'hash_second')
+        spool.acquire(first)
+        acquired = threading.Event()
+
+        def acquire_second():
+            spool.acquire(second)
+            acquired.set()
+        thread = threading.Thread(target=acquire_second)
+        thread.start()
+
+        self.assertFalse(acquired.wait(0.2))
+        spool.release(first)
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+
+    def test_file_larger_than_the_budget_is_admitted_alone(self):
+        spool = Spool(self.directory, budget=10)
+        path = spool.acquire(ListingEntry(FILE, '/big.bin', 'big.bin', 100, 'hash_big'))
+        self.assertTrue(path.endswith('hash_big'))
+
+    @patch('src.spool.shutil.disk_usage')
+    def test_file_that_does_not_fit_on_disk_is_refused(self, mock_disk_usage):
+        mock_disk_usage.return_value.free = 50
+        spool = Spool(self.directory)
+        file = ListingEntry(FILE, '/big.bin', 'big.bin', 100, 'hash_big')
+        with self.assertRaises(SpoolFullError):
+            spool.acquire(file)
+        spool.release(file)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,283 @@
+import unittest
+import tempfile
+import json
+import os
+import logging
+from src.state_store import JsonStateStore, SQLiteStateStore, JournalStateStore, create_state_store, empty_state, apply_event, build_index
+
+class TestApplyEvent(unittest.TestCase):
+
+    def test_indexes_follow_the_state(self):
+        state = empty_state()
+        state['content_files'] = {'hash_a': 'id_1'}
+        index = build_index(state)
+        apply_event(state, 'failed_file', '/a.txt', 'error', index)
+        apply_event(state, 'migrated_file', '/a.txt', None, index)
+        apply_event(state, 'content_file', 'hash_a', 'id_2', index)
+
+        self.assertEqual((state['migrated_files'], state['failed_files']), (['/a.txt'], []))
+        self.assertEqual((index['migrated_files'], index['failed_files']), ({'/a.txt'}, set()))
+        self.assertEqual(index['content_file_ids'], {'id_2': 'hash_a'})
+
+class TestJsonStateStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'state.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_load_missing_file_returns_empty_state(self):
+        store = JsonStateStore(self.path)
+        self.assertEqual(store.load(), empty_state())
+
+    def test_save_and_load(self):
+        store = JsonStateStore(self.path)
+        state = empty_state()
+        state['migrated_files'].append('/a.txt')
+        store.save(state)
+        self.assertEqual(JsonStateStore(self.path).load()['migrated_files'], ['/a.txt'])
+
+class TestSQLiteStateStore(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.json_path = os.path.join(self.tmpdir.name, 'state.json')
+        self.db_path = os.path.join(self.tmpdir.name, 'state.db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_record_and_reload(self):
+        store = SQLiteStateStore(self.db_path)
+        store.load()
+        store.record('folder', '/Photos', 'folder_id')
+        store.record('skipped_folder', '/Private')
+        store.record('failed_file', '/a.txt', 'boom')
+        store.record('migrated_file', '/a.txt')
+        store.record('skipped_file', '/b.txt')
+        store.save(None)
+        store.close()
+
+        state = SQLiteStateStore(self.db_path).load()
+        self.assertEqual(state['migrated_files'], ['/a.txt'])
+        self.assertEqual(state['skipped_files'], ['/b.txt'])
+        self.assertEqual(state['failed_files'], [])
+        self.assertEqual(state['migrated_folders'], {'/': None, '/Photos': 'folder_id'})
+        self.assertEqual(state['skipped_folders'], ['/Private'])
+
+    def test_drive_file_ids(self):
+        store = SQLiteStateStore(self.db_path)
+        store.record('migrated_file', '/a.txt', 'file_a')
+        store.record('migrated_file', '/b.txt', 'file_b')
+        store.record('removed_file', '/b.txt')
+        store.close()
+
+        self.assertEqual(SQLiteStateStore(self.db_path).load()['file_ids'], {'/a.txt': 'file_a'})
+
+    def test_cursor_and_removal_events(self):
+        store = SQLiteStateStore(self.db_path)
+        store.record('migrated_file', '/a.txt')
+        store.record('folder', '/Old', 'folder_id')
+        store.record('cursor', ':/src', 'cursor123')
+        store.record('removed_file', '/a.txt')
+        store.record('removed_folder', '/Old')
+        store.close()
+
+        state = SQLiteStateStore(self.db_path).load()
+        self.assertEqual(state['migrated_files'], [])
+        self.assertNotIn('/Old', state['migrated_folders'])
+        self.assertEqual(state['list_cursors'], {':/src': 'cursor123'})
+
+    def test_upload_sessions(self):
+        store = SQLiteStateStore(self.db_path)
+        session = {'uri': 'https://upload/session', 'offset': 1024, 'size': 4096, 'content_hash': 'hash'}
+        store.record('upload_session', '/big.bin', session)
+        store.record('upload_session', '/done.bin', session)
+        store.record('upload_session', '/done.bin', None)
+        store.close()
+
+        self.assertEqual(SQLiteStateStore(self.db_path).load()['upload_sessions'], {'/big.bin': session})
+
+    def test_checksums(self):
+        store = SQLiteStateStore(self.db_path)
+        store.record('checksum', '/a.txt', {'content_hash': 'hash', 'md5': 'md5'})
+        store.close()
+
+        self.assertEqual(SQLiteStateStore(self.db_path).load()['checksums'], {'/a.txt': {'content_hash': 'hash', 'md5': 'md5'}})
+
+    def test_content_files(self):
+        store = SQLiteStateStore(self.db_path)
+        store.record('content_file', 'hash_a', 'file_a')
+        store.record('content_file', 'hash_b', 'file_b')
+        store.record('content_file', 'hash_b', None)
+        store.close()
+
+        self.assertEqual(SQLiteStateStore(self.db_path).load()['content_files'], {'hash_a': 'file_a'})
+
+    def test_uncommitted_events_are_not_persisted(self):
+        store = SQLiteStateStore(self.db_path)
+        store.record('migrated_file', '/a.txt')
+        store.conn.rollback()
+        store.close()
+        self.assertEqual(SQLiteStateStore(self.db_path).load()['migrated_files'], [])
+
+    def test_imports_json_state_once(self):
+        legacy = empty_state()
+        legacy['migrated_files'] = ['/a.txt']
+        legacy['file_ids'] = {'/a.txt': 'file_a'}
+        legacy['migrated_folders']['/Photos'] = 'folder_id'
+        with open(self.json_path, 'w') as f:
+            json.dump(legacy, f)
+
+        store = create_state_store('sqlite', self.json_path)
+        self.assertEqual(store.path, self.db_path)
+        state = store.load()
+        self.assertEqual(state['migrated_files'], ['/a.txt'])
+        self.assertEqual(state['migrated_folders']['/Photos'], 'folder_id')
+        self.assertEqual(state['file_ids'], {'/a.txt': 'file_a'})
+        store.close()
+
+        # Changes to the JSON file after the import are ignored.
+        legacy['migrated_files'].append('/b.txt')
+        with open(self.json_path, 'w') as f:
+            json.dump(legacy, f)
+        self.assertEqual(SQLiteStateStore(self.db_path, json_path=self.json_path).load()['migrated_files'], ['/a.txt'])
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            create_state_store('xml', self.json_path)
+
+class TestJournalStateStore(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'state.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_group_commit(self):
+        store = JournalStateStore(self.path, commit_events=3, commit_interval=3600)
+        state = store.load()
+        store.record('migrated_file', '/a.txt')
+        store.save(state)
+        store.record('migrated_file', '/b.txt')
+        store.save(state)
+        self.assertEqual(os.path.getsize(store.journal_path), 0)
+
+        store.record('migrated_file', '/c.txt')
+        store.save(state)
+        with open(store.journal_path) as f:
+            self.assertEqual(len(f.readlines()), 3)
+        store.close()
+
+    def test_replays_snapshot_and_journal(self):
+        snapshot = empty_state()
+        snapshot['migrated_folders']['/Photos'] = 'folder_id'
+        JsonStateStore(self.path).save(snapshot)
+
+        store = JournalStateStore(self.path, commit_events=1)
+        state = store.load()
+        for event, path, value in (('failed_file', '/a.txt', 'boom'), ('migrated_file', '/a.txt', 'file_a'), ('skipped_file', '/b.txt', None), ('skipped_folder', '/Private', None)):
+            store.record(event, path, value)
+            store.save(state)
+        store.close()
+        with open(store.journal_path, 'a') as f:
+            f.write('["migrated_file", "/torn')
+
+        state = JournalStateStore(self.path).load()
+        self.assertEqual(state['migrated_files'], ['/a.txt'])
+        self.assertEqual(state['failed_files'], [])
+        self.assertEqual(state['skipped_files'], ['/b.txt'])
+        self.assertEqual(state['skipped_folders'], ['/Private'])
+        self.assertEqual(state['migrated_folders']['/Photos'], 'folder_id')
+        self.assertEqual(state['file_ids'], {'/a.txt': 'file_a'})
+
+    def test_events_after_a_torn_line_are_kept(self):
+        store = JournalStateStore(self.path, commit_events=1)
+        state = store.load()
+        store.record('migrated_file', '/a')
+        store.save(state)
+        store.close()
+        with open(store.journal_path, 'a') as f:
+            f.write('["migrated_file", "/torn')
+
+        store = JournalStateStore(self.path, commit_events=1)
+        state = store.load()
+        for path in ('/b', '/c'):
+            store.record('migrated_file', path)
+            store.save(state)
+        store.close()
+
+        self.assertEqual(JournalStateStore(self.path).load()['migrated_files'], ['/a', '/b', '/c'])
+
+    def test_torn_line_of_an_interrupted_compaction_is_dropped(self):
+        with open(self.path + '.journal.compacting', 'w') as f:
+            f.write('["migrated_file", "/a.txt", null]\n["migrated_file", "/to')
+        with open(self.path + '.journal', 'w') as f:
+            f.write('["migrated_file", "/b.txt", null]\n')
+
+        store = JournalStateStore(self.path)
+        store.load()
+        store.close()
+        self.assertEqual(JournalStateStore(self.path).load()['migrated_files'], ['/a.txt', '/b.txt'])
+
+    def test_upload_sessions_are_replayed(self):
+        store = JournalStateStore(self.path, commit_events=1)
+        state = store.load()
+        for offset in (1024, 2048):
+            store.record('upload_session', '/big.bin', {'uri': 'https://upload/session', 'offset': offset})
+            store.save(state)
+        store.record('upload_session', '/done.bin', {'uri': 'https://upload/other', 'offset': 0})
+        store.record('upload_session', '/done.bin', None)
+        store.close()
+
+        self.assertEqual(JournalStateStore(self.path).load()['upload_sessions'], {'/big.bin': {'uri': 'https://upload/session', 'offset': 2048}})
+
+    def test_compaction(self):
+        store = JournalStateStore(self.path, commit_events=1, compact_events=2)
+        state = store.load()
+        for path in ('/a.txt', '/b.txt'):
+            state['migrated_files'].append(path)
+            store.record('migrated_file', path)
+            store.save(state)
+        store.compaction_thread.join()
+        store.record('migrated_file', '/c.txt')
+        store.close()
+
+        self.assertFalse(os.path.exists(store.compacting_path))
+        self.assertEqual(JsonStateStore(self.path).load()['migrated_files'], ['/a.txt', '/b.txt'])
+        self.assertEqual(JournalStateStore(self.path).load()['migrated_files'], ['/a.txt', '/b.txt', '/c.txt'])
+
+    def test_interrupted_compaction_is_replayed(self):
+        with open(self.path + '.journal.compacting', 'w') as f:
+            f.write('["migrated_file", "/a.txt", null]\n')
+        with open(self.path + '.journal', 'w') as f:
+            f.write('["migrated_file", "/b.txt", null]\n')
+
+        store = JournalStateStore(self.path)
+        self.assertEqual(store.load()['migrated_files'], ['/a.txt', '/b.txt'])
+        store.close()
+        self.assertFalse(os.path.exists(store.compacting_path))
+        self.assertEqual(JournalStateStore(self.path).load()['migrated_files'], ['/a.txt', '/b.txt'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+import json
+import logging
+import threading
+from unittest.mock import MagicMock, patch
+from googleapiclient.http import HttpRequest
+from src.stream_transfer import StreamingMediaUpload
+from src.google_drive_client import GoogleDriveClient
+
+CHUNK = 256 * 1024
+
+class RecordingHttp:
+    """Plays back scripted responses and records the requests of an upload."""
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        self.requests.append((method, dict(headers or {}), body))
+        headers, content = self.responses.pop(0)
+        resp = MagicMock(status=int(headers['status']))
+        resp.__getitem__.side_effect = headers.__getitem__
+        resp.__contains__.side_effect = headers.__contains__
+        resp.get.side_effect = headers.get
+        return resp, content.encode()
+
+class TestStreamingMediaUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.data = bytes(range(256)) * 2400
+        self.blocks = [self.data[i:i + 100000] for i in range(0, len(self.data), 100000)]
+
+    def test_serves_chunks_and_keeps_unconfirmed_bytes(self):
+        media = StreamingMediaUpload(iter(self.blocks), len(self.data), chunksize=CHUNK)
+        self.assertEqual(media.getbytes(0, CHUNK), self.data[:CHUNK])
+        # Drive confirmed only part of the chunk; the rest is served again from memory.
+        self.assertEqual(media.getbytes(1000, CHUNK), self.data[1000:1000 + CHUNK])
+        self.assertEqual(media.getbytes(1000 + CHUNK, CHUNK), self.data[1000 + CHUNK:1000 + 2 * CHUNK])
+        with self.assertRaises(IOError):
+            media.getbytes(0, CHUNK)
+        self.assertEqual(media.getbytes(1000 + 2 * CHUNK, CHUNK), self.data[1000 + 2 * CHUNK:])
+        media.close()
+
+    def test_read_ahead_is_bounded(self):
+        consumed = []
+
+        def blocks():
+            for block in self.blocks:
+                consumed.append(block)
+                yield block
+        media = StreamingMediaUpload(blocks(), len(self.data), chunksize=CHUNK, buffer_reads=2)
+        media._reader.join(0.2)
+        # Two reads wait in the queue and a third is blocked putting itself there.
+        self.assertEqual(len(consumed), 3)
+        media.close()
+        self.assertFalse(media._reader.is_alive())
+
+    def test_download_errors_are_raised(self):
+        def blocks():
+            yield self.blocks[0]
+            raise ConnectionError('Dropbox connection lost')
+        media = StreamingMediaUpload(blocks(), len(self.data), chunksize=CHUNK)
+        with self.assertRaises(ConnectionError):
+            media.getbytes(0, CHUNK)
+        media.close()
+
+class TestStreamingUploadToDrive(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    @patch('src.google_drive_client.time.sleep')
+    @patch('src.google_drive_client.build')
+    def test_failed_chunk_is_resent_without_downloading_again(self, mock_build, mock_sleep):
+        data = bytes(range(256)) * 2400
+        downloaded = []
+
+        def blocks():
+            for i in range(0, len(data), 100000):
+                downloaded.append(i)
+                yield data[i:i + 100000]
+
+        http = RecordingHttp([
+            ({'status': '200', 'location': 'https://upload/session'}, ''),
+            ({'status': '308', 'range': 'bytes=0-99999'}, ''),
+            ({'status': '503'}, 'unavailable'),
+            # After the failure the client asks Drive how much of the file it has.
+            ({'status': '308', 'range': 'bytes=0-99999'}, ''),
+            ({'status': '308', 'range': 'bytes=0-%d' % (100000 + CHUNK - 1)}, ''),
+            ({'status': '200'}, json.dumps({'id': 'file_id'})),
+        ])
+        media = StreamingMediaUpload(blocks(), len(data), chunksize=CHUNK)
+        request = HttpRequest(http, lambda resp, content: json.loads(content), 'https://upload/files?uploadType=resumable', method='POST', body='{}', headers={'content-type': 'application/json'}, resumable=media)
+        client = GoogleDriveClient(MagicMock())
+        client.service = MagicMock()
+        client.service.files().create.return_value = request
+        with patch('googleapiclient.http._should_retry_response', return_value=False):
+            file_id = client.upload_media(media, 'big.bin', folder_id='folder_id')
+        media.close()
+
+        self.assertEqual(file_id, 'file_id')
+        client.service.files().create.assert_called_with(body={'name': 'big.bin', 'parents': ['folder_id']}, media_body=media, fields='id')
+        puts = [(headers['Content-Range'], body) for method, headers, body in http.requests if method == 'PUT' and body is not None]
+        self.assertEqual(puts, [
+            ('bytes 0-%d/%d' % (CHUNK - 1, len(data)), data[:CHUNK]),
+            ('bytes 100000-%d/%d' % (100000 + CHUNK - 1, len(data)), data[100000:100000 + CHUNK]),
+            ('bytes 100000-%d/%d' % (100000 + CHUNK - 1, len(data)), data[100000:100000 + CHUNK]),
+            ('bytes %d-%d/%d' % (100000 + CHUNK, len(data) - 1, len(data)), data[100000 + CHUNK:]),
+        ])
+        self.assertEqual(downloaded, list(range(0, len(data), 100000)))
+        mock_sleep.assert_called_once_with(1)
+
+if __name__ == '__main__':
+    unittest.main()
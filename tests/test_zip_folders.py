@@ -0,0 +1,56 @@
+import unittest
+import os
+import zipfile
+import tempfile
+from src.listing import ListingEntry, FILE, FOLDER
+from src.zip_folders import group_zip_folders, iter_zip_members
+
+class TestZipFolders(unittest.TestCase):
+
+    def _files(self, folder, count, size=10):
+        return [ListingEntry(FILE, f"{folder}/file{i}.txt", f"file{i}.txt", size) for i in range(count)]
+
+    def test_groups_leaf_folders_of_small_files(self):
+        tiny = self._files('/tiny', 5)
+        few = self._files('/few', 2)
+        large = self._files('/large', 5, size=10 ** 6)
+        parent = self._files('/parent', 5)
+        child = self._files('/parent/child', 5)
+        root = self._files('', 5)
+
+        files = tiny + few + large + parent + child + root
+        listing = files + [ListingEntry(FOLDER, path, path[1:]) for path in ('/tiny', '/few', '/large', '/parent', '/parent/child')]
+
+        zip_folders, rest = group_zip_folders(files, listing, min_files=5, max_file_size=1000)
+
+        self.assertEqual(zip_folders, {'/tiny': tiny, '/parent/child': child})
+        self.assertCountEqual(rest, few + large + parent + root)
+
+    def test_migrated_contents_count_towards_eligibility(self):
+        with_large = self._files('/with_large', 5)
+        with_subfolder = self._files('/with_subfolder', 5)
+        listing = with_large + with_subfolder + [
+            ListingEntry(FILE, '/with_large/video.mp4', 'video.mp4', 10 ** 6),
+            ListingEntry(FOLDER, '/with_subfolder/Done', 'Done'),
+        ]
+
+        # Only the small files are still pending; the rest was migrated by an earlier run.
+        zip_folders, rest = group_zip_folders(with_large + with_subfolder, listing, min_files=5, max_file_size=1000)
+
+        self.assertEqual(zip_folders, {})
+        self.assertCountEqual(rest, with_large + with_subfolder)
+
+    def test_iterates_archive_members_by_dropbox_path(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            archive_path = os.path.join(tmpdir, 'folder.zip')
+            with zipfile.ZipFile(archive_path, 'w') as archive:
+                archive.writestr('Photos/', '')
+                archive.writestr('Photos/A.txt', b'a')
+                archive.writestr('Photos/sub/b.txt', b'b')
+
+            members = [(path, read()) for path, read in iter_zip_members(archive_path, '/Team/Photos')]
+
+        self.assertEqual(members, [('/team/photos/a.txt', b'a'), ('/team/photos/sub/b.txt', b'b')])
+
+if __name__ == '__main__':
+    unittest.main()